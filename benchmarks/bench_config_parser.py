@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the minidlna.conf parser on generated configurations with thousands of media_dir entries.
+
+Usage: python3 benchmarks/bench_config_parser.py [--sizes 1000,5000,20000] [--repeat 5]
+"""
+
+from typing import List
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minidlnaindicator.minidlnaconfparser import parse_config  # noqa: E402
+
+
+def generate_config(media_dirs: int) -> List[str]:
+    lines = [
+        "# Generated configuration",
+        "port=8245",
+        "db_dir=/home/user/.minidlna/cache",
+        "log_dir=/home/user/.minidlna",
+        "uuid=4d1ed1f0-0d1b-4b5e-9a3c-1a2b3c4d5e6f",
+        "friendly_name=Multimedia for user",
+        "network_interface=eth0,wlan0",
+        "inotify=yes",
+        "notify_interval=895",
+        "max_connections=50",
+        "album_art_names=Cover.jpg/cover.jpg/AlbumArtSmall.jpg/Folder.jpg",
+        "",
+    ]
+    prefixes = ["", "A,", "V,", "P,", "PV,"]
+    for i in range(media_dirs):
+        lines.append("media_dir={prefix}/srv/media/library{i:05d}/collection".format(prefix=prefixes[i % 5], i=i))
+        if i % 100 == 0:
+            lines.append("# Section {i}".format(i=i))
+    return lines
+
+
+def legacy_parse(lines: List[str]) -> int:
+    # Equivalent of the startswith/re.sub chain used before the single pass parser, kept as reference
+    dirs = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#"):
+            continue
+        if line.startswith("port="):
+            int(re.sub(r'^port=', "", line))
+        elif line.startswith("db_dir="):
+            re.sub(r'^db_dir=', "", line)
+        elif line.startswith("log_dir="):
+            re.sub(r'^log_dir=', "", line)
+        elif line.startswith("uuid="):
+            re.sub(r'^uuid=', "", line)
+        elif line.startswith("friendly_name="):
+            re.sub(r'^friendly_name=', "", line)
+        elif line.startswith("media_dir="):
+            line = re.sub(r'^media_dir=', '', line)
+            for prefix in ("A,", "P,", "V,", "PV,"):
+                if line.startswith(prefix):
+                    line = re.sub(r'^' + prefix, '', line)
+                    break
+            dirs.append(line)
+    return len(dirs)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,5000,20000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:>8} {:>14} {:>14} {:>8}".format("dirs", "parser (ms)", "legacy (ms)", "speedup"))
+    for size in [int(x) for x in args.sizes.split(",")]:
+        lines = generate_config(size)
+        assert len(parse_config(lines).dirs) == size
+        parser_time = min(timeit.repeat(lambda: parse_config(lines), number=1, repeat=args.repeat))
+        legacy_time = min(timeit.repeat(lambda: legacy_parse(lines), number=1, repeat=args.repeat))
+        print("{:>8} {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+            size, parser_time * 1000, legacy_time * 1000, legacy_time / parser_time
+        ))
+
+
+if __name__ == "__main__":
+    main()
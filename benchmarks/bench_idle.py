@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Idle cost of the background work: starts the FS monitor, the config watcher, the log follower, the library stats
+monitor, the update checker and a supervised child process, like the indicator does, lets the GLib main loop run for
+some seconds without any activity, and reports the threads of the process and the wakeups (context switches of all
+its threads) during that time.
+
+Run on a tree where the monitors are still threads (FSMonitorThread and friends), the same script starts those
+instead, to compare before and after.
+
+Usage: python3 benchmarks/bench_idle.py [--seconds 30]
+"""
+
+from typing import Tuple
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gi.repository import GLib  # noqa: E402
+
+from minidlnaindicator import configwatcher, dbstats, fsmonitor, logfollower, update_check_thread  # noqa: E402
+from minidlnaindicator.minidlnaconfig import MiniDLNAConfig  # noqa: E402
+from minidlnaindicator.processrunner import ProcessRunner  # noqa: E402
+
+
+def get_threads_and_wakeups() -> Tuple[int, int]:
+    tasks = os.listdir("/proc/self/task")
+    wakeups = 0
+    for task in tasks:
+        try:
+            with open("/proc/self/task/{task}/status".format(task=task), "r") as fp:
+                for line in fp:
+                    if line.startswith(("voluntary_ctxt_switches:", "nonvoluntary_ctxt_switches:")):
+                        wakeups += int(line.split()[1])
+        except OSError:
+            continue
+    return len(tasks), wakeups
+
+
+def start_monitors(work_dir: str) -> list:
+
+    minidlna_config = MiniDLNAConfig(
+        None, os.path.join(work_dir, "minidlna.conf"), config_dir=work_dir, cache_dir=os.path.join(work_dir, "cache"),
+        profile_name="bench"
+    )
+    reader = dbstats.LibraryStatsReader(dbstats.get_db_path(os.path.join(work_dir, "cache")))
+    update_config = update_check_thread.UpdateCheckConfig()
+
+    if hasattr(fsmonitor, "FSMonitorThread"):
+        monitors = [
+            fsmonitor.FSMonitorThread(),
+            configwatcher.ConfigWatcherThread(minidlna_config),
+            logfollower.LogFollowerThread(minidlna_config.log),
+            dbstats.LibraryStatsThread(reader, lambda stats: None),
+            update_check_thread.UpdateCheckThread(update_config, "minidlnaindicator", "0", ""),
+        ]
+    else:
+        monitors = [
+            fsmonitor.FSMonitor(),
+            configwatcher.ConfigWatcher(minidlna_config),
+            logfollower.LogFollower(minidlna_config.log),
+            dbstats.LibraryStatsMonitor(reader, lambda stats: None),
+            update_check_thread.UpdateChecker(update_config, "minidlnaindicator", "0", ""),
+        ]
+
+    for monitor in monitors:
+        # The library stats monitor has nothing to do until minidlnad runs, so it isn't started
+        if hasattr(monitor, "start"):
+            monitor.start()
+    return monitors
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+
+        threads_before, _wakeups = get_threads_and_wakeups()
+        monitors = start_monitors(work_dir)
+        runner = ProcessRunner()
+        runner.start(["sleep", str(args.seconds + 60)])
+
+        mainloop = GLib.MainLoop()
+        measures = {}
+
+        def on_settled() -> bool:
+            # Let everything start before measuring
+            measures["start"] = get_threads_and_wakeups()
+            GLib.timeout_add_seconds(args.seconds, on_finished)
+            return False
+
+        def on_finished() -> bool:
+            measures["end"] = get_threads_and_wakeups()
+            mainloop.quit()
+            return False
+
+        GLib.timeout_add_seconds(2, on_settled)
+        mainloop.run()
+
+        runner.stop()
+        for monitor in monitors:
+            monitor.stop()
+
+    threads, start_wakeups = measures["start"]
+    _threads, end_wakeups = measures["end"]
+    wakeups = end_wakeups - start_wakeups
+    print("Threads: {before} before starting, {after} while idle".format(before=threads_before, after=threads))
+    print("Wakeups: {wakeups} in {seconds} seconds ({rate:.2f}/s)".format(
+        wakeups=wakeups, seconds=args.seconds, rate=wakeups / args.seconds
+    ))
+
+
+if __name__ == "__main__":
+    main()
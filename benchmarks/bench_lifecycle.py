@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+End to end latency of the lifecycle of minidlnad, as the headless supervisor drives it (HeadlessSupervisor, with its
+ProcessRunner, ProcessSupervisor and RestartWatchdog on the GLib main loop), against fake_minidlnad.py, so MiniDLNA is
+not needed (PyGObject is). Measures, repeating every scenario and reporting the median and the 95th percentile in
+milliseconds:
+
+    start_spawn         start_minidlna() until the process has been spawned
+    start_ready         start_minidlna() until its web server answers
+    stop                stop_minidlna() of a process that exits on SIGTERM, until it calls back
+    stop_slow           the same, when the process takes --shutdown-delay seconds to exit
+    stop_kill           the same, when the process ignores SIGTERM and is killed after --grace-period seconds
+    restart             restart_minidlna() until the web server answers again
+    crash_detect        exit of a crashing process until on_process_finished
+    crash_backoff       on_process_finished of the crash until the watchdog starts the process again (the backoff of
+                        a first failure is between the half and the whole of a second)
+    crash_restart       exit of a crashing process until the restarted one answers
+    orphan_recovery     start_minidlna() with an orphan instance holding the port, until the new one answers: the
+                        failed start, killing the orphan, the backoff of the watchdog and the second start
+    start_ready_chatty  start_ready, with a process printing --chatty lines per second
+
+Exits with status 1 if the median of a scenario is over its budget (--budget name=milliseconds; can be repeated).
+
+Usage: python3 benchmarks/bench_lifecycle.py [--repeat 5] [--budget start_ready=500] [--output results.json]
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# The supervisor keeps its files in ~/.minidlna; a temporary home keeps the real ones out of the benchmark
+WORK_DIR = tempfile.mkdtemp(prefix="minidlnaindicator-lifecycle-")
+os.environ["HOME"] = WORK_DIR
+
+from gi.repository import GLib  # noqa: E402
+
+from minidlnaindicator.constants import MINIDLNA_CONFIG_DIR, MINIDLNA_CONFIG_FILE, MINIDLNA_INDICATOR_CONFIG  # noqa: E402
+from minidlnaindicator.headless import HeadlessSupervisor  # noqa: E402
+from minidlnaindicator.healthcheck import HealthClient  # noqa: E402
+from minidlnaindicator.indicatorconfig import MiniDLNAIndicatorConfig  # noqa: E402
+from minidlnaindicator.processlistener import ProcessListener  # noqa: E402
+
+FAKE_MINIDLNAD = os.path.join(BASE_DIR, "benchmarks", "fake_minidlnad.py")
+
+# Generous, to catch big regressions (like a lost wakeup waiting for a timeout) on slow machines
+DEFAULT_BUDGETS_MS = {
+    "start_spawn": 100,
+    "start_ready": 1000,
+    "stop": 500,
+    "stop_kill": 1500,
+    "restart": 1500,
+    "crash_detect": 100,
+    "crash_backoff": 1100,
+    "crash_restart": 2000,
+    "orphan_recovery": 4000,
+}
+
+POLL_INTERVAL = 0.002
+
+TIMEOUT = 15.0
+
+
+class LifecycleRecorder(ProcessListener):
+
+    def __init__(self) -> None:
+        self.starting_at = None  # type: Optional[float]
+        self.started_at = None  # type: Optional[float]
+        self.finished_at = None  # type: Optional[float]
+        self.exit_code = None  # type: Optional[int]
+        self.std_out = None  # type: Optional[str]
+
+    def on_process_starting(self) -> None:
+        self.starting_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.std_out = None
+
+    def on_process_started(self, pid: int) -> None:
+        self.started_at = time.monotonic()
+
+    def on_process_output_matched(self, matcher: str, line: str) -> None:
+        pass
+
+    def on_process_finished(self, command: str, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str]) -> None:
+        self.finished_at = time.monotonic()
+        self.exit_code = exit_code
+        self.std_out = std_out
+
+    def on_process_error(self, reason: str) -> None:
+        raise RuntimeError(reason)
+
+
+class Lifecycle(object):
+    """
+    A headless supervisor running the fake minidlnad, with its own configuration and free port.
+    """
+
+    def __init__(self, grace_period: float) -> None:
+
+        self.port = get_free_port()
+        os.makedirs(MINIDLNA_CONFIG_DIR, exist_ok=True)
+        with open(MINIDLNA_CONFIG_FILE, "w", encoding="utf-8") as fp:
+            fp.write("port={port}\nlog_dir={dir}\ndb_dir={dir}/cache\nmedia_dir=V,{dir}\n".format(
+                port=self.port, dir=MINIDLNA_CONFIG_DIR
+            ))
+        with open(MINIDLNA_INDICATOR_CONFIG, "w", encoding="utf-8") as fp:
+            json.dump({"stop_grace_period": grace_period, "log_level": "error"}, fp)
+
+        self.context = GLib.MainContext.default()
+        self.supervisor = HeadlessSupervisor(MiniDLNAIndicatorConfig(MINIDLNA_INDICATOR_CONFIG))
+        self.supervisor.minidlna_path = FAKE_MINIDLNAD
+        self.recorder = LifecycleRecorder()
+        self.supervisor.runner.add_listener(self.recorder)
+        self.client = HealthClient(self.port, timeout=0.5)
+        self.stopped_at = None  # type: Optional[float]
+
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float=TIMEOUT) -> None:
+        """
+        Runs the main loop (so the output is read, the exits are noticed and the timeouts fire) until the condition is
+        true.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            while self.context.pending():
+                self.context.iteration(False)
+            if condition():
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError("Timed out waiting for the fake minidlnad.")
+            time.sleep(POLL_INTERVAL)
+
+
+    def is_ready(self) -> bool:
+        result = self.client.check()
+        self.client.close()
+        return result.ok
+
+
+    def is_started(self) -> bool:
+        return self.recorder.started_at is not None
+
+
+    def is_ready_since(self, since: float) -> bool:
+        """
+        Returns if a process started after since answers.
+        """
+        return self.recorder.started_at is not None and self.recorder.started_at > since and self.is_ready()
+
+
+    def is_finished(self) -> bool:
+        return self.recorder.finished_at is not None
+
+
+    def is_stopped(self) -> bool:
+        return self.stopped_at is not None
+
+
+    def on_stopped(self) -> None:
+        self.stopped_at = time.monotonic()
+
+
+    def start(self) -> float:
+        start = time.monotonic()
+        self.supervisor.start_minidlna()
+        return start
+
+
+    def start_until_ready(self) -> float:
+        start = self.start()
+        self.wait_for(self.is_ready)
+        return time.monotonic() - start
+
+
+    def stop(self) -> float:
+        self.stopped_at = None
+        start = time.monotonic()
+        self.supervisor.stop_minidlna(self.on_stopped)
+        self.wait_for(self.is_stopped)
+        return self.stopped_at - start
+
+
+    def spawn_orphan(self) -> subprocess.Popen:
+        # In its own session, like an instance left behind by a crashed indicator
+        orphan = subprocess.Popen(
+            self.supervisor.get_minidlna_command(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        self.wait_for(self.is_ready)
+        return orphan
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def set_fake_env(**values: object) -> None:
+    for name in list(os.environ):
+        if name.startswith("FAKE_"):
+            del os.environ[name]
+    for name, value in values.items():
+        os.environ["FAKE_" + name.upper()] = str(value)
+
+
+def run_scenarios(lifecycle: Lifecycle, args: argparse.Namespace) -> Dict[str, float]:
+    """
+    Runs every scenario once; returns the seconds taken by each one.
+    """
+
+    times = {}  # type: Dict[str, float]
+    supervisor = lifecycle.supervisor
+    # Every failure below is the first one, with the shortest backoff
+    supervisor.watchdog.reset()
+
+    set_fake_env()
+    start = lifecycle.start()
+    lifecycle.wait_for(lifecycle.is_started)
+    times["start_spawn"] = lifecycle.recorder.started_at - start
+    lifecycle.wait_for(lifecycle.is_ready)
+    times["start_ready"] = time.monotonic() - start
+    times["stop"] = lifecycle.stop()
+
+    lifecycle.start_until_ready()
+    start = time.monotonic()
+    supervisor.restart_minidlna()
+    lifecycle.wait_for(lambda: lifecycle.is_ready_since(start))
+    times["restart"] = time.monotonic() - start
+    lifecycle.stop()
+
+    set_fake_env(shutdown_delay=args.shutdown_delay)
+    lifecycle.start_until_ready()
+    times["stop_slow"] = lifecycle.stop()
+
+    set_fake_env(ignore_sigterm=1)
+    lifecycle.start_until_ready()
+    times["stop_kill"] = lifecycle.stop()
+
+    set_fake_env(crash_after=0.1)
+    lifecycle.start()
+    lifecycle.wait_for(lifecycle.is_started)
+    # Only the first instance crashes; the one started by the watchdog doesn't
+    set_fake_env()
+    lifecycle.wait_for(lifecycle.is_finished)
+    # The fake prints the monotonic time of its exit
+    exited_at = float(lifecycle.recorder.std_out.strip().splitlines()[-1].split()[-1])
+    finished_at = lifecycle.recorder.finished_at
+    times["crash_detect"] = finished_at - exited_at
+    lifecycle.wait_for(lambda: lifecycle.is_ready_since(finished_at))
+    times["crash_backoff"] = lifecycle.recorder.starting_at - finished_at
+    times["crash_restart"] = time.monotonic() - exited_at
+    lifecycle.stop()
+    supervisor.watchdog.reset()
+
+    orphan = lifecycle.spawn_orphan()
+    try:
+        start = lifecycle.start()
+        # The failed start, the orphan killed in a worker thread, and the restart by the watchdog
+        lifecycle.wait_for(lambda: orphan.poll() is not None and lifecycle.is_ready_since(start))
+        failures = supervisor.watchdog.status.failures
+        if not failures or "in use" not in failures[-1].reason:
+            raise RuntimeError("The bind error of the fake minidlnad has not been detected.")
+        times["orphan_recovery"] = time.monotonic() - start
+        lifecycle.stop()
+    finally:
+        if orphan.poll() is None:
+            orphan.kill()
+        orphan.wait()
+    supervisor.watchdog.reset()
+
+    set_fake_env(chatty=args.chatty)
+    times["start_ready_chatty"] = lifecycle.start_until_ready()
+    lifecycle.stop()
+
+    return times
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--grace-period", type=float, default=0.5, help="seconds before killing with SIGKILL")
+    parser.add_argument("--shutdown-delay", type=float, default=0.2)
+    parser.add_argument("--chatty", type=float, default=2000, help="lines per second printed in start_ready_chatty")
+    parser.add_argument("--budget", action="append", default=[], metavar="NAME=MS", help="maximum median of a scenario")
+    parser.add_argument("--output", help="save the results in this JSON file")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for budget in args.budget:
+        name, _sep, value = budget.partition("=")
+        budgets[name] = float(value)
+
+    samples = {}  # type: Dict[str, List[float]]
+    try:
+        lifecycle = Lifecycle(args.grace_period)
+        try:
+            for _i in range(args.repeat):
+                for name, seconds in run_scenarios(lifecycle, args).items():
+                    samples.setdefault(name, []).append(seconds * 1000)
+        finally:
+            lifecycle.supervisor.quit()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    results = {}  # type: Dict[str, Dict[str, float]]
+    over_budget = []  # type: List[str]
+    print("{:<20} {:>12} {:>12} {:>12}".format("scenario", "median (ms)", "p95 (ms)", "budget (ms)"))
+    for name, values in samples.items():
+        values.sort()
+        result = results[name] = {
+            "median_ms": statistics.median(values),
+            "p95_ms": values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+            "max_ms": values[-1],
+        }
+        budget = budgets.get(name)
+        exceeded = budget is not None and result["median_ms"] > budget
+        if exceeded:
+            over_budget.append(name)
+        print("{:<20} {:>12.1f} {:>12.1f} {:>12}{}".format(
+            name, result["median_ms"], result["p95_ms"], "-" if budget is None else "{:.0f}".format(budget),
+            " OVER BUDGET" if exceeded else ""
+        ))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump({
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "repeat": args.repeat,
+                "grace_period": args.grace_period,
+                "results": results,
+            }, fp, indent=4, sort_keys=True)
+
+    if over_budget:
+        print("{count} scenarios over their budget: {names}".format(count=len(over_budget), names=", ".join(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Headless benchmark of the menu reconciliation: builds the rows of the indicator (build_menu_rows) for a state with N
+media directories, and applies them to a backend that only counts operations.
+
+A reconciliation without changes must do no backend operations, whatever the number of directories.
+
+Usage: python3 benchmarks/bench_menu.py [--sizes 10,100,1000] [--repeat 20]
+"""
+
+from typing import Any, List
+
+import argparse
+import collections
+import os
+import sys
+import timeit
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minidlnaindicator.dirprobe import ProbeStatus  # noqa: E402
+from minidlnaindicator.healthcheck import HealthSnapshot, HealthStatus, STOPPED_HEALTH  # noqa: E402
+from minidlnaindicator.indicatorstate import IndicatorState, RunnerPhase  # noqa: E402
+from minidlnaindicator.librarystats import EMPTY_STATS  # noqa: E402
+from minidlnaindicator.menumodel import MenuModel, MenuBackend, MenuRow  # noqa: E402
+from minidlnaindicator.menurows import build_menu_rows  # noqa: E402
+from minidlnaindicator.minidlnaconfig import EMPTY_SNAPSHOT  # noqa: E402
+from minidlnaindicator.minidlnaconfparser import MiniDLNADirectory, MiniDLNAMediaType  # noqa: E402
+from minidlnaindicator.watchdogstatus import CircuitState, WatchdogStatus  # noqa: E402
+
+
+class CountingBackend(MenuBackend):
+
+    def __init__(self) -> None:
+        self.operations = collections.Counter()  # type: collections.Counter
+        self.widgets = []  # type: List[Any]
+
+    def create(self, row: MenuRow) -> Any:
+        self.operations["create"] += 1
+        return object()
+
+    def update(self, widget: Any, old_row: MenuRow, new_row: MenuRow) -> None:
+        self.operations["update"] += 1
+
+    def insert(self, widget: Any, position: int) -> None:
+        self.operations["insert"] += 1
+        self.widgets.insert(position, widget)
+
+    def move(self, widget: Any, position: int) -> None:
+        self.operations["move"] += 1
+        self.widgets.remove(widget)
+        self.widgets.insert(position, widget)
+
+    def remove(self, widget: Any) -> None:
+        self.operations["remove"] += 1
+        self.widgets.remove(widget)
+
+
+def build_state(dirs: int, running: bool, inaccessible: int=-1) -> IndicatorState:
+    paths = ["/srv/media/library{i:05d}".format(i=i) for i in range(dirs)]
+    return IndicatorState(
+        phase=RunnerPhase.RUNNING if running else RunnerPhase.STOPPED,
+        pid=1000 if running else 0,
+        minidlna_path="/usr/sbin/minidlnad",
+        update_available=None,
+        mounts=(),
+        config=EMPTY_SNAPSHOT._replace(port=8200, dirs=tuple(MiniDLNADirectory(x, MiniDLNAMediaType.MIXED) for x in paths)),
+        dir_status=types.MappingProxyType({
+            x: ProbeStatus.INACCESSIBLE if i == inaccessible else ProbeStatus.ACCESSIBLE for i, x in enumerate(paths)
+        }),
+        scanning=None,
+        scanned_files=None,
+        file_errors=0,
+        clients=frozenset(),
+        library=EMPTY_STATS,
+        start_plan=None,
+        profiles=(),
+        started_at=None,
+        start_count=1 if running else 0,
+        last_exit_code=None,
+        resources=(),
+        watchdog=WatchdogStatus(CircuitState.CLOSED, 0, (), False),
+        health=HealthSnapshot(HealthStatus.READY, 0.5, 0.002, 0.005, 0) if running else STOPPED_HEALTH,
+    )
+
+
+def build_rows(state: IndicatorState) -> List[MenuRow]:
+    # The same rows as the indicator
+    return build_menu_rows(state, True, False)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print("{:>6} {:>16} {:>16} {:>16} {:>12}".format("dirs", "initial (ms)", "unchanged (ms)", "one change (ms)", "unchanged ops"))
+    for size in [int(x) for x in args.sizes.split(",")]:
+
+        state = build_state(size, False)
+        changed_state = build_state(size, False, inaccessible=size // 2)
+
+        def initial() -> None:
+            MenuModel(CountingBackend()).reconcile(build_rows(state))
+
+        backend = CountingBackend()
+        model = MenuModel(backend)
+        model.reconcile(build_rows(state))
+        unchanged_rows = build_rows(state)
+        changed_rows = build_rows(changed_state)
+
+        backend.operations.clear()
+        unchanged_ops = model.reconcile(unchanged_rows)
+        assert unchanged_ops == 0 and not backend.operations
+
+        def one_change() -> None:
+            model.reconcile(changed_rows)
+            model.reconcile(unchanged_rows)
+
+        initial_time = min(timeit.repeat(initial, number=1, repeat=args.repeat))
+        unchanged_time = min(timeit.repeat(lambda: model.reconcile(unchanged_rows), number=1, repeat=args.repeat))
+        change_time = min(timeit.repeat(one_change, number=1, repeat=args.repeat)) / 2
+        print("{:>6} {:>16.3f} {:>16.3f} {:>16.3f} {:>12}".format(
+            size, initial_time * 1000, unchanged_time * 1000, change_time * 1000, unchanged_ops
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: the import time of the entry point modules, broken down by the top level packages they load
+(measured in fresh interpreters with "python -X importtime"), the peak memory after importing them, and optionally the time from launching the indicator
+until its icon is set (needs a graphical session and a D-Bus session bus, and the indicator must not be running).
+
+Exits with status 1 if the median import time or the time to icon go over their budgets, so it can be used to catch
+regressions.
+
+Usage: python3 benchmarks/bench_startup.py [--repeat 5] [--budget-ms 400] [--icon] [--icon-budget-ms 1500]
+       python3 benchmarks/bench_startup.py --modules minidlnaindicator.headless
+"""
+
+from typing import Dict, List, Tuple
+
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_MODULES = ["minidlnaindicator.runner", "minidlnaindicator.indicator"]
+
+# Runs the indicator and prints a line as soon as the icon is set
+ICON_PROBE = """
+import os, sys
+from gi.repository import AppIndicator3
+set_status = AppIndicator3.Indicator.set_status
+def probe(self, status):
+    set_status(self, status)
+    print("icon", flush=True)
+    os._exit(0)
+AppIndicator3.Indicator.set_status = probe
+from minidlnaindicator.runner import indicator
+sys.argv = ["minidlnaindicator", "--test-mode"]
+indicator()
+"""
+
+
+def run_importtime(code: str) -> List[Tuple[str, bool, float, float]]:
+    """
+    Runs the code in a new interpreter and returns every module imported: its name, if it was imported directly by
+    the code (not by another module), and its own and cumulative milliseconds.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+
+    imports = []  # type: List[Tuple[str, bool, float, float]]
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        # The name is indented two more spaces for each level of nesting
+        imports.append((name.strip(), not name.startswith("  "), int(self_time) / 1000.0, int(cumulative) / 1000.0))
+    return imports
+
+
+def measure_imports(modules: List[str]) -> Tuple[float, Dict[str, float]]:
+    """
+    Imports the modules in a new interpreter and returns the total milliseconds and the milliseconds spent in every
+    top level package (the own time of all its modules).
+    """
+
+    # The modules loaded by the interpreter itself before running the code
+    startup = set(x[0] for x in run_importtime("pass"))
+
+    total = 0.0
+    packages = collections.Counter()  # type: Dict[str, float]
+    for name, direct, self_time, cumulative in run_importtime("; ".join("import " + x for x in modules)):
+        if name in startup:
+            continue
+        if direct:
+            total += cumulative
+        packages[name.split(".")[0]] += self_time
+
+    return total, packages
+
+
+def measure_rss(modules: List[str]) -> float:
+    """
+    Imports the modules in a new interpreter and returns its peak resident memory in MiB.
+    """
+    code = "; ".join(["import " + x for x in modules] + [
+        "import resource", "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    ])
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BASE_DIR, stdout=subprocess.PIPE, universal_newlines=True, check=True
+    ).stdout
+    # In KiB on Linux
+    return int(output.split()[-1]) / 1024.0
+
+
+def measure_icon(timeout: float) -> float:
+    """
+    Returns the milliseconds from launching the indicator until its icon is set.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", ICON_PROBE], cwd=BASE_DIR, stdout=subprocess.PIPE, universal_newlines=True
+    )
+    try:
+        line = process.stdout.readline()
+        elapsed = (time.perf_counter() - start) * 1000
+        process.wait(timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    if line.strip() != "icon":
+        raise RuntimeError("The indicator exited without setting the icon (exit code {code})".format(code=process.returncode))
+    return elapsed
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(ENTRY_MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=400.0)
+    parser.add_argument("--icon", action="store_true", help="measure the time until the icon is set too")
+    parser.add_argument("--icon-budget-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    modules = args.modules.split(",")
+    totals = []  # type: List[float]
+    by_package = collections.defaultdict(list)  # type: Dict[str, List[float]]
+    for _ in range(args.repeat):
+        total, packages = measure_imports(modules)
+        totals.append(total)
+        for name, elapsed in packages.items():
+            by_package[name].append(elapsed)
+
+    import_time = statistics.median(totals)
+    print("Import time of {modules}: {median:.1f} ms (median of {repeat}, min {min:.1f} ms)".format(
+        modules=", ".join(modules), median=import_time, repeat=args.repeat, min=min(totals)
+    ))
+    breakdown = sorted(((statistics.median(x), y) for y, x in by_package.items()), reverse=True)
+    for elapsed, name in breakdown[:args.top]:
+        print("{elapsed:>10.1f} ms  {name}".format(elapsed=elapsed, name=name))
+
+    print("Peak memory after importing: {rss:.1f} MiB".format(rss=measure_rss(modules)))
+
+    failed = False
+    if import_time > args.budget_ms:
+        print("Import time over budget ({budget:.0f} ms)".format(budget=args.budget_ms))
+        failed = True
+
+    if args.icon:
+        icon_times = [measure_icon(30) for _ in range(args.repeat)]
+        icon_time = statistics.median(icon_times)
+        print("Time to icon: {median:.1f} ms (median of {repeat}, min {min:.1f} ms)".format(
+            median=icon_time, repeat=args.repeat, min=min(icon_times)
+        ))
+        if icon_time > args.icon_budget_ms:
+            print("Time to icon over budget ({budget:.0f} ms)".format(budget=args.icon_budget_ms))
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Checks the D-Bus interface of the indicator (StatusInterface) on a private bus: starts its own dbus-daemon, exports
+the interface backed by a stub store, calls GetStatus and GetDirectories from another connection and counts the
+StateChanged signals, which must be emitted once per change of the status and not when only the uptime changes.
+Exits with status 1 if any check fails.
+
+Needs dbus-daemon and dbus-python, but neither Gtk nor a desktop session.
+
+Usage: python3 benchmarks/check_statusinterface.py
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbus  # noqa: E402
+import dbus.bus  # noqa: E402
+import dbus.service  # noqa: E402
+from dbus.mainloop.glib import DBusGMainLoop  # noqa: E402
+from gi.repository import GLib  # noqa: E402
+
+from bench_menu import build_state  # noqa: E402
+from minidlnaindicator.constants import APP_DBUS_DOMAIN, APP_DBUS_INTERFACE, APP_DBUS_PATH  # noqa: E402
+from minidlnaindicator.indicatorstate import IndicatorState  # noqa: E402
+from minidlnaindicator.statusinterface import StatusInterface  # noqa: E402
+
+TIMEOUT = 5.0
+
+
+class StubStore(object):
+    """
+    Just the state, like StateStore without listeners.
+    """
+
+    def __init__(self, state: IndicatorState) -> None:
+        self.state = state
+
+
+class StubHealthProbe(object):
+
+    def __init__(self) -> None:
+        self.histograms = {}  # type: Dict[str, Any]
+
+
+class StubStatus(StatusInterface):
+    """
+    The interface as the indicator exports it, with the state set by the checks.
+    """
+
+    def __init__(self, bus: dbus.bus.BusConnection, state: IndicatorState) -> None:
+        self.store = StubStore(state)
+        self.health_probe = StubHealthProbe()
+        bus_name = dbus.service.BusName(APP_DBUS_DOMAIN, bus)
+        dbus.service.Object.__init__(self, conn=bus, object_path=APP_DBUS_PATH, bus_name=bus_name)
+
+
+    def set_state(self, state: IndicatorState) -> None:
+        self.store.state = state
+        self.notify_state_changed(state)
+
+
+class Client(object):
+    """
+    A monitoring script: calls the methods and collects the signals from its own connection. The calls are
+    asynchronous, as the interface is served by the same main loop.
+    """
+
+    def __init__(self, address: str) -> None:
+        self.bus = dbus.bus.BusConnection(address, mainloop=DBusGMainLoop())
+        self.interface = dbus.Interface(self.bus.get_object(APP_DBUS_DOMAIN, APP_DBUS_PATH), APP_DBUS_INTERFACE)
+        self.signals = []  # type: List[Dict[str, Any]]
+        self.bus.add_signal_receiver(self.signals.append, "StateChanged", APP_DBUS_INTERFACE, path=APP_DBUS_PATH)
+
+
+    def call(self, method: str) -> Any:
+
+        replies = []  # type: List[Any]
+        errors = []  # type: List[Exception]
+        getattr(self.interface, method)(reply_handler=replies.append, error_handler=errors.append)
+        wait_for(lambda: bool(replies or errors))
+        if errors:
+            raise errors[0]
+        return replies[0]
+
+
+    def count_signals(self) -> int:
+        # The bus keeps the order of the messages of a connection, so once this reply arrives, the signals emitted
+        # before it have arrived too
+        self.call("GetStatus")
+        return len(self.signals)
+
+
+def wait_for(condition: Callable[[], bool], timeout: float=TIMEOUT) -> None:
+    context = GLib.MainContext.default()
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("No answer on the bus in {timeout} seconds".format(timeout=timeout))
+        context.iteration(False)
+        time.sleep(0.001)
+
+
+def start_bus() -> subprocess.Popen:
+    return subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address"], stdout=subprocess.PIPE, universal_newlines=True
+    )
+
+
+def run_checks(address: str) -> List[str]:
+    """
+    Returns the failed checks.
+    """
+
+    failures = []  # type: List[str]
+
+    def check(name: str, ok: bool, detail: Optional[object]=None) -> None:
+        print("{:<48} {}".format(name, "ok" if ok else "FAILED ({detail})".format(detail=detail)))
+        if not ok:
+            failures.append(name)
+
+    running = build_state(3, True, inaccessible=1)._replace(started_at=time.monotonic() - 60)
+    service = StubStatus(dbus.bus.BusConnection(address, mainloop=DBusGMainLoop()), running)
+    client = Client(address)
+
+    status = client.call("GetStatus")
+    check("GetStatus phase", status.get("phase") == "running", status.get("phase"))
+    check("GetStatus port", status.get("port") == 8200, status.get("port"))
+    check("GetStatus uptime", status.get("uptime", 0) >= 60, status.get("uptime"))
+
+    directories = [tuple(x) for x in client.call("GetDirectories")]
+    expected = [
+        ("/srv/media/library00000", "mixed", "accessible"),
+        ("/srv/media/library00001", "mixed", "inaccessible"),
+        ("/srv/media/library00002", "mixed", "accessible"),
+    ]
+    check("GetDirectories", directories == expected, directories)
+
+    service.set_state(running)
+    check("StateChanged on the first status", client.count_signals() == 1, client.count_signals())
+
+    # The uptime grows on every render, but that isn't a change
+    time.sleep(0.01)
+    service.set_state(running)
+    check("No StateChanged for the uptime", client.count_signals() == 1, client.count_signals())
+
+    service.set_state(running._replace(file_errors=2))
+    check("StateChanged once per change", client.count_signals() == 2, client.count_signals())
+    check("StateChanged carries the status", client.signals[-1].get("file_errors") == 2, client.signals[-1])
+
+    service.set_state(running._replace(file_errors=2))
+    check("No StateChanged without changes", client.count_signals() == 2, client.count_signals())
+
+    service.set_state(build_state(3, False))
+    check("StateChanged on stop", client.count_signals() == 3, client.count_signals())
+    check("No uptime while stopped", "uptime" not in client.signals[-1], client.signals[-1])
+
+    return failures
+
+
+def main() -> None:
+
+    try:
+        daemon = start_bus()
+    except OSError as ex:
+        print("Couldn't start dbus-daemon: {error}".format(error=ex))
+        sys.exit(1)
+
+    try:
+        address = daemon.stdout.readline().strip()
+        if not address:
+            print("dbus-daemon didn't print its address")
+            sys.exit(1)
+        failures = run_checks(address)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    if failures:
+        print("{count} checks failed: {names}".format(count=len(failures), names=", ".join(failures)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
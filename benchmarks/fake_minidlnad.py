@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Stand-in for minidlnad, to exercise the process supervision without MiniDLNA installed. Accepts the command line
+used by the indicator (-f config, -P pid file, -S, -R, -r, -d, -V), serves / and /rootDesc.xml on the port of the
+configuration (8200 by default) and writes a log like minidlnad in its log_dir. Fails like minidlnad, with
+"error: bind(http): Address already in use", when the port is used, for example by another (orphan) instance.
+
+Its behaviour is scripted with environment variables (seconds may be fractional):
+
+    FAKE_STARTUP_DELAY      seconds before listening on the port
+    FAKE_SHUTDOWN_DELAY     seconds between SIGTERM (or SIGINT) and the exit
+    FAKE_IGNORE_SIGTERM     if 1, SIGTERM and SIGINT are ignored, so only SIGKILL stops it
+    FAKE_CRASH_AFTER        seconds after listening before crashing
+    FAKE_CRASH_CODE         exit code of the crash (1 by default); negative to kill itself with that signal
+    FAKE_HANG_AFTER         seconds after listening before the web server stops answering (the process goes on)
+    FAKE_CHATTY             lines per second printed to the standard output
+    FAKE_SCAN_SECONDS       seconds the simulated scan takes (with -R or -r, or without database)
+
+Before exiting, it prints "fake_minidlnad exiting at <CLOCK_MONOTONIC seconds>", so the time the supervisor takes to
+notice the exit can be measured.
+
+Usage: python3 benchmarks/fake_minidlnad.py -f minidlna.conf -P /dev/null -S [-R]
+"""
+
+from typing import Dict, Optional
+
+import argparse
+import http.server
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+VERSION = "1.3.3"
+
+ROOT_DESC = """<?xml version="1.0"?>
+<root xmlns="urn:schemas-upnp-org:device-1-0">
+<specVersion><major>1</major><minor>0</minor></specVersion>
+<device>
+<deviceType>urn:schemas-upnp-org:device:MediaServer:1</deviceType>
+<friendlyName>{friendly_name}</friendlyName>
+<manufacturer>fake_minidlnad</manufacturer>
+<modelName>Windows Media Connect compatible (MiniDLNA)</modelName>
+<modelNumber>{version}</modelNumber>
+<UDN>uuid:{uuid}</UDN>
+</device>
+</root>
+"""
+
+STATUS_PAGE = """<HTML><HEAD><TITLE>MiniDLNA {version}</TITLE></HEAD><BODY>
+<div style="background-color: white; padding: 20px;"><h2>MiniDLNA status</h2>
+<h3>Media library</h3><table border=1 cellpadding=10><tr><td>Audio files</td><td>0</td></tr>
+<tr><td>Video files</td><td>0</td></tr><tr><td>Image files</td><td>0</td></tr></table>
+</div></BODY></HTML>
+"""
+
+
+def read_config(path: str) -> Dict[str, str]:
+    options = {}  # type: Dict[str, str]
+    with open(path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                name, _sep, value = line.partition("=")
+                # media_dir can be repeated; only the first one is kept, it is enough for the log
+                options.setdefault(name.strip(), value.strip())
+    return options
+
+
+def get_float(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+class FakeMiniDLNA(object):
+
+    def __init__(self, options: Dict[str, str], rescan: bool) -> None:
+        self.options = options
+        self.rescan = rescan
+        self.hung = threading.Event()
+        self.log_file = None
+        if options.get("log_dir"):
+            self.log_file = open(os.path.join(options["log_dir"], "minidlna.log"), "a", encoding="utf-8")
+
+
+    def log(self, source: str, level: str, message: str) -> None:
+        if self.log_file:
+            self.log_file.write("[{date}] {source}: {level}: {message}\n".format(
+                date=time.strftime("%Y/%m/%d %H:%M:%S"), source=source, level=level, message=message
+            ))
+            self.log_file.flush()
+
+
+    def exit(self, code: int) -> None:
+        print("fake_minidlnad exiting at {now:.6f}".format(now=time.monotonic()), flush=True)
+        if code < 0:
+            signal.signal(-code, signal.SIG_DFL)
+            os.kill(os.getpid(), -code)
+        os._exit(code)
+
+
+    def make_handler(self) -> type:
+
+        fake = self
+        pages = {
+            "/": ("text/html", STATUS_PAGE.format(version=VERSION)),
+            "/rootDesc.xml": ("text/xml", ROOT_DESC.format(
+                version=VERSION, friendly_name=self.options.get("friendly_name", "fake"),
+                uuid=self.options.get("uuid", "00000000-0000-0000-0000-000000000000")
+            )),
+        }
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+            server_version = "MiniDLNA/" + VERSION
+
+            def do_GET(self) -> None:
+                if fake.hung.is_set():
+                    # Accepted, but never answered
+                    time.sleep(3600)
+                page = pages.get(self.path.split("?")[0])
+                if page is None:
+                    self.send_error(404)
+                    return
+                body = page[1].encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", page[0] + "; charset=\"utf-8\"")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+
+    def run(self) -> None:
+
+        port = int(self.options.get("port", 8200))
+        print("minidlnad.c:1100: warn: Starting MiniDLNA version {version}.".format(version=VERSION), flush=True)
+        self.log("minidlna.c", "warn", "Starting MiniDLNA version {version}.".format(version=VERSION))
+
+        startup_delay = get_float("FAKE_STARTUP_DELAY")
+        if startup_delay:
+            time.sleep(startup_delay)
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        try:
+            server = Server(("", port), self.make_handler())
+        except OSError as ex:
+            # Like minidlnad, which exits when it can't listen for HTTP
+            message = "bind(http): {error}".format(error=ex.strerror)
+            print("minidlna.c:1150: error: " + message, file=sys.stderr, flush=True)
+            self.log("minidlna.c", "error", message)
+            self.exit(1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.log("minidlna.c", "info", "HTTP listening on port {port}".format(port=port))
+
+        db_dir = self.options.get("db_dir")
+        scan_seconds = get_float("FAKE_SCAN_SECONDS")
+        if scan_seconds and (self.rescan or not db_dir or not os.path.exists(os.path.join(db_dir, "files.db"))):
+            threading.Thread(target=self.scan, args=(scan_seconds,), daemon=True).start()
+
+        chatty = get_float("FAKE_CHATTY")
+        if chatty:
+            threading.Thread(target=self.chat, args=(chatty,), daemon=True).start()
+
+        hang_after = get_float("FAKE_HANG_AFTER")
+        if hang_after is not None:
+            threading.Timer(hang_after, self.hung.set).start()
+
+        crash_after = get_float("FAKE_CRASH_AFTER")
+        if crash_after is not None:
+            time.sleep(crash_after)
+            self.exit(int(os.environ.get("FAKE_CRASH_CODE", "1")))
+
+        while True:
+            signal.pause()
+
+
+    def scan(self, seconds: float) -> None:
+        media_dir = self.options.get("media_dir", "/").split(",")[-1]
+        self.log("scanner.c", "warn", "Scanning {path}".format(path=media_dir))
+        time.sleep(seconds)
+        self.log("scanner.c", "warn", "Scanning {path} finished (0 files)!".format(path=media_dir))
+        if self.options.get("db_dir"):
+            os.makedirs(self.options["db_dir"], exist_ok=True)
+            open(os.path.join(self.options["db_dir"], "files.db"), "a").close()
+
+
+    def chat(self, lines_per_second: float) -> None:
+        count = 0
+        while True:
+            count += 1
+            print("upnphttp.c:1020: debug: HTTP REQUEST: GET /MediaItems/{count}.mp3".format(count=count), flush=True)
+            time.sleep(1 / lines_per_second)
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-f", dest="config", default="/etc/minidlna.conf")
+    parser.add_argument("-P", dest="pid_file")
+    parser.add_argument("-S", dest="foreground", action="store_true")
+    parser.add_argument("-R", dest="rebuild", action="store_true")
+    parser.add_argument("-r", dest="rescan", action="store_true")
+    parser.add_argument("-d", dest="debug", action="store_true")
+    parser.add_argument("-V", dest="version", action="store_true")
+    args = parser.parse_args()
+
+    if args.version:
+        print("Version {version}".format(version=VERSION))
+        return
+
+    fake = FakeMiniDLNA(read_config(args.config), args.rebuild or args.rescan)
+
+    def on_signal(signum: int, _frame) -> None:
+        if os.environ.get("FAKE_IGNORE_SIGTERM") == "1":
+            return
+        fake.log("minidlna.c", "warn", "received signal {signum}, good-bye".format(signum=signum))
+        shutdown_delay = get_float("FAKE_SHUTDOWN_DELAY")
+        if shutdown_delay:
+            time.sleep(shutdown_delay)
+        fake.exit(0)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    if args.pid_file and args.pid_file != "/dev/null":
+        with open(args.pid_file, "w") as fp:
+            fp.write("{pid}\n".format(pid=os.getpid()))
+
+    fake.run()
+
+
+if __name__ == "__main__":
+    main()
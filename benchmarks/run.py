@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the hot paths of the indicator: reloading minidlna.conf, rebuilding the menu (with a backend that
+only counts operations, so Gtk is not needed), checking hosts against the proxy exceptions and checking the media
+directories. Every case is run with timeit (calibrated to about 0.2 seconds per round) and the median time per call
+is compared with a stored baseline; exits with status 1 if any case is slower than its baseline by more than the
+threshold (a fraction; 0.25 means 25% slower), which can be set for all the cases with --threshold, or per case in
+the "thresholds" of the baseline (shell wildcards over the case names).
+
+The baseline depends on the machine, so save one (--save-baseline) before comparing commits on a new one.
+
+Usage: python3 benchmarks/run.py [--filter proxy] [--rounds 5] [--threshold 0.25] [--output results.json]
+       python3 benchmarks/run.py --save-baseline
+"""
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from bench_config_parser import generate_config  # noqa: E402
+from bench_menu import CountingBackend, build_rows, build_state  # noqa: E402
+from minidlnaindicator.indicatorstate import IndicatorState  # noqa: E402
+from minidlnaindicator.menumodel import MenuModel  # noqa: E402
+from minidlnaindicator.minidlnaconfig import MiniDLNAConfig, EMPTY_SNAPSHOT  # noqa: E402
+from minidlnaindicator.minidlnaconfparser import MiniDLNADirectory, MiniDLNAMediaType  # noqa: E402
+from minidlnaindicator.proxy import Proxy  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BASE_DIR, "benchmarks", "baseline.json")
+
+RESULTS_VERSION = 1
+
+# Name of the case and the function to time; the setup is done when the case is created
+Case = Tuple[str, Callable[[], object]]
+
+
+def config_cases(work_dir: str) -> Iterator[Case]:
+
+    for size in (100, 1000, 10000):
+        config_dir = os.path.join(work_dir, "config{size}".format(size=size))
+        os.mkdir(config_dir)
+        config_file = os.path.join(config_dir, "minidlna.conf")
+        with open(config_file, "w", encoding="utf-8") as fp:
+            fp.write("\n".join(generate_config(size)) + "\n")
+        config = MiniDLNAConfig(None, config_file, config_dir, os.path.join(config_dir, "cache"))
+        assert len(config.dirs) == size
+
+        def reload(config: MiniDLNAConfig=config) -> None:
+            # Forces the parse, as if the file had changed
+            config.snapshot = EMPTY_SNAPSHOT
+            config.reload_config()
+
+        yield "config_reload[{size}]".format(size=size), reload
+        yield "config_reload_unchanged[{size}]".format(size=size), config.reload_config
+
+
+def menu_cases() -> Iterator[Case]:
+
+    for size in (10, 100, 1000):
+        state = build_state(size, False)
+        model = MenuModel(CountingBackend())
+        model.reconcile(build_rows(state))
+        unchanged_rows = build_rows(state)
+        changed_rows = build_rows(build_state(size, False, inaccessible=size // 2))
+
+        def build_and_reconcile(model: MenuModel=model, state: IndicatorState=state) -> None:
+            # Like MiniDLNAIndicator.rebuild_menu: the rows are built again on every render
+            model.reconcile(build_rows(state))
+
+        def one_change(model: MenuModel=model, changed_rows: list=changed_rows, unchanged_rows: list=unchanged_rows) -> None:
+            model.reconcile(changed_rows)
+            model.reconcile(unchanged_rows)
+
+        yield "menu_rebuild_unchanged[{size}]".format(size=size), build_and_reconcile
+        yield "menu_reconcile_one_change[{size}]".format(size=size), one_change
+
+
+def proxy_cases() -> Iterator[Case]:
+
+    # More hosts than the proxy remembers, so every call matches the patterns
+    hosts = ["host{i}.example{j}.com".format(i=i, j=i % 7) for i in range(256)]
+    for size in (10, 100, 1000):
+        exceptions = ["*.internal{i}.example.com".format(i=i) for i in range(size)] + ["localhost", "127.0.0.1"]
+        proxy = Proxy("proxy.example.com", 3128, exceptions=exceptions)
+
+        def allows_hosts(proxy: Proxy=proxy) -> None:
+            for host in hosts:
+                proxy.allows_host(host)
+
+        def set_exceptions(proxy: Proxy=proxy, exceptions: List[str]=exceptions) -> None:
+            proxy.exceptions = exceptions
+
+        yield "proxy_allows_256_hosts[{size}]".format(size=size), allows_hosts
+        yield "proxy_set_exceptions[{size}]".format(size=size), set_exceptions
+
+
+def directory_cases(work_dir: str) -> Iterator[Case]:
+
+    for size in (100, 1000):
+        dirs = []  # type: List[MiniDLNADirectory]
+        for i in range(size):
+            path = os.path.join(work_dir, "dirs{size}".format(size=size), "dir{i:05d}".format(i=i))
+            # Half of them don't exist, like unmounted disks
+            if i % 2:
+                os.makedirs(path)
+            dirs.append(MiniDLNADirectory(path, MiniDLNAMediaType.MIXED))
+
+        def check_dirs(dirs: List[MiniDLNADirectory]=dirs) -> None:
+            for directory in dirs:
+                directory.accessable
+
+        yield "dir_accessable[{size}]".format(size=size), check_dirs
+
+
+def measure(function: Callable[[], object], rounds: int) -> Dict[str, float]:
+    """
+    Returns the median and minimum microseconds per call over the rounds.
+    """
+    timer = timeit.Timer(function)
+    number, _elapsed = timer.autorange()
+    # autorange stops at 0.2 seconds
+    times = [x / number * 1e6 for x in timer.repeat(repeat=rounds, number=number)]
+    return {"median_us": statistics.median(times), "min_us": min(times), "calls": number * rounds}
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_threshold(name: str, baseline: dict, default: float) -> float:
+    for pattern, threshold in baseline.get("thresholds", {}).items():
+        if fnmatch.fnmatchcase(name, pattern):
+            return threshold
+    return default
+
+
+def get_unmatched_thresholds(names: List[str], baseline: dict) -> List[str]:
+    """
+    Returns the patterns of the thresholds of the baseline that match none of the cases, like a "[*]" (a character
+    class, not the brackets of the name), as they would be ignored silently.
+    """
+    return [x for x in baseline.get("thresholds", {}) if not any(fnmatch.fnmatchcase(name, x) for name in names)]
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only the cases whose name contains this text")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--output", help="save the results in this JSON file")
+    args = parser.parse_args()
+
+    baseline = {}  # type: dict
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as fp:
+            baseline = json.load(fp)
+
+    names = []  # type: List[str]
+    results = {}  # type: Dict[str, Dict[str, float]]
+    regressions = []  # type: List[str]
+    print("{:<36} {:>12} {:>12} {:>10}".format("case", "median (us)", "baseline", "change"))
+    with tempfile.TemporaryDirectory(prefix="minidlnaindicator-bench-") as work_dir:
+        cases = [config_cases(work_dir), menu_cases(), proxy_cases(), directory_cases(work_dir)]
+        for name, function in (x for group in cases for x in group):
+            names.append(name)
+            if args.filter and args.filter not in name:
+                continue
+            result = results[name] = measure(function, args.rounds)
+            reference = baseline.get("results", {}).get(name)
+            if not reference:
+                print("{:<36} {:>12.2f} {:>12} {:>10}".format(name, result["median_us"], "-", "-"))
+                continue
+            change = result["median_us"] / reference["median_us"] - 1
+            threshold = get_threshold(name, baseline, args.threshold)
+            regressed = change > threshold
+            if regressed:
+                regressions.append(name)
+            print("{:<36} {:>12.2f} {:>12.2f} {:>+9.0%}{}".format(
+                name, result["median_us"], reference["median_us"], change, " REGRESSION" if regressed else ""
+            ))
+
+    unmatched = get_unmatched_thresholds(names, baseline)
+    if unmatched:
+        print("Thresholds of the baseline that match no case: {patterns}".format(patterns=", ".join(unmatched)))
+        sys.exit(1)
+
+    data = {
+        "version": RESULTS_VERSION,
+        "commit": get_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(data, fp, indent=4, sort_keys=True)
+    if args.save_baseline:
+        # Keeps the thresholds, and the cases not run now
+        data["thresholds"] = baseline.get("thresholds", {})
+        data["results"] = dict(baseline.get("results", {}), **results)
+        with open(args.baseline, "w", encoding="utf-8") as fp:
+            json.dump(data, fp, indent=4, sort_keys=True)
+            fp.write("\n")
+        print("Baseline saved in {path}".format(path=args.baseline))
+
+    if regressions and not args.save_baseline:
+        print("{count} cases slower than the baseline: {names}".format(count=len(regressions), names=", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
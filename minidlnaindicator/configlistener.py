@@ -0,0 +1,7 @@
+from .minidlnaconfig import MiniDLNAConfigSnapshot
+
+
+class ConfigListener(object):
+
+    def on_config_changed(self, snapshot: MiniDLNAConfigSnapshot) -> None:
+        raise NotImplementedError()
@@ -0,0 +1,108 @@
+from typing import List, Optional
+
+import logging
+import os
+
+from gi.repository import GLib
+
+from .configlistener import ConfigListener
+from .inotify import Inotify, IN_CLOSE_WRITE, IN_MOVED_TO, IN_ONLYDIR
+from .minidlnaconfig import MiniDLNAConfig
+
+
+class ConfigWatcher(object):
+    """
+    Watches the directory of the MiniDLNA configuration file from the GLib main loop, so atomic renames done by
+    editors are detected too, and reloads the configuration once the changes have settled.
+    """
+
+    def __init__(self, minidlna_config: MiniDLNAConfig, debounce_time: float=0.1) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.minidlna_config = minidlna_config
+        self.debounce_time = debounce_time
+
+        self._inotify = None  # type: Optional[Inotify]
+        self._source_id = None  # type: Optional[int]
+        self._reload_source_id = None  # type: Optional[int]
+
+        self._listeners = []  # type: List[ConfigListener]
+
+
+    def add_listener(self, listener: ConfigListener) -> bool:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+            return True
+        return False
+
+
+    def remove_listener(self, listener: ConfigListener) -> bool:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+            return True
+        return False
+
+
+    def is_running(self) -> bool:
+        return self._source_id is not None
+
+
+    def start(self) -> None:
+
+        self._logger.debug("Starting config watcher...")
+
+        config_dir = os.path.dirname(self.minidlna_config.config_file)
+        try:
+            self._inotify = Inotify()
+            self._inotify.add_watch(config_dir, IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR)
+        except OSError as ex:
+            self._logger.error("Couldn't watch the configuration directory %s; changes won't be detected: %s", config_dir, ex)
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+            return
+
+        self._source_id = GLib.unix_fd_add_full(
+            GLib.PRIORITY_DEFAULT, self._inotify.fileno(), GLib.IOCondition.IN, self._on_inotify_events
+        )
+
+
+    def _on_inotify_events(self, _fd: int, _condition: GLib.IOCondition) -> bool:
+
+        config_name = os.path.basename(self.minidlna_config.config_file)
+        if any(x.name == config_name for x in self._inotify.read_events()):
+            # Wait until there are no more events for the debounce time
+            if self._reload_source_id is not None:
+                GLib.source_remove(self._reload_source_id)
+            self._reload_source_id = GLib.timeout_add(int(self.debounce_time * 1000), self._reload)
+        return True
+
+
+    def _reload(self) -> bool:
+
+        self._reload_source_id = None
+        try:
+            changed = self.minidlna_config.reload_config()
+        except Exception as ex:
+            self._logger.exception("Error reloading the configuration: %s", ex)
+            return False
+
+        if changed:
+            snapshot = self.minidlna_config.snapshot
+            self._logger.debug("Configuration changed; notifying...")
+            for listener in self._listeners:
+                listener.on_config_changed(snapshot)
+        return False
+
+
+    def stop(self) -> None:
+
+        self._logger.debug("Stopping config watcher...")
+        for source_id in (self._source_id, self._reload_source_id):
+            if source_id is not None:
+                GLib.source_remove(source_id)
+        self._source_id = self._reload_source_id = None
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
@@ -15,18 +15,32 @@ APP_DBUS_PATH = "/com/github/okelet/minidlnaindicator"
 APP_DBUS_DOMAIN = APP_DBUS_PATH
 APP_DBUS_DOMAIN = re.sub("^/", "", APP_DBUS_DOMAIN)
 APP_DBUS_DOMAIN = re.sub("/", ".", APP_DBUS_DOMAIN)
+APP_DBUS_INTERFACE = APP_DBUS_DOMAIN
 
 MINIDLNA_CONFIG_DIR = os.path.expanduser("~/.minidlna")
 MINIDLNA_CONFIG_FILE = os.path.join(MINIDLNA_CONFIG_DIR, "minidlna.conf")
 MINIDLNA_CACHE_DIR = os.path.join(MINIDLNA_CONFIG_DIR, "cache")
+MINIDLNA_PROFILES_DIR = os.path.join(MINIDLNA_CONFIG_DIR, "profiles")
+PROFILE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+MINIDLNA_MANIFEST_FILE = os.path.join(MINIDLNA_CONFIG_DIR, "manifest.json")
 MINIDLNA_INDICATOR_CONFIG = os.path.join(MINIDLNA_CONFIG_DIR, "indicator.json")
+UPDATE_CHECK_CACHE_FILE = os.path.join(MINIDLNA_CONFIG_DIR, "update_check.json")
 MINIDLNA_LOG_FILENAME = "minidlna.log"
 MINIDLNA_LOG_PATH = os.path.join(MINIDLNA_CONFIG_DIR, MINIDLNA_LOG_FILENAME)
 
+PYPI_URL = "https://pypi.python.org/pypi"
+TEST_PYPI_URL = "https://testpypi.python.org/pypi"
+
 XDG_CONFIG_DIR = os.path.expanduser("~/.config")
 XDG_AUTOSTART_DIR = os.path.join(XDG_CONFIG_DIR, "autostart")
 XDG_AUTOSTART_FILE = os.path.join(XDG_AUTOSTART_DIR, APPINDICATOR_ID + ".desktop")
 
+# Delay used to coalesce state changes into a single render (about one frame)
+STATE_RENDER_DELAY_MS = 16
+
+# Delay used to coalesce the changes of the configuration into a single write
+CONFIG_SAVE_DELAY_MS = 1000
+
 MINIDLNA_ICON_GREY = os.path.join(BASE_DIR, "icons", "dlna_grey_32.png")
 MINIDLNA_ICON_GREEN = os.path.join(BASE_DIR, "icons", "dlna_green_32.png")
 
@@ -0,0 +1,264 @@
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from types import MappingProxyType
+
+from gi.repository import GLib
+
+from .librarystats import LibraryStats, EMPTY_STATS
+
+
+MINIDLNA_DB_FILENAME = "files.db"
+
+# Folders also have a row in DETAILS, but without MIME; the media class is the part before the slash
+_COUNT_QUERY = (
+    "SELECT substr(MIME, 1, instr(MIME, '/') - 1), COUNT(*) FROM DETAILS "
+    "WHERE ID > ? AND ID <= ? AND MIME IS NOT NULL {where} GROUP BY 1"
+)
+
+
+def get_db_path(db_dir: Optional[str]) -> Optional[str]:
+    return os.path.join(db_dir, MINIDLNA_DB_FILENAME) if db_dir else None
+
+
+def get_path_range(path: str) -> Tuple[str, str]:
+    """
+    Returns the bounds of the PATH values under the directory, so the PATH index can be used instead of LIKE.
+    """
+    prefix = path.rstrip("/") + "/"
+    return prefix, prefix[:-1] + chr(ord("/") + 1)
+
+
+class LibraryStatsReader(object):
+    """
+    Reads the statistics of the minidlnad database without modifying it (the connection is read only, and never
+    creates the file). DETAILS IDs only grow, so every refresh only counts the rows after the highest ID seen
+    (the watermark) and adds them to the cached counts; the counts are recalculated from scratch when the database
+    file is replaced (a reindex creates a new one) or every full_refresh_interval seconds, to account for deleted
+    files.
+    """
+
+    def __init__(self, db_path: Optional[str], dirs: Iterable[str]=(), full_refresh_interval: float=600.0) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.full_refresh_interval = full_refresh_interval
+
+        self._db_path = db_path
+        self._dirs = tuple(sorted(set(dirs)))
+        self._connection = None  # type: Optional[sqlite3.Connection]
+        self._inode = None  # type: Optional[int]
+        self._stats = EMPTY_STATS
+        self._reset_counts()
+
+        # Total of the replaced database, to estimate the progress of the scan that fills the new one
+        self.expected_total = None  # type: Optional[int]
+
+
+    @property
+    def stats(self) -> LibraryStats:
+        return self._stats
+
+
+    def configure(self, db_path: Optional[str], dirs: Iterable[str]) -> None:
+        dirs = tuple(sorted(set(dirs)))
+        if db_path != self._db_path or dirs != self._dirs:
+            self._db_path = db_path
+            self._dirs = dirs
+            self.close()
+
+
+    def refresh(self, scanning: bool=False) -> LibraryStats:
+        """
+        Counts the items added since the last refresh and returns the updated statistics; if the database can't be
+        read (it doesn't exist yet, or it is locked), the last statistics are returned.
+        """
+
+        if not self._db_path:
+            return self._stats
+
+        try:
+            file_stat = os.stat(self._db_path)
+        except FileNotFoundError:
+            self._database_replaced()
+            return self._stats
+
+        now = time.monotonic()
+        if self._connection is not None and file_stat.st_ino != self._inode:
+            self._logger.debug("Database %s replaced; counting again.", self._db_path)
+            self._database_replaced()
+        elif now - self._last_full_refresh > self.full_refresh_interval:
+            self._reset_counts()
+
+        try:
+            if self._connection is None:
+                self._connection = sqlite3.connect(
+                    "file:{path}?mode=ro".format(path=urllib.parse.quote(self._db_path)),
+                    uri=True, timeout=0.5, check_same_thread=False
+                )
+                self._inode = file_stat.st_ino
+                self._reset_counts()
+            self._count_new_rows()
+        except sqlite3.Error as ex:
+            # minidlnad writes without journal while scanning, so a read can fail; the next refresh will retry
+            self._logger.debug("Couldn't read the database %s: %s", self._db_path, ex)
+            self.close()
+            return self._stats
+
+        total = sum(self._by_class.values())
+        progress = None  # type: Optional[float]
+        if scanning and self.expected_total:
+            progress = min(total / self.expected_total, 0.99)
+
+        self._stats = LibraryStats(
+            total,
+            MappingProxyType(dict(self._by_class)),
+            MappingProxyType({x: MappingProxyType(dict(y)) for x, y in self._by_dir.items()}),
+            progress,
+            now,
+        )
+        return self._stats
+
+
+    def _count_new_rows(self) -> None:
+
+        connection = self._connection
+        # All the queries count the same range of rows, even if minidlnad adds more in between
+        low_id = self._watermark
+        high_id = connection.execute("SELECT MAX(ID) FROM DETAILS").fetchone()[0] or 0
+        if high_id <= low_id:
+            return
+
+        for media_class, count in connection.execute(_COUNT_QUERY.format(where=""), (low_id, high_id)):
+            self._by_class[media_class] += count
+
+        query = _COUNT_QUERY.format(where="AND PATH >= ? AND PATH < ?")
+        for path in self._dirs:
+            low_path, high_path = get_path_range(path)
+            for media_class, count in connection.execute(query, (low_id, high_id, low_path, high_path)):
+                self._by_dir[path][media_class] += count
+
+        self._watermark = high_id
+
+
+    def _database_replaced(self) -> None:
+        # A reindex (-R) deletes the database and fills a new one from scratch
+        if self._stats.total:
+            self.expected_total = self._stats.total
+        self._stats = EMPTY_STATS
+        self.close()
+
+
+    def _reset_counts(self) -> None:
+        self._watermark = 0
+        self._by_class = collections.Counter()  # type: Dict[str, int]
+        self._by_dir = collections.defaultdict(collections.Counter)  # type: Dict[str, Dict[str, int]]
+        self._last_full_refresh = time.monotonic()
+
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._inode = None
+        self._reset_counts()
+
+
+class LibraryStatsMonitor(object):
+    """
+    Refreshes the statistics periodically from the GLib main loop while enabled (minidlnad is running), more often
+    during scans, and calls on_change from the main loop when they change. The queries run in a short-lived worker
+    thread, so a full count of a big library doesn't block the main loop; while disabled there are no wakeups.
+    """
+
+    def __init__(self, reader: LibraryStatsReader, on_change: Callable[[LibraryStats], None], interval: int=30,
+                 scan_interval: int=3) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.reader = reader
+        self.on_change = on_change
+        self.interval = interval
+        self.scan_interval = scan_interval
+
+        # Serializes the access to the reader from the workers
+        self._lock = threading.Lock()
+        self._enabled = False
+        self._scanning = False
+        self._refreshing = False
+        self._source_id = None  # type: Optional[int]
+        self._last_stats = None  # type: Optional[LibraryStats]
+
+
+    def set_enabled(self, enabled: bool) -> None:
+        if enabled != self._enabled:
+            self._enabled = enabled
+            self._reschedule()
+
+
+    def set_scanning(self, scanning: bool) -> None:
+        if scanning != self._scanning:
+            self._scanning = scanning
+            self._reschedule()
+
+
+    def configure(self, db_path: Optional[str], dirs: Iterable[str]) -> None:
+        with self._lock:
+            self.reader.configure(db_path, dirs)
+        if self._enabled:
+            self._refresh()
+
+
+    def _reschedule(self) -> None:
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        if self._enabled:
+            self._source_id = GLib.timeout_add_seconds(
+                self.scan_interval if self._scanning else self.interval, self._on_timeout
+            )
+            self._refresh()
+
+
+    def _on_timeout(self) -> bool:
+        self._refresh()
+        return True
+
+
+    def _refresh(self) -> None:
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh_worker, args=(self._scanning,), daemon=True).start()
+
+
+    def _refresh_worker(self, scanning: bool) -> None:
+        try:
+            with self._lock:
+                stats = self.reader.refresh(scanning)  # type: Optional[LibraryStats]
+        except Exception as ex:
+            self._logger.exception("Error refreshing the library stats: %s", ex)
+            stats = None
+        GLib.idle_add(self._on_refreshed, stats)
+
+
+    def _on_refreshed(self, stats: Optional[LibraryStats]) -> bool:
+        self._refreshing = False
+        if self._enabled and stats is not None and (self._last_stats is None or stats[:4] != self._last_stats[:4]):
+            self._last_stats = stats
+            self.on_change(stats)
+        return False
+
+
+    def stop(self) -> None:
+        self._logger.debug("Stopping library stats monitor...")
+        self._enabled = False
+        self._reschedule()
+        with self._lock:
+            self.reader.close()
@@ -0,0 +1,222 @@
+from typing import Callable, Dict, Iterable, Mapping, Optional, Set, Tuple
+
+import enum
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import types
+
+
+class ProbeStatus(enum.Enum):
+    CHECKING = "checking"
+    ACCESSIBLE = "accessible"
+    INACCESSIBLE = "inaccessible"
+    TIMEOUT = "timeout"
+
+
+def probe_directory(path: str) -> bool:
+    # isdir already implies that the path exists
+    return os.path.isdir(path) and os.access(path, os.R_OK)
+
+
+class _ProbeJob(object):
+
+    __slots__ = ("path", "generation", "deadline", "timed_out")
+
+    def __init__(self, path: str, generation: int) -> None:
+        self.path = path
+        self.generation = generation
+        # The timeout starts when a worker picks the job, not while it is queued
+        self.deadline = math.inf
+        self.timed_out = False
+
+
+class DirectoryProber(object):
+    """
+    Checks the accessibility of directories in a small pool of daemon threads, so a hung network mount never blocks
+    the caller. Results are cached until they expire or invalidate() is called (for example, when the mount table
+    changes); a probe that doesn't finish in time is reported as TIMEOUT and its thread is replaced.
+    """
+
+    def __init__(self, on_change: Callable[[], None], max_workers: int=4, timeout: float=2.0, ttl: float=60.0,
+                 max_stuck_workers: int=16, probe: Callable[[str], bool]=probe_directory) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.on_change = on_change
+        self.max_workers = max_workers
+        self.max_stuck_workers = max_stuck_workers
+        self.timeout = timeout
+        self.ttl = ttl
+        self._probe = probe
+
+        self._lock = threading.Condition()
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._results = {}  # type: Dict[str, Tuple[ProbeStatus, float]]
+        self._snapshot = types.MappingProxyType({})  # type: Mapping[str, ProbeStatus]
+        self._in_flight = {}  # type: Dict[str, _ProbeJob]
+        # Jobs already being probed when invalidated; their results are discarded, but their timeouts still count
+        self._invalidated = set()  # type: Set[_ProbeJob]
+        self._generation = 0
+        self._workers = 0
+        self._stuck_workers = 0
+        self._watchdog = None  # type: Optional[threading.Thread]
+        self._stopped = False
+
+
+    @property
+    def results(self) -> Mapping[str, ProbeStatus]:
+        """
+        Immutable view of the last known status of every probed directory.
+        """
+        return self._snapshot
+
+
+    def status(self, path: str) -> ProbeStatus:
+        return self._snapshot.get(path, ProbeStatus.CHECKING)
+
+
+    def probe(self, paths: Iterable[str]) -> None:
+        """
+        Schedules a check of the paths whose status is unknown or expired and that are not already being checked;
+        expired results are still returned until the new ones arrive.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._stopped:
+                return
+            scheduled = False
+            for path in paths:
+                result = self._results.get(path)
+                if path in self._in_flight or (result and now - result[1] < self.ttl):
+                    continue
+                job = _ProbeJob(path, self._generation)
+                self._in_flight[path] = job
+                self._queue.put(job)
+                scheduled = True
+            if scheduled:
+                self._ensure_threads()
+
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._results.clear()
+            # The queued jobs are skipped by the workers; those started may hang (like on a vanished mount), so the
+            # watchdog keeps watching them
+            self._invalidated.update(x for x in self._in_flight.values() if x.deadline != math.inf)
+            self._in_flight.clear()
+            self._publish()
+            self._lock.notify_all()
+        self.on_change()
+
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+            for _i in range(self._workers):
+                self._queue.put(None)
+            self._lock.notify_all()
+
+
+    def _ensure_threads(self) -> None:
+
+        while self._workers - self._stuck_workers < self.max_workers and self._stuck_workers <= self.max_stuck_workers:
+            self._workers += 1
+            threading.Thread(target=self._work, name="DirectoryProber", daemon=True).start()
+
+        if not self._watchdog:
+            self._watchdog = threading.Thread(target=self._watch, name="DirectoryProberWatchdog", daemon=True)
+            self._watchdog.start()
+
+
+    def _publish(self) -> None:
+        self._snapshot = types.MappingProxyType({path: result[0] for path, result in self._results.items()})
+
+
+    def _work(self) -> None:
+
+        while True:
+
+            job = self._queue.get()
+            if job is None:
+                break
+
+            with self._lock:
+                if self._in_flight.get(job.path) is not job:
+                    # Invalidated while queued
+                    continue
+                job.deadline = time.monotonic() + self.timeout
+                self._lock.notify_all()
+
+            try:
+                status = ProbeStatus.ACCESSIBLE if self._probe(job.path) else ProbeStatus.INACCESSIBLE
+            except Exception as ex:
+                self._logger.warning("Error probing directory %s: %s", job.path, ex)
+                status = ProbeStatus.INACCESSIBLE
+
+            with self._lock:
+                if job.timed_out:
+                    # This thread was given up and replaced; keep the late result if still valid, and leave
+                    self._stuck_workers -= 1
+                    self._workers -= 1
+                    current = job.generation == self._generation and not self._stopped
+                else:
+                    current = self._in_flight.get(job.path) is job
+                    if current:
+                        del self._in_flight[job.path]
+                    else:
+                        self._invalidated.discard(job)
+                changed = current and self.status(job.path) != status
+                if current:
+                    self._results[job.path] = (status, time.monotonic())
+                if changed:
+                    self._publish()
+
+            if changed:
+                self.on_change()
+            if job.timed_out:
+                return
+
+        with self._lock:
+            self._workers -= 1
+
+
+    def _watch(self) -> None:
+
+        while True:
+
+            with self._lock:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                timed_out = [x for x in self._in_flight.values() if x.deadline <= now]
+                for job in timed_out:
+                    job.timed_out = True
+                    del self._in_flight[job.path]
+                    self._results[job.path] = (ProbeStatus.TIMEOUT, now)
+                    self._stuck_workers += 1
+                invalidated_timed_out = [x for x in self._invalidated if x.deadline <= now]
+                for job in invalidated_timed_out:
+                    # Replaced as well, but there is nothing to report
+                    job.timed_out = True
+                    self._invalidated.discard(job)
+                    self._stuck_workers += 1
+                if timed_out:
+                    self._publish()
+                if timed_out or invalidated_timed_out:
+                    self._ensure_threads()
+                else:
+                    # Sleep until the nearest deadline, or until a worker picks a job
+                    next_deadline = min(
+                        [x.deadline for x in self._in_flight.values()] + [x.deadline for x in self._invalidated],
+                        default=math.inf
+                    )
+                    self._lock.wait(None if next_deadline == math.inf else next_deadline - now)
+
+            if timed_out:
+                self._logger.warning("Timeout probing directories: %s", [x.path for x in timed_out])
+                self.on_change()
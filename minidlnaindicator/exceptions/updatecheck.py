@@ -0,0 +1,6 @@
+
+class UpdateCheckException(Exception):
+
+    def __init__(self, msg: str) -> None:
+        Exception.__init__(self, msg)
+        self.msg = msg
@@ -1,8 +1,9 @@
-
 from typing import List
 
+from .mounttable import MountPoint
+
 
 class FSListener(object):
 
-    def on_fs_changed(self, new_filesystems: List[str]) -> None:
+    def on_fs_changed(self, added: List[MountPoint], removed: List[MountPoint]) -> None:
         raise NotImplementedError()
@@ -1,22 +1,30 @@
-
-from typing import List
+from typing import List, Optional
 
 import logging
-import psutil
-import threading
+import os
 
-from .fslistener import FSListener
+from gi.repository import GLib
 
+from .fslistener import FSListener
+from .mounttable import MountTable, MountPoint, MOUNTINFO_PATH, parse_mountinfo, is_ignored_mount
 
-class FSMonitorThread(threading.Thread):
 
-    def __init__(self) -> None:
+class FSMonitor(object):
+    """
+    Follows the mount table from the GLib main loop: the kernel flags /proc/self/mountinfo with POLLPRI/POLLERR
+    every time it changes, so there are no wakeups while nothing is mounted or unmounted. Where it can't be used,
+    the partitions are polled every poll_interval seconds. Listeners are called from the main loop.
+    """
 
-        threading.Thread.__init__(self)
+    def __init__(self, poll_interval: int=10) -> None:
 
         self._logger = logging.getLogger(__name__)
 
-        self._stop_signal = threading.Event()
+        self.poll_interval = poll_interval
+        self.mount_table = MountTable()
+
+        self._mountinfo_fd = None  # type: Optional[int]
+        self._source_id = None  # type: Optional[int]
 
         self._listeners = []  # type: List[FSListener]
 
@@ -35,33 +43,75 @@ class FSMonitorThread(threading.Thread):
         return False
 
 
-    def run(self) -> None:
+    def is_running(self) -> bool:
+        return self._source_id is not None
+
+
+    def start(self) -> None:
+
+        self._logger.debug("Starting FS monitor...")
+
+        try:
+            self._mountinfo_fd = os.open(MOUNTINFO_PATH, os.O_RDONLY | os.O_CLOEXEC)
+        except OSError as ex:
+            self._logger.warning("Couldn't open %s (%s); falling back to polling.", MOUNTINFO_PATH, ex)
+            self._poll_partitions(notify=False)
+            self._source_id = GLib.timeout_add_seconds(self.poll_interval, self._poll_partitions)
+            return
+
+        self._update(self._read_mountinfo(self._mountinfo_fd), notify=False)
+        self._source_id = GLib.unix_fd_add_full(
+            GLib.PRIORITY_DEFAULT, self._mountinfo_fd, GLib.IOCondition.PRI | GLib.IOCondition.ERR,
+            self._on_mountinfo_changed
+        )
+
+
+    def _on_mountinfo_changed(self, fd: int, _condition: GLib.IOCondition) -> bool:
+        self._update(self._read_mountinfo(fd))
+        return True
+
+
+    def _poll_partitions(self, notify: bool=True) -> bool:
 
-        self._logger.debug("Starting FS check thread...")
+        import psutil
 
-        self._stop_signal.clear()
-        previous_filesystems = None
-        while not self._stop_signal.is_set():
+        self._update(
+            [
+                MountPoint(0, x.mountpoint, x.fstype, x.device)
+                for x in psutil.disk_partitions()
+                if not is_ignored_mount(x.mountpoint, x.fstype, x.device)
+            ],
+            notify=notify
+        )
+        return True
 
-            current_filesystems = sorted([x.mountpoint for x in psutil.disk_partitions()])
 
-            if previous_filesystems is not None and previous_filesystems != current_filesystems:
-                self._logger.debug(
-                    "Detected FS change; old: %s; new: %s; notifying...",
-                    previous_filesystems,
-                    current_filesystems
-                )
-                for listener in self._listeners:
-                    listener.on_fs_changed(current_filesystems)
+    def _read_mountinfo(self, mountinfo_fd: int) -> List[MountPoint]:
+        os.lseek(mountinfo_fd, 0, os.SEEK_SET)
+        chunks = []  # type: List[bytes]
+        while True:
+            chunk = os.read(mountinfo_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return parse_mountinfo(b"".join(chunks).decode("utf-8", "replace"))
 
-            previous_filesystems = current_filesystems
 
-            self._stop_signal.wait(10)
+    def _update(self, mounts: List[MountPoint], notify: bool=True) -> None:
 
-        self._logger.debug("FS check thread finished.")
+        added, removed = self.mount_table.update(mounts)
+        if notify and (added or removed):
+            self._logger.debug("Detected FS change; added: %s; removed: %s; notifying...", added, removed)
+            for listener in self._listeners:
+                listener.on_fs_changed(added, removed)
 
 
     def stop(self) -> None:
 
-        self._logger.debug("Stopping FS check thread...")
-        self._stop_signal.set()
+        self._logger.debug("Stopping FS monitor...")
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        if self._mountinfo_fd is not None:
+            os.close(self._mountinfo_fd)
+            self._mountinfo_fd = None
@@ -0,0 +1,270 @@
+from typing import Callable, List, Optional
+
+import logging
+import os
+import shutil
+import signal
+import threading
+
+from gi.repository import GLib
+
+from .configlistener import ConfigListener
+from .constants import MINIDLNA_CONFIG_FILE
+from .fslistener import FSListener
+from .fsmonitor import FSMonitor
+from .configwatcher import ConfigWatcher
+from .healthcheck import HealthSnapshot, is_responding
+from .healthprobe import HealthProbe
+from .indicatorconfig import MiniDLNAIndicatorConfig
+from .minidlnaconfig import MiniDLNAConfig, MiniDLNAConfigSnapshot
+from .mounttable import MountPoint
+from .orphans import free_port_from_orphans
+from .processlistener import ProcessListener
+from .processrunner import ProcessRunner
+from .processwait import StopOutcome, StopResult
+from .supervisor import ProcessSupervisor
+from .watchdog import RestartWatchdog
+from .watchdogstatus import RestartAction, CircuitState, WatchdogStatus
+
+
+class HeadlessSupervisor(ProcessListener, FSListener, ConfigListener):
+    """
+    Runs minidlnad without the indicator, for servers: the same lifecycle, automatic restarts, orphan recovery and
+    watching of the mounts and the configuration, with the GLib main loop alone (no Gtk, AppIndicator, notifications
+    or session bus); what the indicator would notify is logged. SIGTERM and SIGINT stop minidlnad and exit, and SIGHUP
+    restarts it, so it reads the configuration again.
+    """
+
+    def __init__(self, config: MiniDLNAIndicatorConfig) -> None:
+
+        self.logger = logging.getLogger(__name__)  # type: logging.Logger
+
+        self.config = config
+        self.minidlna_config = MiniDLNAConfig(None, MINIDLNA_CONFIG_FILE)
+        self.minidlna_path = None  # type: Optional[str]
+        self.stop_requested = False
+        self.quitting = False
+        self.output_matches = set()  # type: set
+        self.exit_code = 0
+
+        self.supervisor = ProcessSupervisor()
+        self.runner = ProcessRunner(grace_period=self.config.stop_grace_period, supervisor=self.supervisor)
+        self.runner.add_listener(self)
+
+        self.watchdog = RestartWatchdog(
+            self.start_minidlna,
+            self.restart_minidlna,
+            self.on_watchdog_changed,
+            rules={int(x): RestartAction(y) for x, y in self.config.restart_rules.items()},
+            enabled=self.config.auto_restart,
+            max_failures=self.config.restart_max_failures,
+            window=self.config.restart_window_seconds,
+        )
+        self.health_probe = HealthProbe(self.on_health_checked)
+
+        self.fs_monitor = FSMonitor()
+        self.fs_monitor.add_listener(self)
+        self.config_watcher = ConfigWatcher(self.minidlna_config)
+        self.config_watcher.add_listener(self)
+
+        self.mainloop = GLib.MainLoop()
+
+
+    def run(self) -> int:
+        """
+        Runs until a SIGTERM or SIGINT; returns the exit code.
+        """
+
+        self.minidlna_path = shutil.which("minidlnad")
+        if not self.minidlna_path:
+            self.logger.error("MiniDLNA is not installed.")
+            return 1
+
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, self.on_quit_signal, signal.SIGTERM)
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGINT, self.on_quit_signal, signal.SIGINT)
+        GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGHUP, self.on_reload_signal)
+
+        self.fs_monitor.start()
+        self.config_watcher.start()
+        self.start_minidlna()
+
+        self.mainloop.run()
+        return self.exit_code
+
+
+    def get_minidlna_command(self) -> List[str]:
+        return [self.minidlna_path, "-f", MINIDLNA_CONFIG_FILE, "-P", "/dev/null", "-S"]
+
+
+    def start_minidlna(self) -> None:
+        if self.quitting or self.runner.is_running():
+            return
+        self.logger.info("Starting MiniDLNA...")
+        self.runner.start(self.get_minidlna_command())
+
+
+    def stop_minidlna(self, on_stopped: Optional[Callable[[], None]]=None) -> None:
+        """
+        Stops minidlnad and then calls on_stopped, unless it doesn't finish in time. The main loop goes on while it
+        stops, so the signals are still handled.
+        """
+
+        if not self.runner.is_running():
+            if on_stopped:
+                on_stopped()
+            return
+
+        self.stop_requested = True
+        self.runner.stop_async(lambda result: self.on_minidlna_stopped(result, on_stopped))
+
+
+    def on_minidlna_stopped(self, result: StopResult, on_stopped: Optional[Callable[[], None]]) -> None:
+        if result.outcome == StopOutcome.KILLED:
+            self.logger.warning("MiniDLNA didn't finish in %s seconds and has been killed.", self.config.stop_grace_period)
+        elif result.outcome == StopOutcome.TIMED_OUT:
+            self.logger.warning("MiniDLNA has not finished after the kill signal in the allowed time.")
+            return
+        if on_stopped:
+            on_stopped()
+
+
+    def restart_minidlna(self) -> None:
+        self.stop_minidlna(self.start_minidlna)
+
+
+    #################################################################################################################
+    # Listener
+    #################################################################################################################
+
+    def on_process_starting(self) -> None:
+        self.output_matches = set()
+        self.stop_requested = False
+
+
+    def on_process_started(self, pid: int) -> None:
+        self.logger.info("MiniDLNA started with PID %s.", pid)
+        self.watchdog.process_started()
+        self.health_probe.start(self.minidlna_config.port)
+
+
+    def on_process_output_matched(self, matcher: str, line: str) -> None:
+        self.logger.debug("MiniDLNA printed a known message (%s): %s", matcher, line)
+        self.output_matches.add(matcher)
+        if matcher == "inotify_limit":
+            self.logger.warning("The inotify watch limit has been reached; changes in some folders won't be detected until MiniDLNA is reindexed.")
+
+
+    def on_process_finished(self, command: str, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str]) -> None:
+
+        self.health_probe.stop()
+        if self.stop_requested:
+            self.logger.info("MiniDLNA stopped (return code %s).", exit_code)
+            self.watchdog.process_stopped()
+            return
+
+        if exit_code != 0 and self.config.enable_orphan_process_killer and "bind_http" in self.output_matches:
+            # Stopping the orphans may take the whole grace period; meanwhile, the signals are still handled
+            threading.Thread(
+                target=self.free_port, args=(command, pid, exit_code, std_out, std_err), daemon=True
+            ).start()
+            return
+
+        self.on_process_failed(pid, exit_code, std_out, std_err, "exit code {code}".format(code=exit_code), None)
+
+
+    def free_port(self, command: List[str], pid: int, exit_code: int, std_out: Optional[str],
+                  std_err: Optional[str]) -> None:
+        action = RestartAction.RESTART if free_port_from_orphans(
+            MINIDLNA_CONFIG_FILE, self.minidlna_config.port, self.config.stop_grace_period,
+            executable=os.path.basename(command[0])
+        ) else RestartAction.STOP
+        reason = "port {port} in use".format(port=self.minidlna_config.port)
+        GLib.idle_add(self.on_process_failed, pid, exit_code, std_out, std_err, reason, action)
+
+
+    def on_process_failed(self, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str], reason: str,
+                          action: Optional[RestartAction]) -> bool:
+
+        if self.quitting or self.runner.is_running():
+            return False
+
+        delay = self.watchdog.process_exited(exit_code, reason, action)
+        if delay is not None and self.watchdog.status.circuit == CircuitState.CLOSED:
+            self.logger.warning(
+                "MiniDLNA has exited unexpectedly (PID: %s, return code: %s); restarting it in %.1f seconds.",
+                pid, exit_code, delay
+            )
+        elif exit_code != 0:
+            self.logger.error(
+                "MiniDLNA has exited without success; PID: %s, return code: %s, std out: %s, std err: %s",
+                pid, exit_code, std_out, std_err
+            )
+        return False
+
+
+    def on_process_error(self, reason: str) -> None:
+        self.logger.error("Error running MiniDLNA: %s", reason)
+
+
+    def on_watchdog_changed(self, status: WatchdogStatus) -> None:
+        if status.circuit == CircuitState.OPEN and status.restart_pending:
+            self.logger.error("MiniDLNA keeps failing; the automatic restarts are paused for a while.")
+
+
+    def on_health_checked(self, health: HealthSnapshot) -> None:
+        self.watchdog.report_liveness(is_responding(health))
+
+
+    def on_fs_changed(self, added: List[MountPoint], removed: List[MountPoint]) -> None:
+        self.logger.info("Mounts changed; added: %s, removed: %s.", added, removed)
+
+
+    def on_config_changed(self, snapshot: MiniDLNAConfigSnapshot) -> None:
+        self.logger.info("A change in the MiniDLNA configuration has been detected; send SIGHUP to restart MiniDLNA and apply it.")
+
+
+    #################################################################################################################
+    # Signals
+    #################################################################################################################
+
+    def on_reload_signal(self) -> bool:
+        if self.stop_requested and self.runner.is_running():
+            self.logger.info("SIGHUP received while MiniDLNA is stopping; ignored.")
+            return True
+        self.logger.info("SIGHUP received; restarting MiniDLNA...")
+        # The user may have fixed the cause of the failures
+        self.watchdog.reset()
+        if self.runner.is_running():
+            self.restart_minidlna()
+        else:
+            self.start_minidlna()
+        return True
+
+
+    def on_quit_signal(self, signum: int) -> bool:
+        self.logger.info("Signal %s received; quitting...", signal.Signals(signum).name)
+        self.quit()
+        return True
+
+
+    def quit(self) -> None:
+
+        self.logger.debug("Exiting...")
+        self.quitting = True
+
+        self.fs_monitor.stop()
+        self.config_watcher.stop()
+        self.health_probe.stop()
+        self.watchdog.stop()
+
+        # Waits, as the main loop ends here; not stopping it in time is an error for the service manager
+        if self.runner.is_running():
+            self.stop_requested = True
+            result = self.runner.stop()
+            self.on_minidlna_stopped(result, None)
+            if result.outcome == StopOutcome.TIMED_OUT:
+                self.exit_code = 1
+
+        self.config.flush()
+
+        self.mainloop.quit()
@@ -0,0 +1,165 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import bisect
+import collections
+import enum
+import http.client
+import logging
+import math
+import time
+
+
+# Upper bounds (in seconds) of the latency buckets; slower responses go to an overflow bucket
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+HealthResult = collections.namedtuple("HealthResult", ["ok", "latencies", "error"])
+HealthResult.__doc__ = """
+Result of a health check: if all the paths answered without a server error, the latency of each path (None for the
+paths that failed) and the first error found.
+"""
+
+
+class HealthStatus(enum.Enum):
+    STOPPED = "stopped"
+    # Waiting for the first answer
+    STARTING = "starting"
+    READY = "ready"
+    # Slow answers, or some failures
+    DEGRADED = "degraded"
+    DOWN = "down"
+
+
+HealthSnapshot = collections.namedtuple("HealthSnapshot", ["status", "time_to_ready", "p50", "p95", "failures"])
+HealthSnapshot.__doc__ = """
+Health of the web server: its status, seconds from the start until it answered (None until then), median and 95th
+percentile latencies (of the slowest path; None without answers) and consecutive failed checks.
+"""
+
+STOPPED_HEALTH = HealthSnapshot(HealthStatus.STOPPED, None, None, None, 0)
+
+
+def is_responding(health: HealthSnapshot) -> bool:
+    """
+    Result of the last check as a liveness check: failed unless it answered, but the checks while starting don't
+    count. Meant for RestartWatchdog.report_liveness, which counts the consecutive failures itself, so the DOWN status
+    (which needs down_failures failures) is not used.
+    """
+    return health.status == HealthStatus.STARTING or health.failures == 0
+
+
+class LatencyHistogram(object):
+    """
+    Counts the latencies in fixed buckets, so the percentiles can be estimated without keeping every value.
+    """
+
+    def __init__(self, bounds: Sequence[float]=LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Returns the upper bound of the bucket holding the given fraction (0.5 for the median) of the latencies, or the
+        maximum latency if it is in the overflow bucket; None if empty.
+        """
+        if not self.count:
+            return None
+        target = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+
+    def get_buckets(self) -> List[Tuple[float, int]]:
+        """
+        Returns the non empty buckets as (upper bound, count) tuples; the upper bound of the overflow bucket is
+        infinite.
+        """
+        bounds = self.bounds + (float("inf"),)
+        return [(bounds[x], y) for x, y in enumerate(self.counts) if y]
+
+
+class HealthClient(object):
+    """
+    Checks that the web server of minidlnad answers, requesting every path over the same connection, which is kept
+    open between checks while the server allows it. Not thread safe.
+    """
+
+    def __init__(self, port: int, host: str="127.0.0.1", paths: Sequence[str]=("/", "/rootDesc.xml"),
+                 timeout: float=5.0) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.port = port
+        self.host = host
+        self.paths = tuple(paths)
+        self.timeout = timeout
+        self.connections_opened = 0
+
+        self._connection = None  # type: Optional[http.client.HTTPConnection]
+
+
+    def check(self) -> HealthResult:
+
+        latencies = collections.OrderedDict()  # type: Dict[str, Optional[float]]
+        error = None  # type: Optional[str]
+        for path in self.paths:
+            try:
+                latency, status = self._request(path)
+            except (OSError, http.client.HTTPException) as ex:
+                self.close()
+                latencies[path] = None
+                error = error or "{path}: {error}".format(path=path, error=ex or type(ex).__name__)
+                continue
+            latencies[path] = latency
+            if status >= 500:
+                error = error or "{path}: HTTP {status}".format(path=path, status=status)
+        return HealthResult(error is None, latencies, error)
+
+
+    def _request(self, path: str) -> Tuple[float, int]:
+
+        reused = self._connection is not None and self._connection.sock is not None
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        if not reused:
+            self.connections_opened += 1
+
+        start = time.monotonic()
+        try:
+            self._connection.request("GET", path)
+            response = self._connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            # The server closed the idle connection; try once more with a new one
+            self._logger.debug("Kept-alive connection closed by the server; reconnecting.")
+            self.close()
+            return self._request(path)
+        response.read()
+        return time.monotonic() - start, response.status
+
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
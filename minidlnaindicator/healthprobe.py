@@ -0,0 +1,156 @@
+from typing import Callable, Dict, Optional
+
+import logging
+import threading
+import time
+
+from gi.repository import GLib
+
+from .healthcheck import HealthClient, HealthResult, HealthSnapshot, HealthStatus, LatencyHistogram, STOPPED_HEALTH
+
+
+class HealthProbe(object):
+    """
+    Checks the web server of minidlnad from the GLib main loop, each check in a short-lived worker thread. The
+    interval adapts: every startup_interval seconds until it first answers, then doubling from retry_interval up to
+    ready_interval while it is ready, and every retry_interval seconds while degraded or down. Failures don't count as
+    down until it has been ready or startup_timeout seconds have passed. on_check is called after every check.
+    """
+
+    def __init__(self, on_check: Callable[[HealthSnapshot], None], startup_interval: float=0.5,
+                 retry_interval: int=5, ready_interval: int=30, slow_latency: float=1.0, down_failures: int=3,
+                 startup_timeout: float=60.0) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.on_check = on_check
+        self.startup_interval = startup_interval
+        self.retry_interval = retry_interval
+        self.ready_interval = ready_interval
+        self.slow_latency = slow_latency
+        self.down_failures = down_failures
+        self.startup_timeout = startup_timeout
+
+        self._client = None  # type: Optional[HealthClient]
+        self._generation = 0
+        self._source_id = None  # type: Optional[int]
+        self._checking = False
+        self._started_at = 0.0
+        self._interval = 0.0
+        self._snapshot = STOPPED_HEALTH
+        self._histograms = {}  # type: Dict[str, LatencyHistogram]
+
+
+    @property
+    def snapshot(self) -> HealthSnapshot:
+        return self._snapshot
+
+
+    @property
+    def histograms(self) -> Dict[str, LatencyHistogram]:
+        """
+        Latencies of every path since the process started.
+        """
+        return dict(self._histograms)
+
+
+    def start(self, port: int) -> None:
+        self.stop()
+        self._generation += 1
+        self._checking = False
+        self._client = HealthClient(port)
+        self._started_at = time.monotonic()
+        self._histograms = {x: LatencyHistogram() for x in self._client.paths}
+        self._snapshot = HealthSnapshot(HealthStatus.STARTING, None, None, None, 0)
+        self._interval = self.startup_interval
+        self._on_timeout()
+
+
+    def _schedule(self) -> None:
+        self._source_id = GLib.timeout_add(int(self._interval * 1000), self._on_timeout)
+
+
+    def _on_timeout(self) -> bool:
+        # The next check is scheduled when this one finishes
+        self._source_id = 0
+        self._checking = True
+        threading.Thread(target=self._check_worker, args=(self._client, self._generation), daemon=True).start()
+        return False
+
+
+    def _check_worker(self, client: HealthClient, generation: int) -> None:
+        try:
+            result = client.check()
+        except Exception as ex:
+            self._logger.exception("Error checking the web server: %s", ex)
+            result = HealthResult(False, {}, str(ex))
+        GLib.idle_add(self._on_checked, client, result, generation)
+
+
+    def _on_checked(self, client: HealthClient, result: HealthResult, generation: int) -> bool:
+
+        if generation != self._generation or self._source_id is None:
+            # Stopped (or started again) meanwhile
+            client.close()
+            if client is self._client:
+                self._checking = False
+                self._client = None
+            return False
+        self._checking = False
+
+        for path, latency in result.latencies.items():
+            if latency is not None:
+                self._histograms[path].add(latency)
+        self._update_snapshot(result)
+        self._schedule()
+        self.on_check(self._snapshot)
+        return False
+
+
+    def _update_snapshot(self, result: HealthResult) -> None:
+
+        previous = self._snapshot
+        status = previous.status
+        time_to_ready = previous.time_to_ready
+        failures = 0 if result.ok else previous.failures + 1
+        latency = max((x for x in result.latencies.values() if x is not None), default=None)
+
+        if result.ok and time_to_ready is None:
+            time_to_ready = time.monotonic() - self._started_at
+            self._logger.info("MiniDLNA web server ready in %.2f seconds.", time_to_ready)
+
+        if result.ok:
+            status = HealthStatus.DEGRADED if latency > self.slow_latency else HealthStatus.READY
+        elif time_to_ready is None and time.monotonic() - self._started_at < self.startup_timeout:
+            status = HealthStatus.STARTING
+        elif failures >= self.down_failures:
+            status = HealthStatus.DOWN
+        else:
+            status = HealthStatus.DEGRADED
+
+        if status == HealthStatus.STARTING:
+            self._interval = self.startup_interval
+        elif status == HealthStatus.READY:
+            self._interval = min(self.ready_interval, max(self.retry_interval, self._interval * 2))
+        else:
+            self._interval = self.retry_interval
+
+        if status != previous.status:
+            self._logger.log(
+                logging.WARNING if status in (HealthStatus.DEGRADED, HealthStatus.DOWN) else logging.INFO,
+                "MiniDLNA web server %s (%s).", status.value, result.error or "latency {0:.3f} s".format(latency)
+            )
+
+        slowest = max(self._histograms.values(), key=lambda x: x.percentile(0.95) or 0.0)
+        self._snapshot = HealthSnapshot(status, time_to_ready, slowest.percentile(0.5), slowest.percentile(0.95), failures)
+
+
+    def stop(self) -> None:
+        if self._source_id:
+            GLib.source_remove(self._source_id)
+        self._source_id = None
+        self._snapshot = STOPPED_HEALTH
+        # Otherwise, closed once the running check finishes
+        if self._client and not self._checking:
+            self._client.close()
+            self._client = None
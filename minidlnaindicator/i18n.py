@@ -0,0 +1,9 @@
+
+import gettext
+
+from .constants import APPINDICATOR_ID, LOCALE_DIR
+
+
+# Loaded once and shared by all the modules
+translation = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True)
+_ = translation.gettext
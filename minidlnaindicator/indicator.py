@@ -1,19 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 
-from typing import List, Optional
+from typing import Callable, Dict, Hashable, List, Optional, Set
 
+import collections
 import dbus
-from dbus.service import Object
 from dbus.mainloop.glib import DBusGMainLoop
-import distro
-import getpass
 import logging
 import logging.config
 import os
 import shutil
-import signal
+import re
 import subprocess
+import threading
 import time
 
 import gi
@@ -23,25 +22,50 @@ gi.require_version('Notify', '0.7')
 from gi.repository import Gtk, AppIndicator3, Notify, GLib, GObject
 
 
-from .minidlnaconfig import MiniDLNAConfig
-from .constants import LOCALE_DIR, APPINDICATOR_ID, MINIDLNA_CONFIG_FILE, \
-    MINIDLNA_ICON_GREY, MINIDLNA_ICON_GREEN, APP_DBUS_PATH, APP_DBUS_DOMAIN
+from .minidlnaconfig import MiniDLNAConfig, MiniDLNAConfigSnapshot
+from .indicatorstate import StateStore, IndicatorState, RunnerPhase
+from .dirprobe import DirectoryProber
+from .constants import APPINDICATOR_ID, MINIDLNA_CONFIG_FILE, \
+    MINIDLNA_ICON_GREY, MINIDLNA_ICON_GREEN, APP_DBUS_PATH, APP_DBUS_DOMAIN, \
+    STATE_RENDER_DELAY_MS, MINIDLNA_MANIFEST_FILE
 from .indicatorconfig import MiniDLNAIndicatorConfig
 from .processrunner import ProcessRunner
+from .supervisor import ProcessSupervisor
+from .profiles import MiniDLNAProfile
 from .processlistener import ProcessListener
+from .processwait import StopOutcome, StopResult
+from .resourcemonitor import ResourceMonitor, ResourceThresholds, ResourceAlert
+from .procstats import ResourceSample
+from .statusinterface import StatusInterface, get_sample_values
+from .orphans import free_port_from_orphans
+from .watchdog import RestartWatchdog
+from .watchdogstatus import RestartAction, CircuitState, WatchdogStatus
+from .healthcheck import HealthSnapshot, HealthStatus, STOPPED_HEALTH, is_responding
+from .healthprobe import HealthProbe
 from .ui.utils_ui import msgconfirm, msgbox, MessageTypeEnum
-from .fsmonitor import FSMonitorThread
+from .ui.menubackend import GtkMenuBackend
+from .menumodel import MenuModel, MenuRow
+from .menurows import build_menu_rows, format_duration, format_health, format_size
+from .fsmonitor import FSMonitor
 from .fslistener import FSListener
+from .configwatcher import ConfigWatcher
+from .configlistener import ConfigListener
+from .logfollower import LogFollower
+from .loglistener import LogListener
+from .logevents import LogEvent, LogEventType
+from .manifest import ReindexPlanner, StartDecision, StartPlan
+from .dbstats import LibraryStatsReader, LibraryStatsMonitor, get_db_path
+from .librarystats import EMPTY_STATS
+from .mounttable import MountPoint
 from .exceptions.alreadyrunning import AlreadyRunningException
-from .update_check_thread import UpdateCheckThread
+from .update_check_thread import UpdateChecker
 from .update_check_listener import UpdateCheckListener
 from .version import __version__ as module_version
 
-import gettext
-_ = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True).gettext
+from .i18n import _
 
 
-class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener):
+class MiniDLNAIndicator(StatusInterface, ProcessListener, FSListener, ConfigListener, LogListener, UpdateCheckListener):
 
     def __init__(self, config: MiniDLNAIndicatorConfig, test_mode: bool) -> None:
 
@@ -65,93 +89,164 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
 
         self.config = config
         self.test_mode = test_mode
+        # Creates the autostart entry the first time (nothing is written if it is up to date)
+        self.config.sync_xdg_autostart()
 
         self.indicator = AppIndicator3.Indicator.new(APPINDICATOR_ID, MINIDLNA_ICON_GREY, AppIndicator3.IndicatorCategory.APPLICATION_STATUS)
         self.indicator.set_status(AppIndicator3.IndicatorStatus.ACTIVE)
 
         self.minidlna_config = MiniDLNAConfig(self, MINIDLNA_CONFIG_FILE)
-        self.minidlna_path = None  # type: Optional[str]
+        self.prober = DirectoryProber(lambda: self.store.update(dir_status=self.prober.results))
+
+        self.store = StateStore(
+            IndicatorState(
+                phase=RunnerPhase.STOPPED,
+                pid=0,
+                minidlna_path=None,
+                update_available=None,
+                mounts=(),
+                config=self.minidlna_config.snapshot,
+                dir_status=self.prober.results,
+                scanning=None,
+                scanned_files=None,
+                file_errors=0,
+                clients=frozenset(),
+                library=EMPTY_STATS,
+                start_plan=None,
+                profiles=(),
+                started_at=None,
+                start_count=0,
+                last_exit_code=None,
+                resources=(),
+                watchdog=WatchdogStatus(CircuitState.CLOSED, 0, (), False),
+                health=STOPPED_HEALTH,
+            ),
+            lambda render: GLib.timeout_add(STATE_RENDER_DELAY_MS, render)
+        )
+        self.store.subscribe(self.render)
 
         # Build menu items
 
         self.menu = Gtk.Menu()
         self.indicator.set_menu(self.menu)
 
-        if distro.id() in ["fedora", "centos", "rhel", "ubuntu", "mint"]:
-            self.detect_menuitem = Gtk.MenuItem(_("MiniDLNA not installed; click here to install"))
-            self.detect_menuitem.connect('activate', lambda _: self.detect_minidlna(auto_start=True, ask_for_install=True))
-        else:
-            self.detect_menuitem = Gtk.MenuItem(_("MiniDLNA not installed; click here to show how to install"))
-            self.detect_menuitem.connect('activate', lambda _: self.run_xdg_open(None, "https://github.com/okelet/minidlnaindicator"))
-
-        self.start_menuitem = Gtk.MenuItem(_("Start MiniDLNA"))
-        self.start_menuitem.connect('activate', lambda _: self.start_minidlna())
-
-        self.start_reindex_menuitem = Gtk.MenuItem(_("Start and reindex MiniDLNA"))
-        self.start_reindex_menuitem.connect('activate', lambda _: self.start_minidlna(True))
-
-        self.restart_menuitem = Gtk.MenuItem(_("Restart MiniDLNA"))
-        self.restart_menuitem.connect('activate', lambda _: self.restart_minidlna())
-
-        self.restart_reindex_menuitem = Gtk.MenuItem(_("Restart and reindex MiniDLNA"))
-        self.restart_reindex_menuitem.connect('activate', lambda _: self.restart_minidlna(True))
-
-        self.stop_menuitem = Gtk.MenuItem(_("Stop MiniDLNA"))
-        self.stop_menuitem.connect('activate', lambda _: self.stop_minidlna())
-
-        self.weblink_menuitem = Gtk.MenuItem(_("Web interface (port {port})").format(port=self.minidlna_config.port))
-        self.weblink_menuitem.connect('activate', self.on_weblink_menuitem_activated)
-
-        self.showlog_menuitem = Gtk.MenuItem(_("Show MiniDLNA LOG"))
-        self.showlog_menuitem.connect('activate', self.on_showlog_menuitem_activated)
-
-        self.editconfig_menuitem = Gtk.MenuItem(_("Edit MiniDLNA configuration"))
-        self.editconfig_menuitem.connect('activate', self.on_editconfig_menuitem_activated)
-
-        self.indicator_startup_menuitem = Gtk.CheckMenuItem(_("Autostart indicator"))
-        self.indicator_startup_menuitem.connect('activate', self.indicator_startup_menuitem_toggled)
-        self.indicator_startup_menuitem.set_active(self.config.auto_start)
-
-        self.update_available = None
-        self.new_version_menuitem = Gtk.MenuItem(_("A new version of MiniDLNA has been detected; click here to show how to upgrade"))
-        self.new_version_menuitem.connect('activate', self.run_xdg_open, "https://github.com/okelet/minidlnaindicator")
-
-        self.minidlna_help_menuitem = Gtk.MenuItem(_("MiniDLNA help"))
-        self.minidlna_help_menuitem.connect('activate', self.run_xdg_open, "https://help.ubuntu.com/community/MiniDLNA")
-
-        self.indicator_help_menuitem = Gtk.MenuItem(_("MiniDLNA Indicator help"))
-        self.indicator_help_menuitem.connect('activate', self.run_xdg_open, "https://github.com/okelet/minidlnaindicator")
-
-        self.item_quit = Gtk.MenuItem(_("Quit"))
-        self.item_quit.connect('activate', self.quit)
-
-        self.runner = ProcessRunner()
+        self.menu_model = MenuModel(GtkMenuBackend(self.menu, self.on_menu_activated))
+
+        self._can_install_minidlna = None  # type: Optional[bool]
+
+        self.menu_actions = {
+            "install": lambda row: self.detect_minidlna(auto_start=True, ask_for_install=True),
+            "start": lambda row: self.start_minidlna(user_request=True),
+            "start_reindex": lambda row: self.start_minidlna(True, user_request=True),
+            "restart": lambda row: self.restart_minidlna(user_request=True),
+            "restart_reindex": lambda row: self.restart_minidlna(True, user_request=True),
+            "stop": lambda row: self.stop_minidlna(),
+            "weblink": lambda row: self.run_xdg_open(None, "http://localhost:{port}".format(port=self.minidlna_config.port)),
+            "open": lambda row: self.run_xdg_open(None, row.data),
+            "showlog": lambda row: self.run_xdg_open(None, self.minidlna_config.log),
+            "editconfig": lambda row: self.run_xdg_open(None, MINIDLNA_CONFIG_FILE),
+            "profile_start": lambda row: self.profiles[row.data].start(self.minidlna_path),
+            "profile_stop": lambda row: self.profiles[row.data].stop(),
+            "autostart": self.on_autostart_toggled,
+            "quit": lambda row: self.quit(None),
+        }  # type: Dict[str, Callable[[MenuRow], None]]
+
+        self.planner = ReindexPlanner(MINIDLNA_MANIFEST_FILE)
+        self.manifest_lock = threading.Lock()
+        self.rescan_supported = None  # type: Optional[bool]
+        # Set while minidlnad scans, as the manifest is only valid once the scan finishes; the trees are those walked
+        # before starting it, if any
+        self.scan_pending = False
+        self.pending_trees = None  # type: Optional[dict]
+        self.scan_started = None  # type: Optional[float]
+        self.scanned_dirs = 0
+
+        # A single thread watches the processes of all the profiles
+        self.supervisor = ProcessSupervisor()
+        self.runner = ProcessRunner(grace_period=self.config.stop_grace_period, supervisor=self.supervisor)
+        self.output_matches = set()  # type: Set[str]
         self.runner.add_listener(self)
 
-        self.rebuild_menu()
+        self.profiles = collections.OrderedDict()  # type: Dict[str, MiniDLNAProfile]
+        reserved_ports = {self.minidlna_config.port}
+        for name in self.config.profiles:
+            try:
+                profile = MiniDLNAProfile(
+                    name, self.supervisor, self.on_profile_changed, self.config.stop_grace_period, reserved_ports
+                )
+            except Exception as ex:
+                self.logger.exception("Error loading the profile %s: %s", name, ex)
+                continue
+            reserved_ports.add(profile.config.port)
+            self.profiles[name] = profile
+        self.on_profile_changed(None)
 
         # Init notifications before running minidlna
         Notify.init(APPINDICATOR_ID)
 
         # FS Monitor
-        self.fs_monitor = FSMonitorThread()
+        self.fs_monitor = FSMonitor()
         self.fs_monitor.add_listener(self)
         self.fs_monitor.start()
 
+        # Config watcher
+        self.config_watcher = ConfigWatcher(self.minidlna_config)
+        self.config_watcher.add_listener(self)
+        self.config_watcher.start()
+
+        # Log follower
+        self.log_follower = LogFollower(self.minidlna_config.log)
+        self.log_follower.add_listener(self)
+        self.log_follower.start()
+
+        # Library stats
+        self.library_stats = LibraryStatsMonitor(
+            LibraryStatsReader(
+                get_db_path(self.minidlna_config.snapshot.options.get("db_dir")),
+                [x.path for x in self.minidlna_config.dirs]
+            ),
+            lambda stats: self.store.update(library=stats)
+        )
+
+        # Resources used by minidlnad
+        self.resource_monitor = ResourceMonitor(
+            lambda sample: self.store.update(resources=tuple(self.resource_monitor.history)),
+            self.on_resource_alert,
+            ResourceThresholds(self.config.max_rss_mb * 1024 * 1024, self.config.max_cpu_percent, self.config.cpu_alert_seconds)
+        )
+
+        # Automatic restarts when minidlnad fails or stops responding
+        self.watchdog = RestartWatchdog(
+            self.restart_after_failure,
+            lambda: self.restart_minidlna(),
+            lambda status: self.store.update(watchdog=status),
+            rules={int(x): RestartAction(y) for x, y in self.config.restart_rules.items()},
+            enabled=self.config.auto_restart,
+            max_failures=self.config.restart_max_failures,
+            window=self.config.restart_window_seconds,
+        )
+
+        # Checks that the web server answers; the process may be alive but hung
+        self.health_probe = HealthProbe(self.on_health_checked)
+
         # Update check
-        self.update_checker = UpdateCheckThread(self.config, "minidlnaindicator", module_version, self.test_mode)
+        self.update_checker = UpdateChecker(self.config, "minidlnaindicator", module_version, self.test_mode)
         self.update_checker.add_listener(self)
         self.update_checker.start()
 
-        # Detect minidlna and rebuild menu
+        # Detect minidlna; the menu items are built once the main loop runs, so the icon is shown first
         self.detect_minidlna()
+        self.store.request_render()
 
 
     def run(self):
 
         if self.minidlna_path:
             self.logger.debug("Startup: Auto-Starting MiniDLNA...")
-            self.runner.start(self.get_minidlna_command())
+            self.start_minidlna()
+            for profile in self.profiles.values():
+                self.logger.debug("Startup: Auto-Starting MiniDLNA profile %s...", profile.name)
+                profile.start(self.minidlna_path)
         else:
             self.logger.debug("Startup: NOT Auto-Starting MiniDLNA because not found.")
             self.show_notification(
@@ -168,7 +263,21 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
             self.quit(None)
 
 
-    def get_minidlna_command(self, reindex: bool=False) -> List[str]:
+    @property
+    def minidlna_path(self) -> Optional[str]:
+        return self.store.state.minidlna_path
+
+
+    @property
+    def can_install_minidlna(self) -> bool:
+        # Only needed (and the distribution only detected) when MiniDLNA is not installed
+        if self._can_install_minidlna is None:
+            from .packagekit import can_install_packages
+            self._can_install_minidlna = can_install_packages()
+        return self._can_install_minidlna
+
+
+    def get_minidlna_command(self, reindex: bool=False, rescan: bool=False) -> List[str]:
 
         if self.minidlna_path:
 
@@ -180,6 +289,8 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
             ]
             if reindex:
                 command.append("-R")
+            elif rescan:
+                command.append("-r")
             return command
 
         else:
@@ -190,100 +301,52 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
         Notify.Notification.new(
             title,
             message,
-            MINIDLNA_ICON_GREEN if self.runner.is_running() else MINIDLNA_ICON_GREY
+            MINIDLNA_ICON_GREEN if self.store.state.phase == RunnerPhase.RUNNING else MINIDLNA_ICON_GREY
         ).show()
 
 
-    """
-    def on_config_file_change(self, event):
-        if event.src_path == MINIDLNA_CONFIG_FILE:
-            if self.minidlna_pid:
-                self.show_notification(
-                    _("Configuration changed"),
-                    _("A change in the MiniDLNA configuration has been detected; you should restart MiniDLNA to reflect these changes.")
-                )
-            else:
-                self.minidlna_config.reload_config()
-                GLib.idle_add(self.rebuild_menu)
-    """
+    def render(self, previous: Optional[IndicatorState], state: IndicatorState) -> None:
 
-    def rebuild_menu(self) -> None:
-
-        for item in self.menu.get_children():
-            self.menu.remove(item)
-
-        if self.minidlna_path:
-
-            self.start_menuitem.set_sensitive(not self.runner.is_running())
-            self.menu.append(self.start_menuitem)
-
-            self.start_reindex_menuitem.set_sensitive(not self.runner.is_running())
-            self.menu.append(self.start_reindex_menuitem)
-
-            self.restart_menuitem.set_sensitive(self.runner.is_running())
-            self.menu.append(self.restart_menuitem)
-
-            self.restart_reindex_menuitem.set_sensitive(self.runner.is_running())
-            self.menu.append(self.restart_reindex_menuitem)
-
-            self.stop_menuitem.set_sensitive(self.runner.is_running())
-            self.menu.append(self.stop_menuitem)
-
-            self.weblink_menuitem.set_sensitive(self.runner.is_running())
-            self.menu.append(self.weblink_menuitem)
-
-        else:
-
-            self.menu.append(self.detect_menuitem)
-
-        self.menu.append(Gtk.SeparatorMenuItem())
-
-        if self.minidlna_config.dirs:
-
-            for minidlna_dir in self.minidlna_config.dirs:
-                display_type = "[" + minidlna_dir.description + "] "
-                dir_menuitem = Gtk.MenuItem("{display_type}{path}".format(display_type=display_type, path=minidlna_dir.path))
-                dir_menuitem.connect('activate', self.run_xdg_open, minidlna_dir.path)
-                if not minidlna_dir.accessable:
-                    dir_menuitem.set_sensitive(False)
-                    dir_menuitem.set_tooltip_text(_("Directory does not exist"))
-                self.menu.append(dir_menuitem)
-
-        else:
-            nodirs_menuitem = Gtk.MenuItem(_("No media folders specified; please, edit the configuration."))
-            nodirs_menuitem.set_sensitive(False)
-            self.menu.append(nodirs_menuitem)
+        # Green once the web server answers, not as soon as the process starts
+        serving = state.phase == RunnerPhase.RUNNING and state.health.status in (HealthStatus.READY, HealthStatus.DEGRADED)
+        if not previous or previous.phase != state.phase or previous.health.status != state.health.status:
+            self.indicator.set_icon_full(
+                MINIDLNA_ICON_GREEN if serving else MINIDLNA_ICON_GREY, format_health(state.health) if serving else ""
+            )
 
-        self.menu.append(Gtk.SeparatorMenuItem())
-        self.menu.append(self.showlog_menuitem)
-        self.menu.append(self.editconfig_menuitem)
-        self.menu.append(Gtk.SeparatorMenuItem())
-        self.menu.append(self.indicator_startup_menuitem)
-        self.menu.append(Gtk.SeparatorMenuItem())
-        if self.update_available:
-            self.menu.append(self.new_version_menuitem)
-        self.menu.add(self.minidlna_help_menuitem)
-        self.menu.add(self.indicator_help_menuitem)
-        self.menu.append(self.item_quit)
+        # Only schedules the checks of the directories without a valid status; the results trigger another render
+        self.prober.probe(x.path for x in state.config.dirs)
+        self.rebuild_menu()
+        self.notify_state_changed(state)
 
-        self.menu.show_all()
+        if not previous:
+            return
 
+        if state.update_available and state.update_available != previous.update_available:
+            self.show_notification(
+                title=_("Update available"),
+                message=_("A new version ({new_version}) of the application has been released.").format(new_version=state.update_available)
+            )
 
-    def on_weblink_menuitem_activated(self, menu_item: Gtk.MenuItem) -> None:
-        self.run_xdg_open(menu_item, "http://localhost:{port}".format(port=self.minidlna_config.port))
+        if state.config is not previous.config and state.phase == RunnerPhase.RUNNING:
+            self.show_notification(
+                _("Configuration changed"),
+                _("A change in the MiniDLNA configuration has been detected; you should restart MiniDLNA to reflect these changes.")
+            )
 
 
-    def on_showlog_menuitem_activated(self, menu_item: Gtk.MenuItem) -> None:
-        self.run_xdg_open(menu_item, self.minidlna_config.log)
+    def rebuild_menu(self) -> None:
+        self.menu_model.reconcile(build_menu_rows(self.store.state, self.config.auto_start, self.can_install_minidlna))
 
 
-    def on_editconfig_menuitem_activated(self, menu_item: Gtk.MenuItem) -> None:
-        self.run_xdg_open(menu_item, MINIDLNA_CONFIG_FILE)
+    def on_menu_activated(self, key: Hashable) -> None:
+        self.menu_model.activate(key, lambda row: self.menu_actions[row.action](row) if row.action else None)
 
 
-    def indicator_startup_menuitem_toggled(self, _: Gtk.MenuItem) -> None:
-        self.config.auto_start = self.indicator_startup_menuitem.get_active()
+    def on_autostart_toggled(self, _row: MenuRow) -> None:
+        self.config.auto_start = not self.config.auto_start
         self.config.save(reason="Auto start changed from indicator menu")
+        self.rebuild_menu()
 
 
     #################################################################################################################
@@ -291,71 +354,97 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
     #################################################################################################################
 
     def on_process_starting(self) -> None:
-        GLib.idle_add(lambda: self.indicator.set_icon_full(MINIDLNA_ICON_GREY, ""))
-        GLib.idle_add(lambda: self.start_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.start_reindex_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.restart_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.restart_reindex_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.stop_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.weblink_menuitem.set_sensitive(False))
+        self.output_matches = set()
+        self.store.update(
+            phase=RunnerPhase.STARTING, pid=0, scanning=None, scanned_files=None, file_errors=0, clients=frozenset()
+        )
 
 
     def on_process_started(self, pid: int) -> None:
-        GLib.idle_add(lambda: self.indicator.set_icon_full(MINIDLNA_ICON_GREEN, ""))
-        GLib.idle_add(lambda: self.start_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.start_reindex_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.restart_menuitem.set_sensitive(True))
-        GLib.idle_add(lambda: self.restart_reindex_menuitem.set_sensitive(True))
-        GLib.idle_add(lambda: self.stop_menuitem.set_sensitive(True))
-        GLib.idle_add(lambda: self.weblink_menuitem.set_sensitive(True))
+        self.store.update(
+            phase=RunnerPhase.RUNNING, pid=pid, started_at=time.monotonic(), start_count=self.store.state.start_count + 1
+        )
+        self.library_stats.set_enabled(True)
+        self.resource_monitor.set_pid(pid)
+        self.watchdog.process_started()
+        self.health_probe.start(self.minidlna_config.port)
+        self.scan_started = time.monotonic()
+        self.scanned_dirs = 0
+        plan = self.store.state.start_plan
+        if plan and plan.trees is not None and not self.scan_pending:
+            # Nothing to scan, so the database matches the trees already
+            self.update_manifest(plan.trees)
+
+
+    def on_process_output_matched(self, matcher: str, line: str) -> None:
+        self.logger.debug("MiniDLNA printed a known message (%s): %s", matcher, line)
+        self.output_matches.add(matcher)
+        if matcher == "inotify_limit":
+            self.show_notification(
+                _("MiniDLNA can't watch all the folders"),
+                _("The inotify watch limit has been reached; changes in some folders won't be detected until MiniDLNA is reindexed.")
+            )
 
 
     def on_process_finished(self, command: str, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str]) -> None:
 
-        GLib.idle_add(lambda: self.indicator.set_icon_full(MINIDLNA_ICON_GREY, ""))
-        GLib.idle_add(lambda: self.start_menuitem.set_sensitive(True))
-        GLib.idle_add(lambda: self.start_reindex_menuitem.set_sensitive(True))
-        GLib.idle_add(lambda: self.restart_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.restart_reindex_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.stop_menuitem.set_sensitive(False))
-        GLib.idle_add(lambda: self.weblink_menuitem.set_sensitive(False))
+        stop_requested = self.store.state.phase == RunnerPhase.STOPPING
+        self.store.update(phase=RunnerPhase.STOPPED, pid=0, started_at=None, last_exit_code=exit_code)
+        self.library_stats.set_enabled(False)
+        self.resource_monitor.set_pid(0)
+        self.health_probe.stop()
+        self.store.update(health=STOPPED_HEALTH)
+
+        # While minidlnad runs it follows the changes through inotify, so after a clean stop the database is up to
+        # date, unless the watch limit was reached or the scan didn't finish
+        if stop_requested and self.config.smart_reindex:
+            if "inotify_limit" in self.output_matches:
+                with self.manifest_lock:
+                    self.planner.forget()
+            elif not self.scan_pending:
+                threading.Thread(target=self.update_manifest, daemon=True).start()
+
+        if stop_requested:
+            self.watchdog.process_stopped()
+            return
 
-        if exit_code != 0:
+        if exit_code != 0 and self.config.enable_orphan_process_killer and "bind_http" in self.output_matches:
+            # Stopping the orphans may take the whole grace period, so it is done in a worker thread
+            threading.Thread(
+                target=self.free_port, args=(command, pid, exit_code, std_out, std_err), daemon=True
+            ).start()
+            return
 
-            if self.config.enable_orphan_process_killer and ("error: bind(http):" in std_out or "error: bind(http):" in std_err):
-                self.logger.warning("Address already in use error message detected; we will try to kill existing orphan process for the same user and start minidlna again.")
-                try:
-                    pids_str = subprocess.check_output(["pgrep", "-U", getpass.getuser(), "minidlnad"], universal_newlines=True)
-                    if pids_str:
-                        pids = [x for x in pids_str.split("\n") if x]
-                        if len(pids) == 1:
-                            # If only 1 old orphan process found, kill it
-                            self.logger.warning("Killing orphan minidlna process: %s", pids[0])
-                            os.kill(int(pids[0]), signal.SIGTERM)
-                            # Wait to finish
-                            killed = False
-                            finish_time = time.time() + 5
-                            while time.time() < finish_time:
-                                try:
-                                    os.kill(int(pids[0]), 0)
-                                    time.sleep(0.2)
-                                except OSError:
-                                    killed = True
-                                    break
-                            if killed:
-                                self.logger.info("Orphan minidlna process with pid %s killed, starting again minidlna with command %s.", pids[0], command)
-                                self.runner.start(command, ignore_running=True)
-                                return
-                            else:
-                                self.logger.error("Orphan minidlna process with pid %s couldn't be killed.", pids[0])
-                        elif len(pids) > 1:
-                            self.logger.error("Multiple (%s) process found minidlna.", len(pids))
-                        else:
-                            # No process found for minidlna for the current user; perhaps there is another process using the same port
-                            pass
-                except Exception as ex:
-                    self.logger.exception("Error while detecting existing minidlna process: %s", ex)
+        self.on_process_failed(pid, exit_code, std_out, std_err, _("exit code {code}").format(code=exit_code), None)
+
+
+    def free_port(self, command: List[str], pid: int, exit_code: int, std_out: Optional[str],
+                  std_err: Optional[str]) -> None:
+        # Restarted even if the automatic restarts are disabled, but through the watchdog limits
+        action = RestartAction.RESTART if free_port_from_orphans(
+            MINIDLNA_CONFIG_FILE, self.minidlna_config.port, self.config.stop_grace_period,
+            executable=os.path.basename(command[0])
+        ) else RestartAction.STOP
+        reason = _("port {port} in use").format(port=self.minidlna_config.port)
+        GLib.idle_add(self.on_process_failed, pid, exit_code, std_out, std_err, reason, action)
 
+
+    def on_process_failed(self, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str], reason: str,
+                          action: Optional[RestartAction]) -> bool:
+
+        if self.runner.is_running() or self.store.state.phase != RunnerPhase.STOPPED:
+            # Started again by the user while the orphans were stopped
+            return False
+
+        delay = self.watchdog.process_exited(exit_code, reason, action)
+        if delay is not None and self.watchdog.status.circuit == CircuitState.CLOSED:
+            self.logger.warning(
+                "MiniDLNA has exited unexpectedly (PID: %s, return code: %s); restarting it in %.1f seconds.",
+                pid, exit_code, delay
+            )
+            return False
+
+        if exit_code != 0:
             text = ""
             if std_out and std_err:
                 text = std_out + "\n" + std_err
@@ -371,48 +460,110 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
                 title=_("MiniDLNA error"),
                 message=_("MiniDLNA has exited with a code {code} and this text {text}.".format(code=exit_code, text=text))
             )
+        if self.watchdog.status.circuit == CircuitState.OPEN:
+            self.show_notification(
+                _("MiniDLNA keeps failing"),
+                _("MiniDLNA has failed {count} times in a short time; it won't be restarted automatically for a while.").format(
+                    count=self.config.restart_max_failures
+                )
+            )
+        return False
+
+
+    def restart_after_failure(self) -> None:
+        if self.runner.is_running() or self.store.state.phase != RunnerPhase.STOPPED:
+            # Started by the user meanwhile
+            return
+        self.logger.info("Restarting MiniDLNA after a failure (restart %s).", self.watchdog.status.restarts)
+        self.start_minidlna()
 
 
     def on_process_error(self, reason: str) -> None:
+        self.store.update(phase=RunnerPhase.STOPPED, pid=0)
         self.show_notification(
             _("Error running MiniDLNA"),
             reason
         )
 
 
-    def on_fs_changed(self, new_filesystems: List[str]) -> None:
-        self.logger.debug("Recevived notification of FS changed: %s.", new_filesystems)
-        GLib.idle_add(self._on_fs_changed)
+    def on_health_checked(self, health: HealthSnapshot) -> None:
+        self.store.update(health=health)
+        self.watchdog.report_liveness(is_responding(health))
 
 
-    def _on_fs_changed(self) -> None:
-        self.rebuild_menu()
+    def on_resource_alert(self, alert: ResourceAlert, sample: ResourceSample) -> None:
+        if alert == ResourceAlert.HIGH_MEMORY:
+            message = _("MiniDLNA is using {memory} of memory.").format(memory=format_size(sample.rss_bytes))
+        else:
+            message = _("MiniDLNA has been using {cpu:.0f}% of CPU for more than {duration}.").format(
+                cpu=sample.cpu_percent, duration=format_duration(self.config.cpu_alert_seconds)
+            )
+        self.show_notification(_("MiniDLNA resource alert"), message)
+        self.ResourceAlert(alert.value, get_sample_values(sample))
+
+
+    def on_profile_changed(self, _profile: Optional[MiniDLNAProfile]) -> None:
+        self.store.update(profiles=tuple(x.status for x in self.profiles.values()))
+
+
+    def on_fs_changed(self, added: List[MountPoint], removed: List[MountPoint]) -> None:
+        self.logger.debug("Recevived notification of FS changed; added: %s, removed: %s.", added, removed)
+        self.prober.invalidate()
+        self.store.update(mounts=tuple(self.fs_monitor.mount_table.mountpoints))
+
+
+    def on_config_changed(self, snapshot: MiniDLNAConfigSnapshot) -> None:
+        self.logger.debug("Recevived notification of config changed.")
+        self.store.update(config=snapshot)
+        self.log_follower.follow(snapshot.log)
+        self.library_stats.configure(get_db_path(snapshot.options.get("db_dir")), [x.path for x in snapshot.dirs])
+
+
+    def on_log_event(self, event: LogEvent) -> None:
+
+        # Called from the main loop, so the read-modify-write of the state is safe
+        state = self.store.state
+        if event.type == LogEventType.SCAN_STARTED:
+            self.library_stats.set_scanning(True)
+            self.resource_monitor.set_scanning(True)
+            self.store.update(scanning=event.path)
+        elif event.type == LogEventType.SCAN_FINISHED:
+            self.library_stats.set_scanning(False)
+            self.resource_monitor.set_scanning(False)
+            self.store.update(scanning=None, scanned_files=(state.scanned_files or 0) + event.count)
+            self.scanned_dirs += 1
+            plan = state.start_plan
+            dir_count = len(self.pending_trees) if self.pending_trees is not None else len(state.config.dirs)
+            if plan and self.scan_pending and self.scanned_dirs >= dir_count:
+                with self.manifest_lock:
+                    self.planner.record_scan(plan.decision, time.monotonic() - self.scan_started)
+                trees, self.pending_trees, self.scan_pending = self.pending_trees, None, False
+                if trees is None and self.config.smart_reindex:
+                    # Requested by the user, so the directories haven't been walked; don't block the main loop
+                    threading.Thread(target=self.update_manifest, daemon=True).start()
+                elif trees is not None:
+                    self.update_manifest(trees)
+        elif event.type == LogEventType.FILE_ERROR:
+            self.logger.debug("MiniDLNA couldn't read a file: %s", event.message)
+            self.store.update(file_errors=state.file_errors + 1)
+        elif event.type == LogEventType.CLIENT_CONNECTION:
+            self.store.update(clients=state.clients | {event.client})
+        elif event.type == LogEventType.INOTIFY_WARNING and "inotify_limit" not in self.output_matches:
+            self.on_process_output_matched("inotify_limit", event.message)
 
 
     def on_update_detected(self, new_version: str) -> None:
         self.logger.debug("Recevived notification of update detected; new version: %s.", new_version)
-        GLib.idle_add(self._on_update_detected, new_version)
-
-
-    def _on_update_detected(self, new_version: str) -> None:
-        if not self.update_available or self.update_available != new_version:
-            self.update_available = new_version
-            self.rebuild_menu()
-            self.show_notification(
-                title=_("Update available"),
-                message=_("A new version ({new_version}) of the application has been released.").format(new_version=new_version)
-            )
+        self.store.update(update_available=new_version)
 
 
     def detect_minidlna(self, auto_start: bool=False, ask_for_install: bool=False) -> None:
 
         prev_path = self.minidlna_path
-        self.minidlna_path = shutil.which("minidlnad")
+        self.store.update(minidlna_path=shutil.which("minidlnad"))
         if prev_path == self.minidlna_path and self.minidlna_path:
             return
 
-        self.rebuild_menu()
-
         if not self.minidlna_path:
 
             if ask_for_install and msgconfirm(
@@ -421,20 +572,17 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
                     parent=None
             ) == Gtk.ResponseType.YES:
 
+                from .packagekit import install_package_names
+
                 try:
 
-                    proxy = self.session_bus.get_object('org.freedesktop.PackageKit', '/org/freedesktop/PackageKit')
-                    iface = dbus.Interface(proxy, 'org.freedesktop.PackageKit.Modify')
-                    self.logger.debug("Calling InstallPackageNames DBUS method...")
-                    iface.InstallPackageNames(dbus.UInt32(0), ["minidlna"], "show-confirm-search,hide-finished")
-                    self.logger.debug("InstallPackageNames returned.")
+                    install_package_names(self.session_bus, ["minidlna"])
 
                     # Ubuntu waits until installation is finished, but Fedora returns from the dbus method inmediate.
                     # We check if installed (usually Ubuntu), and if not, notify the user to re-detect minidlna after
                     # installation (usually Fedora).
-                    self.minidlna_path = shutil.which("minidlnad")
+                    self.store.update(minidlna_path=shutil.which("minidlnad"))
                     if self.minidlna_path:
-                        self.rebuild_menu()
                         if auto_start:
                             self.start_minidlna()
                     else:
@@ -463,38 +611,138 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
                 self.start_minidlna()
 
 
-    def start_minidlna(self, reindex: bool=False) -> None:
+    def start_minidlna(self, reindex: bool=False, user_request: bool=False) -> None:
 
-        if self.runner.is_running():
+        if self.runner.is_running() or self.store.state.phase != RunnerPhase.STOPPED:
             raise RuntimeError()
 
-        self.runner.start(self.get_minidlna_command(reindex))
+        if user_request:
+            # The user may have fixed the cause of the failures
+            self.watchdog.reset()
+
+        if reindex or not self.config.smart_reindex:
+            self.launch_minidlna(StartPlan(
+                StartDecision.REBUILD if reindex else StartDecision.START, "requested by the user", [], None, 0.0, None
+            ))
+        else:
+            # Walking the media directories can take a while; don't block the menu
+            self.store.update(phase=RunnerPhase.STARTING)
+            threading.Thread(target=self.plan_and_start, daemon=True).start()
+
+
+    def plan_and_start(self) -> None:
+
+        snapshot = self.minidlna_config.snapshot
+        try:
+            with self.manifest_lock:
+                plan = self.planner.plan(
+                    [(x.path, x.media_type.value) for x in snapshot.dirs],
+                    self.database_exists(),
+                    self.is_rescan_supported()
+                )
+        except Exception as ex:
+            self.logger.exception("Error checking the changes in the media directories: %s", ex)
+            plan = StartPlan(StartDecision.START, "error checking the changes", [], None, 0.0, None)
+        # The processes are supervised from the main loop
+        GLib.idle_add(self.launch_minidlna, plan)
 
 
-    def restart_minidlna(self, reindex: bool=False) -> None:
+    def launch_minidlna(self, plan: StartPlan) -> None:
+
+        self.logger.info(
+            "Starting MiniDLNA (%s: %s); changed directories: %s; time saved: %s; directories checked in %.2f seconds.",
+            plan.decision.value, plan.reason, plan.changed[:10], plan.saved_seconds, plan.walk_seconds
+        )
+
+        # If minidlnad is going to scan, the manifest is only valid once the scan finishes
+        self.scan_pending = plan.decision != StartDecision.START or not self.database_exists()
+        self.pending_trees = plan.trees if self.scan_pending else None
+        if self.scan_pending:
+            with self.manifest_lock:
+                self.planner.forget()
+
+        self.store.update(start_plan=plan)
+        self.runner.start(self.get_minidlna_command(
+            reindex=plan.decision == StartDecision.REBUILD, rescan=plan.decision == StartDecision.RESCAN
+        ))
+
+
+    def database_exists(self) -> bool:
+        db_path = get_db_path(self.minidlna_config.snapshot.options.get("db_dir"))
+        return bool(db_path and os.path.exists(db_path))
+
+
+    def is_rescan_supported(self) -> bool:
+        """
+        The rescan option (-r) was added in MiniDLNA 1.2.0.
+        """
+        if self.rescan_supported is None:
+            try:
+                output = subprocess.run([self.minidlna_path, "-V"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=5).stdout
+                match = re.search(rb"Version (\d+)\.(\d+)", output)
+                self.rescan_supported = bool(match) and (int(match.group(1)), int(match.group(2))) >= (1, 2)
+            except (OSError, subprocess.SubprocessError) as ex:
+                self.logger.warning("Couldn't detect the MiniDLNA version: %s", ex)
+                self.rescan_supported = False
+        return self.rescan_supported
+
+
+    def update_manifest(self, trees: Optional[dict]=None) -> None:
+        """
+        Saves the media directories as minidlnad knows them: the given trees (walked before starting it), or walked
+        again now.
+        """
+        snapshot = self.minidlna_config.snapshot
+        try:
+            with self.manifest_lock:
+                if trees is None:
+                    trees = self.planner.walk((x.path, x.media_type.value) for x in snapshot.dirs)
+                self.planner.update(trees, [x.path for x in snapshot.dirs])
+        except Exception as ex:
+            self.logger.exception("Error updating the manifest of the media directories: %s", ex)
+
+
+    def restart_minidlna(self, reindex: bool=False, user_request: bool=False) -> None:
 
         if not self.runner.is_running():
             raise RuntimeError()
 
-        finished = self.stop_minidlna()
-        if finished:
-            self.start_minidlna(reindex)
+        self.stop_minidlna(lambda: self.start_minidlna(reindex, user_request))
 
 
-    def stop_minidlna(self) -> None:
+    def stop_minidlna(self, on_stopped: Optional[Callable[[], None]]=None, wait: bool=False) -> None:
+        """
+        Stops minidlnad and then calls on_stopped, unless it doesn't finish in time. Unless waiting (like when
+        quitting), the main loop goes on while it stops; the grace period may be long.
+        """
 
         if not self.runner.is_running():
             raise RuntimeError()
 
-        killed = self.runner.stop()
-        if not killed:
+        self.store.update(phase=RunnerPhase.STOPPING)
+        try:
+            if wait:
+                self.on_minidlna_stopped(self.runner.stop(), on_stopped)
+            else:
+                self.runner.stop_async(lambda result: self.on_minidlna_stopped(result, on_stopped))
+        except Exception:
+            self.store.update(phase=RunnerPhase.RUNNING if self.runner.is_running() else RunnerPhase.STOPPED)
+            raise
+
+
+    def on_minidlna_stopped(self, result: StopResult, on_stopped: Optional[Callable[[], None]]) -> None:
+
+        if result.outcome == StopOutcome.KILLED:
+            self.logger.warning("MiniDLNA didn't finish in %s seconds and has been killed.", self.config.stop_grace_period)
+        elif result.outcome == StopOutcome.TIMED_OUT:
             self.logger.warning("MiniDLNA has not finished after the kill signal in the allowed time.")
             self.show_notification(
                 _("MiniDLNA not stopped"),
                 _("MiniDLNA has not stopped in the allowed time; perhaps it is slow and will finish later."),
             )
-
-        return killed
+            return
+        if on_stopped:
+            on_stopped()
 
 
     def run_xdg_open(self, _: Gtk.MenuItem, uri: str) -> None:
@@ -505,17 +753,44 @@ class MiniDLNAIndicator(Object, ProcessListener, FSListener, UpdateCheckListener
 
         self.logger.debug("Exiting...")
 
-        self.logger.debug("Stopping FS monitor thread...")
-        if self.fs_monitor.is_alive():
-            self.fs_monitor.stop()
+        self.logger.debug("Stopping FS monitor...")
+        self.fs_monitor.stop()
+
+        self.logger.debug("Stopping config watcher...")
+        self.config_watcher.stop()
+
+        self.logger.debug("Stopping log follower...")
+        self.log_follower.stop()
 
-        self.logger.debug("Stopping update checker thread...")
-        if self.update_checker.is_alive():
-            self.update_checker.stop()
+        self.logger.debug("Stopping library stats monitor...")
+        self.library_stats.stop()
 
-        self.logger.debug("Stopping MiniDLNA runner thread...")
+        self.logger.debug("Stopping resource monitor...")
+        self.resource_monitor.stop()
+
+        self.logger.debug("Stopping health probe...")
+        self.health_probe.stop()
+
+        self.logger.debug("Stopping restart watchdog...")
+        self.watchdog.stop()
+
+        self.logger.debug("Stopping update checker...")
+        self.update_checker.stop()
+
+        self.logger.debug("Stopping directory prober...")
+        self.prober.stop()
+
+        self.logger.debug("Stopping MiniDLNA...")
         if self.runner.is_running():
-            self.stop_minidlna()
+            self.stop_minidlna(wait=True)
+
+        for profile in self.profiles.values():
+            if profile.runner.is_running():
+                self.logger.debug("Stopping MiniDLNA profile %s...", profile.name)
+                profile.stop(wait=True)
+
+        self.logger.debug("Saving pending changes...")
+        self.config.flush()
 
         self.logger.debug("Stopping Notify...")
         Notify.uninit()
@@ -6,16 +6,22 @@ import fnmatch
 import logging
 import os
 import json
-import urllib
+import threading
+import urllib.parse
 
-from gi.repository import Gio
+from gi.repository import Gio, GLib
 
-from .constants import XDG_CONFIG_DIR, XDG_AUTOSTART_DIR, XDG_AUTOSTART_FILE, APPINDICATOR_ID, LOCALE_DIR, LOG_LEVELS, MINIDLNA_INDICATOR_CONFIG, MINIDLNA_CONFIG_DIR
+from .constants import XDG_AUTOSTART_FILE, LOG_LEVELS, MINIDLNA_INDICATOR_CONFIG, PROFILE_NAME_RE, \
+    CONFIG_SAVE_DELAY_MS
+from .persistence import DebouncedWriter
 from .update_check_thread import UpdateCheckConfig
 from .proxy import Proxy
 
-import gettext
-_ = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True).gettext
+from .i18n import _
+
+
+# Cached proxy when it hasn't been detected yet (None means no proxy)
+_NOT_DETECTED = object()
 
 
 class MiniDLNAIndicatorConfig(UpdateCheckConfig):
@@ -28,6 +34,13 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
 
         self.cmd_log_level = cmd_log_level
 
+        # All the files written by the indicator
+        self.writer = DebouncedWriter(lambda flush: GLib.timeout_add(CONFIG_SAVE_DELAY_MS, flush))
+
+        self._proxy_lock = threading.Lock()
+        self._proxy = _NOT_DETECTED  # type: Any
+        self._proxy_settings = {}  # type: Dict[str, Optional[Gio.Settings]]
+
         if config_file and config_file != MINIDLNA_INDICATOR_CONFIG:
             if not os.path.exists(config_file):
                 raise Exception(_("The file {file} doesn't exist.").format(file=config_file))
@@ -38,8 +51,7 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
             else:
                 self.config_file = config_file
         else:
-            if not os.path.exists(MINIDLNA_CONFIG_DIR):
-                os.mkdir(MINIDLNA_CONFIG_DIR)
+            # The directory is created when saving
             self.config_file = MINIDLNA_INDICATOR_CONFIG
 
         data = {}  # type: dict
@@ -51,11 +63,44 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
             except Exception as ex:
                 raise Exception(_("Error loading the configuration: {error}.").format(error=str(ex)))
 
-        self._auto_start = True
-        self.auto_start = data.get("auto_start", True)
+        # The autostart entry is only written when the setting changes (or by sync_xdg_autostart)
+        self._auto_start = data.get("auto_start", True)
 
         self.enable_orphan_process_killer = data.get("enable_orphan_process_killer", True)
         self.time_between_update_checks = data.get("time_between_update_checks", 1800)
+        self.update_index_url = data.get("update_index_url")
+        self.stop_grace_period = data.get("stop_grace_period", 10)
+        self.smart_reindex = data.get("smart_reindex", True)
+
+        # Resource alerts for minidlnad; 0 disables them
+        self.max_rss_mb = data.get("max_rss_mb", 1024)
+        self.max_cpu_percent = data.get("max_cpu_percent", 90)
+        self.cpu_alert_seconds = data.get("cpu_alert_seconds", 300)
+
+        # Automatic restarts of minidlnad when it fails; restart_rules maps exit codes (as strings; negative for
+        # signals) to "restart" or "stop"
+        self.auto_restart = data.get("auto_restart", True)
+        self.restart_max_failures = data.get("restart_max_failures", 5)
+        self.restart_window_seconds = data.get("restart_window_seconds", 300)
+        self.restart_rules = {}  # type: Dict[str, str]
+        for code, action in data.get("restart_rules", {}).items():
+            if action not in ("restart", "stop"):
+                self.logger.warning("Invalid restart action for exit code %s: %s.", code, action)
+                continue
+            try:
+                int(code)
+            except ValueError:
+                self.logger.warning("Invalid exit code in the restart rules: %s.", code)
+                continue
+            self.restart_rules[code] = action
+
+        # Names of the additional minidlnad instances
+        self.profiles = []  # type: List[str]
+        for name in data.get("profiles", []):
+            if not isinstance(name, str) or not PROFILE_NAME_RE.match(name):
+                self.logger.error("Invalid profile name %s found in configuration; ignoring...", name)
+            elif name not in self.profiles:
+                self.profiles.append(name)
 
         self._log_level = "error"
         log_level = data.get("log_level")
@@ -72,30 +117,30 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
 
     @auto_start.setter
     def auto_start(self, auto_start: bool) -> None:
-        self._auto_start = auto_start
-        self.set_xdg_autostart(self._auto_start)
-
+        if auto_start != self._auto_start:
+            self._auto_start = auto_start
+            self.sync_xdg_autostart()
 
-    def set_xdg_autostart(self, enabled: bool) -> None:
 
-        # ~/.config
-        if not os.path.exists(XDG_CONFIG_DIR):
-            os.mkdir(XDG_CONFIG_DIR)
+    def get_xdg_autostart_entry(self) -> str:
+        return "".join([
+            "[Desktop Entry]\n",
+            "Encoding = UTF-8\n",
+            "Type = Application\n",
+            "Name = " + _("MiniDLNA Indicator") + "\n",
+            "Exec = minidlnaindicator\n",
+            "Icon = minidlnaindicator\n",
+            "Comment = " + _("Indicator for launching MiniDLNA as a normal user") + "\n",
+            "X-GNOME-Autostart-enabled = {value}\n".format(value='true' if self._auto_start else 'false'),
+            "Terminal = false\n",
+        ])
 
-        # ~/.config/autostart
-        if not os.path.exists(XDG_AUTOSTART_DIR):
-            os.mkdir(XDG_AUTOSTART_DIR)
 
-        with codecs.open(XDG_AUTOSTART_FILE, "w", "utf-8") as f:
-            f.write("[Desktop Entry]\n")
-            f.write("Encoding = UTF-8\n")
-            f.write("Type = Application\n")
-            f.write("Name = " + _("MiniDLNA Indicator") + "\n")
-            f.write("Exec = minidlnaindicator\n")
-            f.write("Icon = minidlnaindicator\n")
-            f.write("Comment = " + _("Indicator for launching MiniDLNA as a normal user") + "\n")
-            f.write("X-GNOME-Autostart-enabled = {value}\n".format(value='true' if enabled else 'false'))
-            f.write("Terminal = false\n")
+    def sync_xdg_autostart(self) -> None:
+        """
+        Writes the autostart entry (~/.config/autostart) for the current setting, if it doesn't match already.
+        """
+        self.writer.write(XDG_AUTOSTART_FILE, self.get_xdg_autostart_entry())
 
 
     @property
@@ -131,6 +176,39 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
         if self.time_between_update_checks != 1800:
             data["time_between_update_checks"] = self.time_between_update_checks
 
+        if self.update_index_url:
+            data["update_index_url"] = self.update_index_url
+
+        if self.stop_grace_period != 10:
+            data["stop_grace_period"] = self.stop_grace_period
+
+        if not self.smart_reindex:
+            data["smart_reindex"] = False
+
+        if self.max_rss_mb != 1024:
+            data["max_rss_mb"] = self.max_rss_mb
+
+        if self.max_cpu_percent != 90:
+            data["max_cpu_percent"] = self.max_cpu_percent
+
+        if self.cpu_alert_seconds != 300:
+            data["cpu_alert_seconds"] = self.cpu_alert_seconds
+
+        if not self.auto_restart:
+            data["auto_restart"] = False
+
+        if self.restart_max_failures != 5:
+            data["restart_max_failures"] = self.restart_max_failures
+
+        if self.restart_window_seconds != 300:
+            data["restart_window_seconds"] = self.restart_window_seconds
+
+        if self.restart_rules:
+            data["restart_rules"] = self.restart_rules
+
+        if self.profiles:
+            data["profiles"] = self.profiles
+
         if self._log_level and self._log_level != "error":
             data["log_level"] = self._log_level
 
@@ -144,28 +222,57 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
         else:
             self.logger.info("Saving configuration (no reason)...")
 
-        try:
-
-            config_dir = os.path.dirname(self.config_file)
-            if not os.path.exists(config_dir):
-                os.mkdir(config_dir)
+        # Written a bit later, with the changes done meanwhile, and only if the content changes
+        self.writer.write(self.config_file, json.dumps(self.to_dict(), indent=4, sort_keys=True))
 
-            cnf_data = self.to_dict()
-            with codecs.open(self.config_file, 'w', 'utf-8') as outfile:
-                json.dump(cnf_data, outfile, indent=4, sort_keys=True)
 
-        except Exception as ex:
-            raise Exception(_("Exception saving the configuration: {error}.").format(error=str(ex)))
+    def flush(self) -> None:
+        """
+        Writes the pending changes now.
+        """
+        self.writer.flush()
 
 
     def detect_proxy(self) -> Optional[Proxy]:
+        """
+        Returns the proxy configured in the environment or in the GNOME settings. The result is cached until the GNOME
+        proxy settings change (the environment can't change while running).
+        """
+        with self._proxy_lock:
+            if self._proxy is _NOT_DETECTED:
+                self._proxy = self._detect_env_proxy() or self._detect_gnome_proxy()
+            return self._proxy
+
+
+    def _on_proxy_settings_changed(self, _settings: Gio.Settings, key: str) -> None:
+        self.logger.debug("Proxy setting %s changed.", key)
+        with self._proxy_lock:
+            self._proxy = _NOT_DETECTED
+
+
+    def _get_proxy_settings(self, schema_id: str) -> Optional[Gio.Settings]:
+        """
+        Returns the settings object of the schema, created once and watched for changes; None if the schema is not
+        installed (outside GNOME).
+        """
+        if schema_id not in self._proxy_settings:
+            settings = None
+            source = Gio.SettingsSchemaSource.get_default()
+            if source and source.lookup(schema_id, True):
+                settings = Gio.Settings.new(schema_id)
+                settings.connect("changed", self._on_proxy_settings_changed)
+            self._proxy_settings[schema_id] = settings
+        return self._proxy_settings[schema_id]
+
+
+    def _detect_env_proxy(self) -> Optional[Proxy]:
 
         self.logger.debug("Detecting environment proxy...")
-        current_env_proxy = os.getenv("http_proxy", os.getenv("HTTP_PROXY"))
-        if not current_env_proxy:
-            os.getenv("https_proxy", os.getenv("HTTPS_PROXY"))
-        if not current_env_proxy:
-            os.getenv("ftp_proxy", os.getenv("FTP_PROXY"))
+        current_env_proxy = None
+        for name in ("http_proxy", "https_proxy", "ftp_proxy"):
+            current_env_proxy = os.getenv(name, os.getenv(name.upper()))
+            if current_env_proxy:
+                break
         if current_env_proxy:
             url = urllib.parse.urlparse(current_env_proxy)
             p = Proxy()
@@ -178,23 +285,28 @@ class MiniDLNAIndicatorConfig(UpdateCheckConfig):
                 p.exceptions = [x.strip() for x in no_proxy.split(",") if x.strip()]
             self.logger.info("Found proxy in environment: %s", p.to_url())
             return p
+        return None
+
+
+    def _detect_gnome_proxy(self) -> Optional[Proxy]:
 
         self.logger.debug("Detecting gnome proxy settings...")
-        mode = Gio.Settings.new("org.gnome.system.proxy").get_string("mode")
-        if mode == "manual":
-            current_gnome_proxy = Gio.Settings.new("org.gnome.system.proxy.http").get_string("host")
-            current_gnome_port = Gio.Settings.new("org.gnome.system.proxy.http").get_int("port")
-            if not current_gnome_proxy:
-                current_gnome_proxy = Gio.Settings.new("org.gnome.system.proxy.https").get_string("host")
-                current_gnome_port = Gio.Settings.new("org.gnome.system.proxy.https").get_int("port")
-            if not current_gnome_proxy:
-                current_gnome_proxy = Gio.Settings.new("org.gnome.system.proxy.ftp").get_string("host")
-                current_gnome_port = Gio.Settings.new("org.gnome.system.proxy.ftp").get_int("port")
+        proxy_settings = self._get_proxy_settings("org.gnome.system.proxy")
+        if proxy_settings and proxy_settings.get_string("mode") == "manual":
+            current_gnome_proxy, current_gnome_port = None, 0
+            for protocol in ("http", "https", "ftp"):
+                protocol_settings = self._get_proxy_settings("org.gnome.system.proxy." + protocol)
+                if not protocol_settings:
+                    continue
+                current_gnome_proxy = protocol_settings.get_string("host")
+                current_gnome_port = protocol_settings.get_int("port")
+                if current_gnome_proxy:
+                    break
             if current_gnome_proxy and current_gnome_port:
                 p = Proxy()
                 p.host = current_gnome_proxy
                 p.port = current_gnome_port
-                p.exceptions = Gio.Settings.new("org.gnome.system.proxy").get_strv("ignore-hosts")
+                p.exceptions = proxy_settings.get_strv("ignore-hosts")
                 self.logger.info("Found proxy in gnome: %s", p.to_url())
                 return p
 
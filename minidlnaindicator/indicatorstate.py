@@ -0,0 +1,105 @@
+from typing import Any, Callable, List, Optional
+
+import collections
+import enum
+import logging
+import threading
+
+
+class RunnerPhase(enum.Enum):
+    STOPPED = "stopped"
+    STARTING = "starting"
+    RUNNING = "running"
+    STOPPING = "stopping"
+
+
+IndicatorState = collections.namedtuple(
+    "IndicatorState", [
+        "phase", "pid", "minidlna_path", "update_available", "mounts", "config", "dir_status",
+        "scanning", "scanned_files", "file_errors", "clients", "library", "start_plan", "profiles",
+        "started_at", "start_count", "last_exit_code", "resources", "watchdog", "health",
+    ]
+)
+IndicatorState.__doc__ = """
+Everything the indicator shows; immutable, so a render always sees a consistent set of values.
+"""
+
+
+class StateStore(object):
+    """
+    Holds the current IndicatorState. Any thread can update it; the subscribers are called from the scheduler (the
+    main loop) at most once per scheduled render, with the last rendered state and the current one, however many
+    updates have been done in between.
+    """
+
+    def __init__(self, initial_state: IndicatorState, scheduler: Callable[[Callable[[], bool]], Any]) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self._state = initial_state
+        self._rendered_state = None  # type: Optional[IndicatorState]
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._render_pending = False
+        self._subscribers = []  # type: List[Callable[[Optional[IndicatorState], IndicatorState], None]]
+
+
+    @property
+    def state(self) -> IndicatorState:
+        return self._state
+
+
+    def subscribe(self, subscriber: Callable[[Optional[IndicatorState], IndicatorState], None]) -> None:
+        if subscriber not in self._subscribers:
+            self._subscribers.append(subscriber)
+
+
+    def update(self, **changes: Any) -> IndicatorState:
+        """
+        Replaces the given fields of the state, and schedules a render if something has changed.
+        """
+        with self._lock:
+            new_state = self._state._replace(**changes)
+            if new_state == self._state:
+                return new_state
+            self._state = new_state
+            schedule = not self._render_pending
+            self._render_pending = True
+        if schedule:
+            self._scheduler(self._render)
+        return new_state
+
+
+    def request_render(self) -> None:
+        """
+        Schedules a render even if the state hasn't changed, like the first one.
+        """
+        with self._lock:
+            schedule = not self._render_pending
+            self._render_pending = True
+        if schedule:
+            self._scheduler(self._render)
+
+
+    def render_now(self) -> None:
+        with self._lock:
+            self._render_pending = True
+        self._render()
+
+
+    def _render(self) -> bool:
+
+        with self._lock:
+            self._render_pending = False
+            state = self._state
+        previous_state = self._rendered_state
+        self._rendered_state = state
+
+        for subscriber in self._subscribers:
+            try:
+                subscriber(previous_state, state)
+            except Exception as ex:
+                self._logger.exception("Error rendering state: %s", ex)
+
+        # Don't repeat when used as a GLib source
+        return False
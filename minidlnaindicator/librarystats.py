@@ -0,0 +1,13 @@
+import collections
+from types import MappingProxyType
+
+
+MEDIA_CLASSES = ("audio", "video", "image")
+
+LibraryStats = collections.namedtuple("LibraryStats", ["total", "by_class", "by_dir", "progress", "refreshed"])
+LibraryStats.__doc__ = """
+Items indexed by minidlnad: the total, the counts per media class (audio, video, image) and per configured directory,
+the estimated progress of a running scan (0 to 1, or None when unknown) and the monotonic time of the refresh.
+"""
+
+EMPTY_STATS = LibraryStats(0, MappingProxyType({}), MappingProxyType({}), None, 0.0)
@@ -0,0 +1,68 @@
+from typing import Optional
+
+import collections
+import enum
+import re
+
+
+class LogEventType(enum.Enum):
+    SERVER_STARTED = "server_started"
+    SCAN_STARTED = "scan_started"
+    SCAN_FINISHED = "scan_finished"
+    FILE_ERROR = "file_error"
+    CLIENT_CONNECTION = "client_connection"
+    INOTIFY_WARNING = "inotify_warning"
+
+
+LogEvent = collections.namedtuple("LogEvent", ["type", "timestamp", "source", "level", "message", "path", "count", "client"])
+LogEvent.__doc__ = """
+Typed event parsed from a minidlna.log line; path, count and client are set only for the events that carry them.
+"""
+
+# [2017/09/10 12:00:00] scanner.c:727: warn: Scanning /home/user/Music
+_LINE_RE = re.compile(r"^\[(?P<timestamp>[^\]]+)\] (?P<source>[\w.]+):\d+: (?P<level>\w+): (?P<message>.*)$")
+
+_SERVER_STARTED_RE = re.compile(r"^Starting MiniDLNA version")
+_SCAN_FINISHED_RE = re.compile(r"^Scanning (?P<path>.+) finished \((?P<count>\d+) files\)!$")
+_SCAN_STARTED_RE = re.compile(r"^Scanning (?P<path>/.*)$")
+_INOTIFY_RE = re.compile(r"Inotify max_user_watches|inotify_add_watch\(.*\) \[")
+_CLIENT_RE = re.compile(r"(?:HTTP connection|SSDP M-SEARCH|Client found).* from (?P<client>[0-9a-fA-F.:]+?)(?::\d+)?(?:\s|$|,)")
+_FILE_PATH_RE = re.compile(r"(?P<path>/[^\s\[\]]+)")
+
+
+def parse_log_line(line: str) -> Optional[LogEvent]:
+    """
+    Returns the event described by the log line, or None if the line is not interesting.
+    """
+
+    match = _LINE_RE.match(line)
+    if not match:
+        return None
+    timestamp, source, level, message = match.group("timestamp", "source", "level", "message")
+
+    def event(event_type: LogEventType, path: Optional[str]=None, count: Optional[int]=None, client: Optional[str]=None) -> LogEvent:
+        return LogEvent(event_type, timestamp, source, level, message, path, count, client)
+
+    if source.startswith("scanner"):
+        scan_match = _SCAN_FINISHED_RE.match(message)
+        if scan_match:
+            return event(LogEventType.SCAN_FINISHED, path=scan_match.group("path"), count=int(scan_match.group("count")))
+        scan_match = _SCAN_STARTED_RE.match(message)
+        if scan_match:
+            return event(LogEventType.SCAN_STARTED, path=scan_match.group("path"))
+
+    if source.startswith("inotify") and _INOTIFY_RE.search(message):
+        return event(LogEventType.INOTIFY_WARNING)
+
+    if source.startswith("minidlna") and _SERVER_STARTED_RE.match(message):
+        return event(LogEventType.SERVER_STARTED)
+
+    client_match = _CLIENT_RE.search(message)
+    if client_match:
+        return event(LogEventType.CLIENT_CONNECTION, client=client_match.group("client"))
+
+    if level == "error" and source.startswith(("scanner", "metadata", "albumart", "playlist", "image_utils", "tagutils")):
+        path_match = _FILE_PATH_RE.search(message)
+        return event(LogEventType.FILE_ERROR, path=path_match.group("path") if path_match else None)
+
+    return None
@@ -0,0 +1,252 @@
+from typing import List, Optional
+
+import logging
+import os
+
+from gi.repository import GLib
+
+from .inotify import Inotify, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_MODIFY, IN_MOVED_FROM, IN_MOVED_TO, IN_ONLYDIR, \
+    IN_Q_OVERFLOW
+from .logevents import parse_log_line
+from .loglistener import LogListener
+
+
+LOG_DIR_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+
+class LogFollower(object):
+    """
+    Follows the MiniDLNA log like "tail -F" from the GLib main loop: only the bytes appended since the last read are
+    parsed, and truncations and rotations (the file replaced by another one with the same name) are detected.
+    Interesting lines are turned into LogEvents and passed to the listeners. At most max_read_size bytes are parsed
+    per iteration of the main loop, so a burst of lines doesn't block it.
+    """
+
+    def __init__(self, log_file: Optional[str]=None, start_at_end: bool=True, retry_interval: int=5,
+                 chunk_size: int=65536, max_line_length: int=4096, max_read_size: int=1048576) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.start_at_end = start_at_end
+        self.retry_interval = retry_interval
+        self.chunk_size = chunk_size
+        self.max_line_length = max_line_length
+        self.max_read_size = max_read_size
+
+        self._log_file = log_file
+
+        self._fd = None  # type: Optional[int]
+        self._inode = None  # type: Optional[int]
+        self._offset = 0
+        self._partial = b""
+
+        self._inotify = None  # type: Optional[Inotify]
+        self._watch = None  # type: Optional[int]
+        self._watched_dir = None  # type: Optional[str]
+        self._first_open = True
+        self._source_id = None  # type: Optional[int]
+        self._retry_source_id = None  # type: Optional[int]
+        self._continue_source_id = None  # type: Optional[int]
+
+        self._listeners = []  # type: List[LogListener]
+
+
+    def add_listener(self, listener: LogListener) -> bool:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+            return True
+        return False
+
+
+    def remove_listener(self, listener: LogListener) -> bool:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+            return True
+        return False
+
+
+    @property
+    def log_file(self) -> Optional[str]:
+        return self._log_file
+
+
+    def is_running(self) -> bool:
+        return self._inotify is not None
+
+
+    def follow(self, log_file: Optional[str]) -> None:
+        """
+        Changes the followed file (when the log directory of the configuration changes).
+        """
+        if log_file == self._log_file:
+            return
+        self._log_file = log_file
+        self._close_file()
+        if self._watch is not None:
+            self._inotify.remove_watch(self._watch)
+            self._watch = None
+        self._watched_dir = None
+        self._first_open = True
+        if self._inotify:
+            self._sync()
+
+
+    def start(self) -> None:
+
+        self._logger.debug("Starting log follower...")
+        try:
+            self._inotify = Inotify()
+        except OSError as ex:
+            self._logger.error("Couldn't initialize inotify; the log won't be followed: %s", ex)
+            return
+
+        self._source_id = GLib.unix_fd_add_full(
+            GLib.PRIORITY_DEFAULT, self._inotify.fileno(), GLib.IOCondition.IN, self._on_inotify_events
+        )
+        self._sync()
+
+
+    def _on_inotify_events(self, _fd: int, _condition: GLib.IOCondition) -> bool:
+
+        # The other files of the directory (like the database) change all the time while scanning; after an overflow,
+        # the events of the log may be lost
+        log_name = os.path.basename(self._log_file) if self._log_file else None
+        if any(x.name == log_name or x.mask & IN_Q_OVERFLOW for x in self._inotify.read_events()):
+            self._sync()
+        return True
+
+
+    def _on_retry(self) -> bool:
+        self._retry_source_id = None
+        self._sync()
+        return False
+
+
+    def _on_continue(self) -> bool:
+        self._continue_source_id = None
+        self._sync()
+        return False
+
+
+    def _sync(self) -> None:
+
+        log_file = self._log_file
+
+        # The directory may not exist until minidlnad is run for the first time
+        log_dir = os.path.dirname(log_file) if log_file else None
+        if log_dir and self._watched_dir != log_dir:
+            try:
+                self._watch = self._inotify.add_watch(log_dir, LOG_DIR_EVENTS)
+                self._watched_dir = log_dir
+            except OSError as ex:
+                self._logger.debug("Couldn't watch the log directory %s: %s", log_dir, ex)
+                if self._retry_source_id is None:
+                    self._retry_source_id = GLib.timeout_add_seconds(self.retry_interval, self._on_retry)
+
+        if log_file:
+            try:
+                complete = self._read_new_data(log_file, self._first_open and self.start_at_end)
+            except OSError as ex:
+                self._logger.exception("Error following the log file %s: %s", log_file, ex)
+                complete = True
+            self._first_open = False
+            if not complete and self._continue_source_id is None:
+                self._continue_source_id = GLib.idle_add(self._on_continue)
+
+
+    def _read_new_data(self, log_file: str, skip_existing: bool) -> bool:
+        """
+        Reads the data appended to the log, and returns False if there is more to read.
+        """
+
+        # Whatever has been written to the current file before a rotation belongs to it, so read it first
+        if self._fd is not None and not self._drain():
+            return False
+
+        try:
+            path_stat = os.stat(log_file)
+        except FileNotFoundError:
+            # Rotated and not created again yet; keep the old file open until the new one appears
+            return True
+
+        if self._fd is not None and path_stat.st_ino != self._inode:
+            self._logger.debug("Log file %s rotated.", log_file)
+            self._close_file()
+
+        if self._fd is None:
+            try:
+                self._fd = os.open(log_file, os.O_RDONLY | os.O_CLOEXEC)
+            except OSError as ex:
+                self._logger.warning("Couldn't open the log file %s: %s", log_file, ex)
+                return True
+            file_stat = os.fstat(self._fd)
+            self._inode = file_stat.st_ino
+            self._offset = file_stat.st_size if skip_existing else 0
+            self._partial = b""
+            return self._drain()
+
+        return True
+
+
+    def _drain(self) -> bool:
+
+        size = os.fstat(self._fd).st_size
+        if size < self._offset:
+            self._logger.debug("Log file truncated; reading from the beginning.")
+            self._offset = 0
+            self._partial = b""
+
+        read_size = 0
+        while self._offset < size:
+            if read_size >= self.max_read_size:
+                return False
+            data = os.pread(self._fd, min(self.chunk_size, size - self._offset), self._offset)
+            if not data:
+                break
+            self._offset += len(data)
+            read_size += len(data)
+            self._feed(data)
+        return True
+
+
+    def _feed(self, data: bytes) -> None:
+
+        data = self._partial + data
+        *complete, self._partial = data.split(b"\n")
+        if len(self._partial) > self.max_line_length:
+            # A line without end; its beginning is enough to classify it
+            complete.append(self._partial)
+            self._partial = b""
+
+        for raw_line in complete:
+            event = parse_log_line(raw_line[:self.max_line_length].decode("utf-8", "replace").rstrip("\r"))
+            if event:
+                for listener in self._listeners:
+                    try:
+                        listener.on_log_event(event)
+                    except Exception as ex:
+                        self._logger.exception("Error notifying log event %s: %s", event, ex)
+
+
+    def _close_file(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._inode = None
+            self._offset = 0
+            self._partial = b""
+
+
+    def stop(self) -> None:
+
+        self._logger.debug("Stopping log follower...")
+        for source_id in (self._source_id, self._retry_source_id, self._continue_source_id):
+            if source_id is not None:
+                GLib.source_remove(source_id)
+        self._source_id = self._retry_source_id = self._continue_source_id = None
+        self._close_file()
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+        self._watch = None
+        self._watched_dir = None
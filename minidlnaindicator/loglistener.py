@@ -0,0 +1,7 @@
+from .logevents import LogEvent
+
+
+class LogListener(object):
+
+    def on_log_event(self, event: LogEvent) -> None:
+        raise NotImplementedError()
@@ -0,0 +1,222 @@
+from typing import Dict, Iterable, List, Tuple
+
+import collections
+import concurrent.futures
+import enum
+import json
+import logging
+import os
+import time
+
+from .persistence import write_file_atomic
+
+
+MANIFEST_VERSION = 1
+
+DirRecord = collections.namedtuple("DirRecord", ["inode", "mtime_ns", "entries"])
+DirRecord.__doc__ = """
+State of a directory: adding, removing or renaming an entry changes its mtime and usually its number of entries, and
+replacing the directory changes its inode.
+"""
+
+
+class StartDecision(enum.Enum):
+    START = "start"
+    RESCAN = "rescan"
+    REBUILD = "rebuild"
+
+
+StartPlan = collections.namedtuple("StartPlan", ["decision", "reason", "changed", "saved_seconds", "walk_seconds", "trees"])
+StartPlan.__doc__ = """
+How minidlnad should be started: the decision, a description of the reason, the directories changed since the
+manifest was saved, the estimated seconds saved compared to a full reindex (None if unknown), the seconds spent
+walking the media directories, and the walked trees (to save them once minidlnad has been started).
+"""
+
+_logger = logging.getLogger(__name__)
+
+
+def scan_directory(path: str) -> Tuple[DirRecord, List[str]]:
+    """
+    Returns the record of the directory and its subdirectories (symbolic links are not followed).
+    """
+    subdirs = []  # type: List[str]
+    entries = 0
+    with os.scandir(path) as iterator:
+        for entry in iterator:
+            entries += 1
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+            except OSError:
+                continue
+    dir_stat = os.stat(path)
+    return DirRecord(dir_stat.st_ino, dir_stat.st_mtime_ns, entries), subdirs
+
+
+def walk_tree(root: str, max_workers: int=8) -> Dict[str, DirRecord]:
+    """
+    Walks the tree scanning several directories at the same time (on network or slow disks most of the time is spent
+    waiting for the file system), and returns the records by path relative to the root. Unreadable directories are
+    left out.
+    """
+
+    records = {}  # type: Dict[str, DirRecord]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(scan_directory, root): root}
+        while pending:
+            done, _not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    record, subdirs = future.result()
+                except OSError as ex:
+                    _logger.debug("Couldn't scan directory %s: %s", path, ex)
+                    continue
+                records[os.path.relpath(path, root)] = record
+                for subdir in subdirs:
+                    pending[executor.submit(scan_directory, subdir)] = subdir
+    return records
+
+
+def diff_trees(old: Dict[str, DirRecord], new: Dict[str, DirRecord]) -> List[str]:
+    """
+    Returns the topmost relative paths of the subtrees that have changed: directories with a different record, and
+    directories added or removed (whose parent has changed too, so they are covered by it).
+    """
+
+    changed = [x for x in set(old) | set(new) if old.get(x) != new.get(x)]
+    if "." in changed:
+        return ["."]
+    # Sorted by components, so every subtree follows its root ("a b" would sort between "a" and "a/c" as text)
+    topmost = []  # type: List[str]
+    for path in sorted(changed, key=lambda x: x.split(os.sep)):
+        if topmost and path.startswith(topmost[-1] + os.sep):
+            continue
+        topmost.append(path)
+    return topmost
+
+
+class ReindexPlanner(object):
+    """
+    Keeps a manifest of the media directories (the record of every directory of each tree) as they were when minidlnad
+    last stopped, and decides how to start it again: minidlnad only learns about changes through inotify while it is
+    running, so changes done while it was stopped need a rescan. minidlnad can't rescan a subtree, so any change leads
+    to a rescan (-r) of all the directories, that keeps the unchanged files in the database; a full rebuild (-R) is
+    only done when the directories or their media types are different.
+    """
+
+    def __init__(self, manifest_file: str, max_workers: int=8) -> None:
+
+        self.manifest_file = manifest_file
+        self.max_workers = max_workers
+
+        self._manifest = self._load()
+
+
+    def _load(self) -> dict:
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            _logger.warning("Ignoring invalid manifest %s: %s", self.manifest_file, ex)
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data
+
+
+    def _save(self) -> None:
+        self._manifest["version"] = MANIFEST_VERSION
+        try:
+            write_file_atomic(self.manifest_file, json.dumps(self._manifest, separators=(",", ":")))
+        except OSError as ex:
+            _logger.error("Error saving the manifest %s: %s", self.manifest_file, ex)
+
+
+    def walk(self, dirs: Iterable[Tuple[str, str]]) -> Dict[str, dict]:
+        """
+        Walks the media directories, given as (path, media type) pairs, and returns their manifest entries.
+        """
+        trees = {}  # type: Dict[str, dict]
+        for path, media_type in dirs:
+            if os.path.isdir(path):
+                records = walk_tree(path, self.max_workers)
+                trees[path] = {"media_type": media_type, "tree": {x: list(y) for x, y in records.items()}}
+        return trees
+
+
+    def plan(self, dirs: List[Tuple[str, str]], database_exists: bool, rescan_supported: bool=True) -> StartPlan:
+
+        start = time.monotonic()
+        trees = self.walk(dirs)
+        walk_seconds = time.monotonic() - start
+
+        old_trees = self._manifest.get("dirs", {})  # type: Dict[str, dict]
+        full_scan_seconds = self._manifest.get("full_scan_seconds")
+        rescan_seconds = self._manifest.get("rescan_seconds")
+
+        def make_plan(decision: StartDecision, reason: str, changed: List[str]=()) -> StartPlan:
+            if decision == StartDecision.REBUILD or not full_scan_seconds:
+                saved = None
+            elif decision == StartDecision.RESCAN:
+                saved = full_scan_seconds - rescan_seconds if rescan_seconds else None
+            else:
+                saved = full_scan_seconds
+            return StartPlan(decision, reason, list(changed), saved, walk_seconds, trees)
+
+        if not database_exists:
+            return make_plan(StartDecision.START, "no database; minidlnad will index everything")
+        if not old_trees:
+            # Without a previous manifest nothing is known; rebuilding could take hours, so only rescan if possible
+            return make_plan(StartDecision.RESCAN if rescan_supported else StartDecision.START, "no manifest")
+
+        old_types = {x: y["media_type"] for x, y in old_trees.items()}
+        new_types = dict(dirs)
+        if set(old_types) - set(new_types):
+            return make_plan(StartDecision.REBUILD, "media directories removed", sorted(set(old_types) - set(new_types)))
+        retyped = sorted(x for x in new_types if x in old_types and old_types[x] != new_types[x])
+        if retyped:
+            return make_plan(StartDecision.REBUILD, "media types changed", retyped)
+
+        changed = []  # type: List[str]
+        for path in new_types:
+            if path not in old_trees:
+                if path in trees:
+                    changed.append(path)
+            elif path in trees:
+                old_records = {x: DirRecord(*y) for x, y in old_trees[path]["tree"].items()}
+                new_records = {x: DirRecord(*y) for x, y in trees[path]["tree"].items()}
+                changed.extend(os.path.normpath(os.path.join(path, x)) for x in diff_trees(old_records, new_records))
+
+        if not changed:
+            return make_plan(StartDecision.START, "no changes")
+        if not rescan_supported:
+            return make_plan(StartDecision.REBUILD, "rescan not supported", changed)
+        return make_plan(StartDecision.RESCAN, "{count} directories changed".format(count=len(changed)), changed)
+
+
+    def update(self, trees: Dict[str, dict], paths: Iterable[str]) -> None:
+        """
+        Saves the trees as the current state of the media directories; those not walked (unavailable) keep their
+        previous state, and those no longer configured are dropped.
+        """
+        old_trees = self._manifest.get("dirs", {})
+        self._manifest["dirs"] = {x: trees.get(x) or old_trees[x] for x in paths if x in trees or x in old_trees}
+        self._save()
+
+
+    def forget(self) -> None:
+        """
+        Drops the saved trees, so the next start rescans (when the database may have missed changes).
+        """
+        if self._manifest.pop("dirs", None) is not None:
+            self._save()
+
+
+    def record_scan(self, decision: StartDecision, seconds: float) -> None:
+        key = "rescan_seconds" if decision == StartDecision.RESCAN else "full_scan_seconds"
+        self._manifest[key] = seconds
+        self._save()
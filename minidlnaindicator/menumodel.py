@@ -0,0 +1,137 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import collections
+import logging
+
+
+MENU_ITEM = "item"
+MENU_CHECK_ITEM = "check"
+MENU_SEPARATOR = "separator"
+
+MenuRow = collections.namedtuple("MenuRow", ["key", "kind", "label", "sensitive", "tooltip", "active", "action", "data"])
+MenuRow.__doc__ = """
+Description of a menu row, independent of the toolkit. The key identifies the row between reconciliations (for
+example, ("dir", path)); the action and data are passed to the activation callback.
+"""
+
+
+def menu_item(key: Hashable, label: str, action: Optional[str]=None, data: Any=None, sensitive: bool=True, tooltip: Optional[str]=None) -> MenuRow:
+    return MenuRow(key, MENU_ITEM, label, sensitive, tooltip, False, action, data)
+
+
+def check_item(key: Hashable, label: str, active: bool, action: Optional[str]=None, sensitive: bool=True) -> MenuRow:
+    return MenuRow(key, MENU_CHECK_ITEM, label, sensitive, None, active, action, None)
+
+
+def separator(key: Hashable) -> MenuRow:
+    return MenuRow(key, MENU_SEPARATOR, None, True, None, False, None, None)
+
+
+class MenuBackend(object):
+    """
+    Toolkit operations needed to apply the changes computed by MenuModel; widgets are opaque to the model.
+    """
+
+    def create(self, row: MenuRow) -> Any:
+        raise NotImplementedError()
+
+
+    def update(self, widget: Any, old_row: MenuRow, new_row: MenuRow) -> None:
+        raise NotImplementedError()
+
+
+    def insert(self, widget: Any, position: int) -> None:
+        raise NotImplementedError()
+
+
+    def move(self, widget: Any, position: int) -> None:
+        raise NotImplementedError()
+
+
+    def remove(self, widget: Any) -> None:
+        raise NotImplementedError()
+
+
+class MenuModel(object):
+    """
+    Keeps the rows currently shown and applies only the differences with a new list of rows to the backend: rows
+    whose key disappears are removed, new keys are inserted, and existing rows are updated in place or moved.
+    """
+
+    def __init__(self, backend: MenuBackend) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self._backend = backend
+        self._keys = []  # type: List[Hashable]
+        self._rows = {}  # type: Dict[Hashable, MenuRow]
+        self._widgets = {}  # type: Dict[Hashable, Any]
+
+
+    def get_row(self, key: Hashable) -> Optional[MenuRow]:
+        return self._rows.get(key)
+
+
+    def get_widget(self, key: Hashable) -> Any:
+        return self._widgets.get(key)
+
+
+    @property
+    def rows(self) -> List[MenuRow]:
+        return [self._rows[x] for x in self._keys]
+
+
+    def reconcile(self, rows: List[MenuRow]) -> int:
+        """
+        Updates the menu to show the given rows, and returns the number of backend operations done.
+        """
+
+        operations = 0
+        new_keys = [x.key for x in rows]
+        if len(set(new_keys)) != len(new_keys):
+            raise ValueError("Duplicated menu keys: {keys}".format(
+                keys=[x for x, count in collections.Counter(new_keys).items() if count > 1]
+            ))
+
+        if new_keys != self._keys:
+            new_key_set = set(new_keys)
+            for key in self._keys:
+                if key not in new_key_set:
+                    self._backend.remove(self._widgets.pop(key))
+                    del self._rows[key]
+                    operations += 1
+            self._keys = [x for x in self._keys if x in new_key_set]
+
+        for position, row in enumerate(rows):
+
+            key = row.key
+            old_row = self._rows.get(key)
+
+            if old_row is None:
+                widget = self._backend.create(row)
+                self._backend.insert(widget, position)
+                self._widgets[key] = widget
+                self._keys.insert(position, key)
+                operations += 1
+
+            else:
+                if old_row != row:
+                    self._backend.update(self._widgets[key], old_row, row)
+                    operations += 1
+                if self._keys[position] != key:
+                    self._backend.move(self._widgets[key], position)
+                    self._keys.remove(key)
+                    self._keys.insert(position, key)
+                    operations += 1
+
+            self._rows[key] = row
+
+        if operations:
+            self._logger.debug("Menu reconciled with %s operations.", operations)
+        return operations
+
+
+    def activate(self, key: Hashable, callback: Callable[[MenuRow], None]) -> None:
+        row = self._rows.get(key)
+        if row is not None:
+            callback(row)
@@ -0,0 +1,247 @@
+from typing import List, Mapping, Tuple
+
+import time
+
+from .dirprobe import ProbeStatus
+from .healthcheck import HealthSnapshot, HealthStatus
+from .indicatorstate import IndicatorState, RunnerPhase
+from .librarystats import MEDIA_CLASSES
+from .manifest import StartDecision, StartPlan
+from .menumodel import MenuRow, menu_item, check_item, separator
+from .procstats import ResourceSample
+from .watchdogstatus import CircuitState, FailureRecord
+from .i18n import _
+
+
+def build_menu_rows(state: IndicatorState, auto_start: bool, can_install_minidlna: bool) -> List[MenuRow]:
+    """
+    Describes the whole menu of the indicator for the state; MenuModel applies only the rows that change. Doesn't
+    need Gtk, so the benchmarks can build the same rows.
+    """
+
+    rows = []  # type: List[MenuRow]
+    stopped = state.phase == RunnerPhase.STOPPED
+    running = state.phase == RunnerPhase.RUNNING
+
+    if state.minidlna_path:
+        rows.append(menu_item("start", _("Start MiniDLNA"), "start", sensitive=stopped))
+        rows.append(menu_item("start_reindex", _("Start and reindex MiniDLNA"), "start_reindex", sensitive=stopped))
+        rows.append(menu_item("restart", _("Restart MiniDLNA"), "restart", sensitive=running))
+        rows.append(menu_item("restart_reindex", _("Restart and reindex MiniDLNA"), "restart_reindex", sensitive=running))
+        rows.append(menu_item("stop", _("Stop MiniDLNA"), "stop", sensitive=running))
+        rows.append(menu_item(
+            "weblink", _("Web interface (port {port})").format(port=state.config.port), "weblink", sensitive=running,
+            tooltip=format_health(state.health) if running else None
+        ))
+        if running and state.health.status not in (HealthStatus.READY, HealthStatus.STOPPED):
+            rows.append(menu_item("health", format_health(state.health), sensitive=False))
+        if stopped and state.watchdog.circuit == CircuitState.OPEN:
+            rows.append(menu_item(
+                "watchdog", _("MiniDLNA keeps failing; automatic restarts paused"), "showlog",
+                tooltip=format_failures(state.watchdog.failures)
+            ))
+        elif stopped and state.watchdog.restart_pending:
+            rows.append(menu_item(
+                "watchdog", _("Restarting MiniDLNA after a failure..."), sensitive=False,
+                tooltip=format_failures(state.watchdog.failures)
+            ))
+        if running and state.scanning and state.library.progress is not None:
+            rows.append(menu_item(
+                "scan_status",
+                _("Scanning {path}... ({percent}%)").format(path=state.scanning, percent=int(state.library.progress * 100)),
+                sensitive=False
+            ))
+        elif running and state.scanning:
+            rows.append(menu_item("scan_status", _("Scanning {path}...").format(path=state.scanning), sensitive=False))
+        elif running and state.scanned_files is not None:
+            rows.append(menu_item(
+                "scan_status", _("{count} files indexed").format(count=state.scanned_files), sensitive=False
+            ))
+        if running and state.start_plan and state.start_plan.trees is not None:
+            rows.append(menu_item("start_plan", format_start_plan(state.start_plan), sensitive=False))
+        if running and state.library.total:
+            rows.append(menu_item(
+                "library", _("Library: {counts}").format(counts=format_media_counts(state.library.by_class)),
+                sensitive=False
+            ))
+        if running and state.resources:
+            rows.append(build_resources_row(state.resources))
+        if running and state.clients:
+            rows.append(menu_item(
+                "clients", _("Clients: {clients}").format(clients=", ".join(sorted(state.clients))), sensitive=False
+            ))
+        if state.file_errors:
+            rows.append(menu_item(
+                "file_errors", _("{count} files couldn't be read; click here to show the log").format(count=state.file_errors),
+                "showlog"
+            ))
+    elif can_install_minidlna:
+        rows.append(menu_item("detect", _("MiniDLNA not installed; click here to install"), "install"))
+    else:
+        rows.append(menu_item(
+            "detect", _("MiniDLNA not installed; click here to show how to install"),
+            "open", "https://github.com/okelet/minidlnaindicator"
+        ))
+
+    rows.append(separator("runner_separator"))
+
+    if state.profiles:
+        for profile in state.profiles:
+            if profile.phase == RunnerPhase.RUNNING:
+                status = _("running on port {port}").format(port=profile.port)
+            elif profile.phase == RunnerPhase.STARTING:
+                status = _("starting")
+            elif profile.phase == RunnerPhase.STOPPING:
+                status = _("stopping")
+            else:
+                status = _("stopped")
+            rows.append(menu_item(
+                ("profile", profile.name), _("Profile {name}: {status}").format(name=profile.name, status=status),
+                sensitive=False
+            ))
+            if state.minidlna_path:
+                rows.append(menu_item(
+                    ("profile_start", profile.name), _("Start profile {name}").format(name=profile.name),
+                    "profile_start", profile.name, sensitive=profile.phase == RunnerPhase.STOPPED
+                ))
+                rows.append(menu_item(
+                    ("profile_stop", profile.name), _("Stop profile {name}").format(name=profile.name),
+                    "profile_stop", profile.name, sensitive=profile.phase == RunnerPhase.RUNNING
+                ))
+            rows.append(menu_item(
+                ("profile_config", profile.name), _("Edit profile {name} configuration").format(name=profile.name),
+                "open", profile.config_file
+            ))
+        rows.append(separator("profiles_separator"))
+
+    if state.config.dirs:
+        seen = set()
+        for minidlna_dir in state.config.dirs:
+            key = ("dir", minidlna_dir.path, minidlna_dir.media_type)
+            if key in seen:
+                continue
+            seen.add(key)
+            status = state.dir_status.get(minidlna_dir.path, ProbeStatus.CHECKING)
+            if status == ProbeStatus.CHECKING:
+                tooltip = _("Checking directory...")
+            elif status == ProbeStatus.INACCESSIBLE:
+                tooltip = _("Directory does not exist")
+            elif status == ProbeStatus.TIMEOUT:
+                tooltip = _("Directory is not responding")
+            elif running and state.library.by_dir.get(minidlna_dir.path):
+                tooltip = format_media_counts(state.library.by_dir[minidlna_dir.path])
+            else:
+                tooltip = None
+            rows.append(menu_item(
+                key,
+                "[{display_type}] {path}".format(display_type=minidlna_dir.description, path=minidlna_dir.path),
+                "open", minidlna_dir.path,
+                sensitive=status in (ProbeStatus.ACCESSIBLE, ProbeStatus.CHECKING),
+                tooltip=tooltip
+            ))
+    else:
+        rows.append(menu_item("nodirs", _("No media folders specified; please, edit the configuration."), sensitive=False))
+
+    rows.append(separator("dirs_separator"))
+    rows.append(menu_item("showlog", _("Show MiniDLNA LOG"), "showlog"))
+    rows.append(menu_item("editconfig", _("Edit MiniDLNA configuration"), "editconfig"))
+    rows.append(separator("config_separator"))
+    rows.append(check_item("autostart", _("Autostart indicator"), auto_start, "autostart"))
+    rows.append(separator("help_separator"))
+    if state.update_available:
+        rows.append(menu_item(
+            "new_version", _("A new version of MiniDLNA has been detected; click here to show how to upgrade"),
+            "open", "https://github.com/okelet/minidlnaindicator"
+        ))
+    rows.append(menu_item("minidlna_help", _("MiniDLNA help"), "open", "https://help.ubuntu.com/community/MiniDLNA"))
+    rows.append(menu_item("indicator_help", _("MiniDLNA Indicator help"), "open", "https://github.com/okelet/minidlnaindicator"))
+    rows.append(menu_item("quit", _("Quit"), "quit"))
+
+    return rows
+
+
+def format_media_counts(counts: Mapping[str, int]) -> str:
+    labels = {
+        "audio": _("{count} audio"),
+        "video": _("{count} video"),
+        "image": _("{count} pictures"),
+    }
+    return ", ".join(labels[x].format(count=counts[x]) for x in MEDIA_CLASSES if counts.get(x))
+
+
+def build_resources_row(samples: Tuple[ResourceSample, ...]) -> MenuRow:
+
+    latest = samples[-1]
+    text = _("CPU {cpu}, memory {memory}").format(
+        cpu="{percent:.0f}%".format(percent=latest.cpu_percent) if latest.cpu_percent is not None else "-",
+        memory=format_size(latest.rss_bytes)
+    )
+    if latest.open_fds is not None:
+        text += ", " + _("{count} open files").format(count=latest.open_fds)
+
+    # Tells a busy scan (CPU and reads) from a stuck one (neither)
+    first = samples[0]
+    tooltip = _("Last {duration}: peak CPU {cpu:.0f}%, peak memory {memory}").format(
+        duration=format_duration(latest.timestamp - first.timestamp),
+        cpu=max((x.cpu_percent or 0) for x in samples),
+        memory=format_size(max(x.rss_bytes for x in samples))
+    )
+    if latest.read_bytes is not None and first.read_bytes is not None:
+        tooltip += "\n" + _("Read {read}, written {written}").format(
+            read=format_size(latest.read_bytes - first.read_bytes),
+            written=format_size((latest.write_bytes or 0) - (first.write_bytes or 0))
+        )
+    return menu_item("resources", text, sensitive=False, tooltip=tooltip)
+
+
+def format_health(health: HealthSnapshot) -> str:
+    if health.status == HealthStatus.STARTING:
+        return _("Waiting for the web server...")
+    elif health.status == HealthStatus.DOWN:
+        return _("The web server is not responding")
+    elif health.status == HealthStatus.DEGRADED and health.failures:
+        return _("The web server is failing")
+    elif health.status == HealthStatus.DEGRADED:
+        return _("The web server is slow (responds in {latency:.1f} seconds)").format(latency=health.p95)
+    elif health.status == HealthStatus.READY:
+        return _("The web server responds in {latency:.0f} ms").format(latency=(health.p50 or 0) * 1000)
+    return ""
+
+
+def format_failures(failures: Tuple[FailureRecord, ...]) -> str:
+    return "\n".join(
+        "{time}: {reason}".format(time=time.strftime("%X", time.localtime(x.timestamp)), reason=x.reason)
+        for x in failures[-5:]
+    )
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return "{size:.0f} {unit}".format(size=size, unit=unit)
+        size /= 1024
+    return "{size:.1f} GB".format(size=size)
+
+
+def format_start_plan(plan: StartPlan) -> str:
+
+    if plan.decision == StartDecision.START:
+        text = _("Started without reindexing")
+    elif plan.decision == StartDecision.RESCAN and plan.changed:
+        text = _("{count} folders changed since the last run; rescanning").format(count=len(plan.changed))
+    elif plan.decision == StartDecision.RESCAN:
+        text = _("Rescanning the media folders")
+    else:
+        text = _("Reindexing all the media folders")
+
+    if plan.saved_seconds and plan.saved_seconds > 0:
+        text += " " + _("(saved {duration})").format(duration=format_duration(plan.saved_seconds))
+    return text
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 3600:
+        return _("{hours} h {minutes} min").format(hours=int(seconds // 3600), minutes=int(seconds % 3600 // 60))
+    elif seconds >= 60:
+        return _("{minutes} min").format(minutes=int(seconds // 60))
+    return _("{seconds} s").format(seconds=int(seconds))
@@ -0,0 +1,247 @@
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import enum
+import os
+
+from .i18n import _
+
+
+class MiniDLNAMediaType(enum.Enum):
+    AUDIO = "audio"
+    VIDEO = "video"
+    PICTURES = "pictures"
+    PICTURESVIDEO = "picturesvideo"
+    MIXED = "mixed"
+
+
+# Type prefixes of media_dir (A, V, P or any combination of them) to media types
+MEDIA_TYPE_PREFIXES = {
+    "A": MiniDLNAMediaType.AUDIO,
+    "V": MiniDLNAMediaType.VIDEO,
+    "P": MiniDLNAMediaType.PICTURES,
+    "PV": MiniDLNAMediaType.PICTURESVIDEO,
+    "VP": MiniDLNAMediaType.PICTURESVIDEO,
+}
+
+
+class MiniDLNADirectory(object):
+
+    __slots__ = ("path", "media_type", "line")
+
+    def __init__(self, path: str, media_type: MiniDLNAMediaType, line: int=0) -> None:
+        self.path = path
+        self.media_type = media_type
+        self.line = line
+
+
+    @property
+    def description(self) -> str:
+        if self.media_type == MiniDLNAMediaType.AUDIO:
+            return _("Audio")
+        elif self.media_type == MiniDLNAMediaType.VIDEO:
+            return _("Video")
+        elif self.media_type == MiniDLNAMediaType.PICTURES:
+            return _("Pictures")
+        elif self.media_type == MiniDLNAMediaType.PICTURESVIDEO:
+            return _("Pictures/Video")
+        elif self.media_type == MiniDLNAMediaType.MIXED:
+            return _("Mixed")
+        else:
+            return _("Unknown")
+
+
+    @property
+    def accessable(self) -> bool:
+        return os.path.exists(self.path) and os.path.isdir(self.path) and os.access(self.path, os.R_OK)
+
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, MiniDLNADirectory) and self.path == other.path and self.media_type == other.media_type
+
+
+    def __hash__(self) -> int:
+        return hash((self.path, self.media_type))
+
+
+    def __repr__(self) -> str:
+        return "MiniDLNADirectory({path!r}, {media_type})".format(path=self.path, media_type=self.media_type.name)
+
+
+class ConfigDiagnostic(object):
+
+    __slots__ = ("line", "message")
+
+    def __init__(self, line: int, message: str) -> None:
+        self.line = line
+        self.message = message
+
+
+    def __repr__(self) -> str:
+        return "line {line}: {message}".format(line=self.line, message=self.message)
+
+
+def _parse_bool(value: str) -> bool:
+    lower = value.lower()
+    if lower in ("yes", "true", "on", "1"):
+        return True
+    if lower in ("no", "false", "off", "0"):
+        return False
+    raise ValueError("expected yes or no")
+
+
+def _parse_port(value: str) -> int:
+    port = int(value)
+    if not 0 < port < 65536:
+        raise ValueError("port out of range")
+    return port
+
+
+def _parse_positive_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise ValueError("negative value")
+    return number
+
+
+def _parse_list(separator: str) -> Callable[[str], Tuple[str, ...]]:
+    return lambda value: tuple(x.strip() for x in value.split(separator) if x.strip())
+
+
+def _parse_root_container(value: str) -> str:
+    # Aliases documented in minidlna.conf; any other value is a raw object id
+    return {".": "0", "B": "1", "M": "1$4", "V": "2$8", "P": "3$13"}.get(value, value)
+
+
+def _parse_log_level(value: str) -> Tuple[Tuple[str, str], ...]:
+    # general,artwork,database,inotify,scanner,metadata,http,ssdp,tivo=warn
+    levels = []  # type: List[Tuple[str, str]]
+    for item in value.split(","):
+        facility, _sep, level = item.strip().partition("=")
+        levels.append((facility.strip(), level.strip()))
+    return tuple(levels)
+
+
+# Every option understood by minidlnad, with the function that converts its value
+OPTIONS = {
+    "album_art_names": _parse_list("/"),
+    "db_dir": str,
+    "enable_subtitles": _parse_bool,
+    "enable_tivo": _parse_bool,
+    "force_sort_criteria": str,
+    "friendly_name": str,
+    "inotify": _parse_bool,
+    "log_dir": str,
+    "log_level": _parse_log_level,
+    "max_connections": _parse_positive_int,
+    "media_dir": str,
+    "merge_media_dirs": _parse_bool,
+    "minissdpdsocket": str,
+    "model_name": str,
+    "model_number": str,
+    "network_interface": _parse_list(","),
+    "notify_interval": _parse_positive_int,
+    "port": _parse_port,
+    "presentation_url": str,
+    "root_container": _parse_root_container,
+    "serial": str,
+    "strict_dlna": _parse_bool,
+    "tivo_discovery": str,
+    "user": str,
+    "uuid": str,
+    "wide_links": _parse_bool,
+}  # type: Dict[str, Callable[[str], Any]]
+
+# Options that can be specified several times; the values are accumulated
+MULTI_VALUE_OPTIONS = frozenset(["media_dir", "network_interface", "album_art_names"])
+
+
+class ParsedConfig(object):
+    """
+    Result of parsing a minidlna.conf file: the converted options, the media directories, the line where each option
+    was set and the problems found.
+    """
+
+    __slots__ = ("options", "dirs", "lines", "diagnostics")
+
+    def __init__(self) -> None:
+        self.options = {}  # type: Dict[str, Any]
+        self.dirs = []  # type: List[MiniDLNADirectory]
+        self.lines = {}  # type: Dict[str, int]
+        self.diagnostics = []  # type: List[ConfigDiagnostic]
+
+
+    def get(self, name: str, default: Any=None) -> Any:
+        return self.options.get(name, default)
+
+
+def parse_media_dir(value: str, line: int=0) -> MiniDLNADirectory:
+    """
+    Parses a media_dir value, with the optional type prefix (for example, "PV,/home/user/Pictures").
+    """
+    prefix, comma, path = value.partition(",")
+    if comma and 0 < len(prefix) <= 3:
+        upper_prefix = prefix.upper()
+        if not upper_prefix.strip("AVP"):
+            media_type = MEDIA_TYPE_PREFIXES.get(upper_prefix, MiniDLNAMediaType.MIXED)
+            return MiniDLNADirectory(path.strip(), media_type, line)
+    return MiniDLNADirectory(value, MiniDLNAMediaType.MIXED, line)
+
+
+def parse_config(lines: Iterable[str]) -> ParsedConfig:
+    """
+    Parses the lines of a minidlna.conf file in a single pass; invalid lines are recorded as diagnostics instead of
+    raising exceptions, as minidlnad does.
+    """
+
+    result = ParsedConfig()
+    options = result.options
+    option_lines = result.lines
+    diagnostics = result.diagnostics
+
+    for line_number, line in enumerate(lines, 1):
+
+        line = line.strip()
+        if not line or line[0] == "#":
+            continue
+
+        name, equals, value = line.partition("=")
+        if not equals:
+            diagnostics.append(ConfigDiagnostic(line_number, "missing '=' in line"))
+            continue
+
+        name = name.rstrip()
+        value = value.lstrip()
+        converter = OPTIONS.get(name)
+        if not converter:
+            diagnostics.append(ConfigDiagnostic(line_number, "unknown option {name}".format(name=name)))
+            continue
+        if not value:
+            diagnostics.append(ConfigDiagnostic(line_number, "empty value for option {name}".format(name=name)))
+            continue
+
+        if name == "media_dir":
+            result.dirs.append(parse_media_dir(value, line_number))
+            option_lines.setdefault(name, line_number)
+            continue
+
+        try:
+            converted = converter(value)
+        except ValueError as ex:
+            diagnostics.append(ConfigDiagnostic(
+                line_number, "invalid value {value!r} for option {name}: {error}".format(value=value, name=name, error=ex)
+            ))
+            continue
+
+        if name in MULTI_VALUE_OPTIONS:
+            options[name] = options.get(name, ()) + converted
+            option_lines.setdefault(name, line_number)
+        else:
+            if name in options:
+                diagnostics.append(ConfigDiagnostic(
+                    line_number,
+                    "option {name} already set in line {previous}".format(name=name, previous=option_lines[name])
+                ))
+            options[name] = converted
+            option_lines[name] = line_number
+
+    return result
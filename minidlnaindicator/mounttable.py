@@ -0,0 +1,119 @@
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import collections
+import re
+
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+# Pseudo and virtual filesystems that can never hold a media directory
+IGNORED_FSTYPES = frozenset([
+    "autofs", "binfmt_misc", "bpf", "cgroup", "cgroup2", "configfs", "debugfs", "devpts", "devtmpfs",
+    "efivarfs", "fusectl", "hugetlbfs", "mqueue", "nsfs", "overlay", "proc", "pstore", "rpc_pipefs",
+    "securityfs", "squashfs", "sysfs", "tracefs", "fuse.gvfsd-fuse", "fuse.portal", "fuse.snapfuse",
+])
+
+# Mount points created by snap, flatpak and container runtimes
+IGNORED_MOUNTPOINT_PREFIXES = (
+    "/snap/",
+    "/var/snap/",
+    "/var/lib/snapd/",
+    "/var/lib/docker/",
+    "/var/lib/containers/",
+    "/run/docker/",
+    "/run/snapd/",
+    "/run/user/",
+    "/dev/",
+    "/proc/",
+    "/sys/",
+)
+
+_OCTAL_ESCAPE_RE = re.compile(r"\\([0-7]{3})")
+
+
+MountPoint = collections.namedtuple("MountPoint", ["mount_id", "mountpoint", "fstype", "device"])
+
+
+def _unescape(value: str) -> str:
+    # The kernel escapes spaces, tabs, newlines and backslashes as \ooo
+    if "\\" not in value:
+        return value
+    return _OCTAL_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 8)), value)
+
+
+def is_ignored_mount(mountpoint: str, fstype: str, device: str) -> bool:
+    if fstype in IGNORED_FSTYPES:
+        return True
+    if device.startswith("/dev/loop"):
+        return True
+    return mountpoint.startswith(IGNORED_MOUNTPOINT_PREFIXES)
+
+
+def parse_mountinfo(data: str) -> List[MountPoint]:
+    """
+    Parses the contents of /proc/<pid>/mountinfo, skipping the mounts considered noise.
+    """
+    mounts = []  # type: List[MountPoint]
+    for line in data.splitlines():
+        fields = line.split(" ")
+        try:
+            separator = fields.index("-", 6)
+            mount_id = int(fields[0])
+            mountpoint = _unescape(fields[4])
+            fstype = fields[separator + 1]
+            device = _unescape(fields[separator + 2])
+        except (ValueError, IndexError):
+            continue
+        if not is_ignored_mount(mountpoint, fstype, device):
+            mounts.append(MountPoint(mount_id, mountpoint, fstype, device))
+    return mounts
+
+
+class MountTable(object):
+    """
+    Current mount table, indexed by mount point, that computes the differences between updates.
+    """
+
+    def __init__(self) -> None:
+        self._mounts = frozenset()  # type: FrozenSet[MountPoint]
+        self._by_mountpoint = {}  # type: Dict[str, MountPoint]
+
+
+    @property
+    def mountpoints(self) -> List[str]:
+        return sorted(self._by_mountpoint.keys())
+
+
+    def get(self, mountpoint: str) -> Optional[MountPoint]:
+        return self._by_mountpoint.get(mountpoint)
+
+
+    def find_mount(self, path: str) -> Optional[MountPoint]:
+        """
+        Returns the mount containing the path (the longest mount point that is a prefix of the path).
+        """
+        while True:
+            mount = self._by_mountpoint.get(path)
+            if mount:
+                return mount
+            if path in ("", "/"):
+                return None
+            parent = path.rsplit("/", 1)[0]
+            path = parent if parent else "/"
+
+
+    def update(self, mounts: Iterable[MountPoint]) -> Tuple[List[MountPoint], List[MountPoint]]:
+        """
+        Replaces the table with the given mounts, and returns the lists of added and removed mounts.
+        """
+        new_mounts = frozenset(mounts)
+        added = sorted(new_mounts - self._mounts, key=lambda x: x.mountpoint)
+        removed = sorted(self._mounts - new_mounts, key=lambda x: x.mountpoint)
+        if added or removed:
+            self._mounts = new_mounts
+            self._by_mountpoint = {x.mountpoint: x for x in new_mounts}
+        return added, removed
+
+
+    def __len__(self) -> int:
+        return len(self._mounts)
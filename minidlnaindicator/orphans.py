@@ -0,0 +1,151 @@
+from typing import Iterable, List, Optional, Set
+
+import collections
+import logging
+import os
+
+from .processwait import StopOutcome, terminate_processes
+
+
+MinidlnaProcess = collections.namedtuple("MinidlnaProcess", ["pid", "cmdline", "config_file", "owns_port"])
+
+OrphanReport = collections.namedtuple("OrphanReport", ["processes", "results", "port_busy"])
+OrphanReport.__doc__ = """
+Result of killing orphan minidlnad processes: the processes found, the stop result of each one, and whether the port
+is still used by a process that couldn't be identified (for example, of another user).
+"""
+
+TCP_LISTEN_STATE = "0A"
+
+_logger = logging.getLogger(__name__)
+
+
+def get_listening_inodes(port: int, proc_dir: str="/proc") -> Set[int]:
+    """
+    Returns the inodes of the TCP sockets (IPv4 and IPv6) listening on the port, from /proc/net/tcp{,6}.
+    """
+    inodes = set()  # type: Set[int]
+    port_hex = ":{port:04X}".format(port=port)
+    for table in ("tcp", "tcp6"):
+        try:
+            with open(os.path.join(proc_dir, "net", table)) as fp:
+                next(fp, None)
+                for line in fp:
+                    # sl local_address rem_address st tx_queue:rx_queue tr:tm->when retrnsmt uid timeout inode
+                    fields = line.split()
+                    if len(fields) > 9 and fields[3] == TCP_LISTEN_STATE and fields[1].endswith(port_hex):
+                        inodes.add(int(fields[9]))
+        except OSError:
+            continue
+    return inodes
+
+
+def get_socket_inodes(pid: int, proc_dir: str="/proc") -> Set[int]:
+    inodes = set()  # type: Set[int]
+    fd_dir = os.path.join(proc_dir, str(pid), "fd")
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return inodes
+    for fd in fds:
+        try:
+            target = os.readlink(os.path.join(fd_dir, fd))
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            inodes.add(int(target[8:-1]))
+    return inodes
+
+
+def get_config_argument(cmdline: List[str]) -> Optional[str]:
+    for index, argument in enumerate(cmdline):
+        if argument == "-f" and index + 1 < len(cmdline):
+            return cmdline[index + 1]
+        if argument.startswith("-f") and len(argument) > 2:
+            return argument[2:]
+    return None
+
+
+def find_minidlna_processes(uid: int, config_file: Optional[str], port: Optional[int], executable: str="minidlnad",
+                            exclude_pids: Iterable[int]=(), proc_dir: str="/proc") -> List[MinidlnaProcess]:
+    """
+    Scans /proc once and returns the minidlnad processes of the user that use the configuration file or listen on the
+    port (those with another configuration and port are left alone, as they belong to other instances).
+    """
+
+    excluded = set(exclude_pids)
+    excluded.add(os.getpid())
+    listening = get_listening_inodes(port, proc_dir) if port else set()
+    config_path = os.path.realpath(config_file) if config_file else None
+
+    processes = []  # type: List[MinidlnaProcess]
+    for entry in os.listdir(proc_dir):
+
+        if not entry.isdigit() or int(entry) in excluded:
+            continue
+        pid = int(entry)
+        process_dir = os.path.join(proc_dir, entry)
+
+        try:
+            if os.stat(process_dir).st_uid != uid:
+                continue
+            with open(os.path.join(process_dir, "comm"), "rb") as fp:
+                comm = os.fsdecode(fp.read().rstrip(b"\n"))
+            with open(os.path.join(process_dir, "cmdline"), "rb") as fp:
+                cmdline = [os.fsdecode(x) for x in fp.read().split(b"\0") if x]
+        except OSError:
+            # The process has finished while scanning
+            continue
+
+        # The executable is also looked for in the second argument, for scripts run through an interpreter
+        if comm != executable[:15] and not any(os.path.basename(x) == executable for x in cmdline[:2]):
+            continue
+
+        process_config = get_config_argument(cmdline)
+        uses_config = bool(config_path and process_config and os.path.realpath(process_config) == config_path)
+        owns_port = bool(listening & get_socket_inodes(pid, proc_dir)) if listening else False
+        if uses_config or owns_port:
+            processes.append(MinidlnaProcess(pid, cmdline, process_config, owns_port))
+
+    return processes
+
+
+def kill_orphan_processes(config_file: str, port: int, grace_period: float=10.0, exclude_pids: Iterable[int]=(),
+                          executable: str="minidlnad") -> OrphanReport:
+    """
+    Finds the orphan minidlnad processes of the current user for the configuration or the port, and stops all of them
+    at the same time.
+    """
+
+    processes = find_minidlna_processes(os.getuid(), config_file, port, executable, exclude_pids)
+    if not processes:
+        return OrphanReport([], [], bool(get_listening_inodes(port)))
+
+    _logger.warning("Stopping orphan minidlnad processes: %s", [(x.pid, x.cmdline) for x in processes])
+    # Those that can't be signalled (like those of another user) are reported as TIMED_OUT
+    results = terminate_processes([x.pid for x in processes], grace_period)
+
+    alive = [x for x in results if x.outcome == StopOutcome.TIMED_OUT]
+    port_busy = bool(alive) or bool(get_listening_inodes(port))
+    return OrphanReport(processes, results, port_busy)
+
+
+def free_port_from_orphans(config_file: str, port: int, grace_period: float=10.0, executable: str="minidlnad") -> bool:
+    """
+    Kills the orphan minidlnad processes after minidlnad couldn't listen on its port; returns if the port is free now.
+    """
+    _logger.warning("Address already in use error message detected; we will try to kill existing orphan process for the same user and start minidlna again.")
+    try:
+        report = kill_orphan_processes(config_file, port, grace_period, executable=executable)
+    except Exception as ex:
+        _logger.exception("Error while detecting existing minidlna process: %s", ex)
+        return False
+    if not report.processes:
+        # No process found for minidlna for the current user; perhaps there is another process using the same port
+        _logger.error("No orphan minidlna process found; the port %s is used by another process.", port)
+        return False
+    elif report.port_busy:
+        _logger.error("Orphan minidlna processes couldn't be killed: %s", report.results)
+        return False
+    _logger.info("Orphan minidlna processes killed (%s), starting again minidlna.", report.results)
+    return True
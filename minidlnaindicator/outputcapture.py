@@ -0,0 +1,75 @@
+from typing import Callable, List, Optional
+
+import collections
+import re
+
+
+OutputMatcher = collections.namedtuple("OutputMatcher", ["name", "regex"])
+
+# Known minidlnad messages that are worth handling as soon as they are printed
+DEFAULT_OUTPUT_MATCHERS = [
+    OutputMatcher("bind_http", re.compile(r"error: bind\(http\):")),
+    OutputMatcher("bind_ssdp", re.compile(r"error: bind\(udp\)|Failed to open socket for sending SSDP")),
+    OutputMatcher("inotify_limit", re.compile(r"WARNING: Inotify max_user_watches")),
+    OutputMatcher("database_error", re.compile(r"(?i)sqlite.*(error|failed)|Database (is )?(corrupt|error)")),
+    OutputMatcher("already_running", re.compile(r"already running")),
+]  # type: List[OutputMatcher]
+
+
+def make_matcher(name: str, pattern: str) -> OutputMatcher:
+    return OutputMatcher(name, re.compile(pattern))
+
+
+class OutputCapture(object):
+    """
+    Splits a byte stream into lines, keeping only the last max_lines lines (and at most max_line_length characters
+    per line), so memory doesn't grow however much the process prints. Every complete line is passed to the
+    matchers as soon as it arrives.
+    """
+
+    def __init__(self, matchers: List[OutputMatcher], on_match: Callable[[str, str], None], max_lines: int=200,
+                 max_line_length: int=4096) -> None:
+        self.matchers = matchers
+        self.on_match = on_match
+        self.max_line_length = max_line_length
+        self.lines = collections.deque(maxlen=max_lines)  # type: collections.deque
+        self.total_lines = 0
+        self._partial = b""
+
+
+    def feed(self, data: bytes) -> None:
+
+        data = self._partial + data
+        *complete, self._partial = data.split(b"\n")
+        for raw_line in complete:
+            self._add_line(raw_line)
+
+        if len(self._partial) > self.max_line_length:
+            # A line without end; keep the beginning and drop the rest
+            self._add_line(self._partial)
+            self._partial = b""
+
+
+    def close(self) -> None:
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = b""
+
+
+    def _add_line(self, raw_line: bytes) -> None:
+        line = raw_line[:self.max_line_length].decode("utf-8", "replace").rstrip("\r")
+        self.lines.append(line)
+        self.total_lines += 1
+        for matcher in self.matchers:
+            if matcher.regex.search(line):
+                self.on_match(matcher.name, line)
+
+
+    @property
+    def text(self) -> Optional[str]:
+        """
+        The buffered tail of the output, or None if nothing has been printed.
+        """
+        if not self.lines:
+            return None
+        return "\n".join(self.lines)
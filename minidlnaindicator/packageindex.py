@@ -0,0 +1,111 @@
+from typing import Dict, Optional
+
+import json
+import logging
+
+from .exceptions.updatecheck import UpdateCheckException
+from .persistence import write_file_atomic
+
+
+class PackageIndexClient(object):
+    """
+    Gets the latest version of a package from a PyPI compatible JSON API ({index_url}/{package}/json). The connection
+    is kept open between checks, and the ETag and Last-Modified of the last response are saved with the version found
+    in cache_file, so while the package doesn't change the index answers 304 without body. Not thread safe.
+    """
+
+    def __init__(self, index_url: str, cache_file: Optional[str]=None, timeout: float=5.0) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.index_url = index_url.rstrip("/")
+        self.cache_file = cache_file
+        self.timeout = timeout
+
+        self._session = None
+        self._cache = self._load_cache()
+
+
+    def _load_cache(self) -> Dict[str, dict]:
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            self._logger.warning("Ignoring invalid update check cache %s: %s", self.cache_file, ex)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+
+    def _save_cache(self) -> None:
+        if not self.cache_file:
+            return
+        try:
+            write_file_atomic(self.cache_file, json.dumps(self._cache))
+        except OSError as ex:
+            self._logger.error("Error saving the update check cache %s: %s", self.cache_file, ex)
+
+
+    def get_package_url(self, package_name: str) -> str:
+        return "{index_url}/{package_name}/json".format(index_url=self.index_url, package_name=package_name)
+
+
+    def get_latest_version(self, package_name: str, proxies: Optional[Dict[str, Optional[str]]]=None) -> str:
+        """
+        Returns the latest version of the package; raises UpdateCheckException if it can't be found.
+        """
+
+        # Loading requests takes a while; don't do it at startup
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+
+        package_url = self.get_package_url(package_name)
+        cached = self._cache.get(package_url)
+        headers = {}  # type: Dict[str, str]
+        if cached and cached.get("version"):
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        self._logger.debug("Getting package info from %s...", package_url)
+        try:
+            response = self._session.get(package_url, headers=headers, proxies=proxies, timeout=self.timeout)
+        except requests.RequestException as ex:
+            raise UpdateCheckException(str(ex))
+
+        with response:
+
+            if response.status_code == requests.codes.not_modified and cached:
+                self._logger.debug("Package info not modified.")
+                return cached["version"]
+            if response.status_code == requests.codes.not_found:
+                raise UpdateCheckException("Package {package_name} not found.".format(package_name=package_name))
+            if response.status_code != requests.codes.ok:
+                raise UpdateCheckException("Invalid response: {status}.".format(status=response.status_code))
+
+            try:
+                latest_version = response.json().get("info", {}).get("version")
+            except (ValueError, AttributeError) as ex:
+                raise UpdateCheckException("Error getting the JSON response: {error}".format(error=ex))
+            if not latest_version or not isinstance(latest_version, str):
+                raise UpdateCheckException("No version available in response.")
+
+            self._cache[package_url] = {
+                "version": latest_version,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            self._save_cache()
+            return latest_version
+
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
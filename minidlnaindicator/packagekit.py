@@ -0,0 +1,32 @@
+from typing import List
+
+import logging
+
+import dbus
+
+
+PACKAGEKIT_BUS_NAME = "org.freedesktop.PackageKit"
+PACKAGEKIT_PATH = "/org/freedesktop/PackageKit"
+PACKAGEKIT_MODIFY_INTERFACE = "org.freedesktop.PackageKit.Modify"
+
+# Distributions where MiniDLNA can be installed with PackageKit
+INSTALLABLE_DISTROS = ["fedora", "centos", "rhel", "ubuntu", "mint"]
+
+_logger = logging.getLogger(__name__)
+
+
+def can_install_packages() -> bool:
+    import distro
+    return distro.id() in INSTALLABLE_DISTROS
+
+
+def install_package_names(session_bus: dbus.SessionBus, names: List[str]) -> None:
+    """
+    Asks PackageKit to install the packages, showing its confirmation dialog; raises dbus.DBusException if the
+    installation is cancelled, forbidden or fails.
+    """
+    proxy = session_bus.get_object(PACKAGEKIT_BUS_NAME, PACKAGEKIT_PATH)
+    iface = dbus.Interface(proxy, PACKAGEKIT_MODIFY_INTERFACE)
+    _logger.debug("Calling InstallPackageNames DBUS method...")
+    iface.InstallPackageNames(dbus.UInt32(0), names, "show-confirm-search,hide-finished")
+    _logger.debug("InstallPackageNames returned.")
@@ -0,0 +1,94 @@
+from typing import Any, Callable, Dict, Optional
+
+import logging
+import os
+import threading
+
+
+_logger = logging.getLogger(__name__)
+
+
+def read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            return fp.read()
+    except (OSError, ValueError):
+        return None
+
+
+def write_file_atomic(path: str, content: str) -> bool:
+    """
+    Writes the content to the file unless it already has it, through a temporary file in the same directory that
+    replaces it once written, so a crash never leaves it half written. Returns if the file has been written; raises
+    OSError on errors.
+    """
+
+    if read_file(path) == content:
+        return False
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    # Unique, in case several threads write the same file
+    temp_file = "{path}.{pid}-{thread}.tmp".format(path=path, pid=os.getpid(), thread=threading.get_ident())
+    try:
+        with open(temp_file, "w", encoding="utf-8") as fp:
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temp_file, path)
+    except OSError:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+class DebouncedWriter(object):
+    """
+    Writes files some time after they are changed: the first change schedules a write with the scheduler (like a
+    GLib timeout), and the changes until then only replace the content, so a burst of changes (like toggling an option
+    several times) ends in a single write of the last content. The files are written with write_file_atomic, so
+    nothing is written if the content hasn't changed. flush writes the pending files at once (like when quitting).
+    """
+
+    def __init__(self, scheduler: Callable[[Callable[[], bool]], Any]) -> None:
+
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._pending = {}  # type: Dict[str, str]
+        self._write_scheduled = False
+
+
+    def write(self, path: str, content: str) -> None:
+        with self._lock:
+            self._pending[path] = content
+            schedule = not self._write_scheduled
+            self._write_scheduled = True
+        if schedule:
+            self._scheduler(self._on_scheduled)
+
+
+    def _on_scheduled(self) -> bool:
+        self.flush()
+        return False
+
+
+    def flush(self) -> None:
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._write_scheduled = False
+
+        # Compared with the files on disk every time, so the external changes are undone
+        for path, content in pending.items():
+            try:
+                if write_file_atomic(path, content):
+                    _logger.debug("File %s written.", path)
+                else:
+                    _logger.debug("File %s unchanged; not written.", path)
+            except OSError as ex:
+                _logger.error("Error writing the file %s: %s", path, ex)
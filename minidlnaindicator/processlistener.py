@@ -12,6 +12,10 @@ class ProcessListener(object):
         raise NotImplementedError()
 
 
+    def on_process_output_matched(self, matcher: str, line: str) -> None:
+        raise NotImplementedError()
+
+
     def on_process_finished(self, command: str, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str]) -> None:
         raise NotImplementedError()
 
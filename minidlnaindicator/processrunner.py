@@ -1,32 +1,70 @@
 
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 import logging
-import os
-import subprocess
-import threading
+import signal
 import time
 
-from .constants import APPINDICATOR_ID, LOCALE_DIR
+from gi.repository import GLib
+
 from .processlistener import ProcessListener
+from .outputcapture import OutputCapture, OutputMatcher, DEFAULT_OUTPUT_MATCHERS, make_matcher
 from .exceptions.processstop import ProcessStopException
 from .exceptions.processnotrunning import ProcessNotRunningException
+from .processwait import StopOutcome, StopResult, send_signal, terminate_process
+from .supervisor import ProcessSupervisor, SupervisedProcess
+
+
+_default_supervisor = None  # type: Optional[ProcessSupervisor]
+
+
+def get_default_supervisor() -> ProcessSupervisor:
+    global _default_supervisor
+    if _default_supervisor is None:
+        _default_supervisor = ProcessSupervisor()
+    return _default_supervisor
+
 
-import gettext
-_ = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True).gettext
+class _PendingStop(object):
+
+    __slots__ = ("pid", "on_stopped", "started", "outcome", "source_id")
+
+    def __init__(self, pid: int, on_stopped: Callable[[StopResult], None]) -> None:
+        self.pid = pid
+        self.on_stopped = on_stopped
+        self.started = time.monotonic()
+        # What it will be if the process exits now
+        self.outcome = StopOutcome.EXITED
+        self.source_id = 0
 
 
 class ProcessRunner(object):
+    """
+    Runs one process at a time and notifies its life cycle to the listeners. The processes are watched by a
+    ProcessSupervisor, shared by all the runners by default; it must be used from the GLib main loop thread, where the
+    listeners are called.
+    """
 
-    def __init__(self) -> None:
+    def __init__(self, matchers: Optional[List[OutputMatcher]]=None, max_output_lines: int=200, grace_period: float=10.0,
+                 supervisor: Optional[ProcessSupervisor]=None) -> None:
 
         self._logger = logging.getLogger(__name__)
 
         self.pid = 0
-        self._run_thread = None  # type: Optional[threading.Thread]
+        self.grace_period = grace_period
+        self.supervisor = supervisor or get_default_supervisor()
+        self.matchers = list(DEFAULT_OUTPUT_MATCHERS if matchers is None else matchers)
+        self.max_output_lines = max_output_lines
+        self._child = None  # type: Optional[SupervisedProcess]
+        self._starting = False
+        self._pending_stop = None  # type: Optional[_PendingStop]
         self._listeners = []  # type: List[ProcessListener]
 
 
+    def add_matcher(self, name: str, pattern: str) -> None:
+        self.matchers.append(make_matcher(name, pattern))
+
+
     def add_listener(self, listener: ProcessListener) -> bool:
         if listener not in self._listeners:
             self._listeners.append(listener)
@@ -42,73 +80,164 @@ class ProcessRunner(object):
 
 
     def is_running(self) -> bool:
-        if self._run_thread and self._run_thread.is_alive():
-            return True
-        else:
-            return False
+        # The process is considered running until its exit has been notified
+        child = self._child
+        return self._starting or bool(child and not child.finished)
 
 
-    def stop(self) -> bool:
+    def stop(self, grace_period: Optional[float]=None) -> StopResult:
+        """
+        Stops the process, escalating to SIGKILL after the grace period; when it returns EXITED or KILLED, the exit
+        has already been notified to the listeners.
+        """
 
-        if not self.pid:
+        pid = self.pid
+        child = self._child
+        if not pid or not child:
             raise ProcessNotRunningException()
 
-        self._logger.debug("Stopping process with PID %s...", self.pid)
+        self._cancel_pending_stop()
+        self._logger.debug("Stopping process with PID %s...", pid)
         try:
-            os.kill(self.pid, 15)
+            result = terminate_process(pid, self.grace_period if grace_period is None else grace_period)
         except OSError as ex:
             raise ProcessStopException(str(ex))
 
-        # Wait to the process to die
-        finish_time = time.time() + 5
-        while time.time() < finish_time:
-            if self.pid:
-                time.sleep(0.2)
-            else:
-                killed = True
-                break
+        if result.outcome != StopOutcome.TIMED_OUT:
+            # Don't wait for the main loop to notice the exit
+            self.supervisor.reap(child)
 
-        if killed:
-            return True
-        else:
+        self._logger.debug("Process with PID %s stopped: %s in %.3f seconds.", pid, result.outcome.value, result.elapsed)
+        return result
+
+
+    def stop_async(self, on_stopped: Callable[[StopResult], None], grace_period: Optional[float]=None,
+                   kill_timeout: float=2.0) -> None:
+        """
+        Like stop, but without blocking the main loop: SIGTERM is sent now, and SIGKILL from a timeout if the process is
+        still alive after the grace period. on_stopped is called once the exit has been notified to the listeners, or
+        with TIMED_OUT if the process is still alive kill_timeout seconds after SIGKILL.
+        """
+
+        pid = self.pid
+        child = self._child
+        if not pid or not child or child.finished:
+            raise ProcessNotRunningException()
+        if self._pending_stop:
+            raise ProcessStopException("The process is already being stopped.")
+
+        self._logger.debug("Stopping process with PID %s without waiting...", pid)
+        try:
+            send_signal(pid, signal.SIGTERM, child.pidfd)
+        except ProcessLookupError:
+            # Already exited; the supervisor notices it in the main loop
+            pass
+        except OSError as ex:
+            raise ProcessStopException(str(ex))
+
+        stop = self._pending_stop = _PendingStop(pid, on_stopped)
+        stop.source_id = GLib.timeout_add(
+            int((self.grace_period if grace_period is None else grace_period) * 1000), self._on_stop_timeout, stop,
+            kill_timeout
+        )
+
+
+    def _on_stop_timeout(self, stop: _PendingStop, kill_timeout: float) -> bool:
+
+        if stop is not self._pending_stop:
+            return False
+
+        if stop.outcome == StopOutcome.EXITED:
+            self._logger.warning("Process with PID %s still alive after the grace period; sending SIGKILL...", stop.pid)
+            try:
+                send_signal(stop.pid, signal.SIGKILL, self._child.pidfd if self._child else None)
+            except ProcessLookupError:
+                pass
+            except OSError as ex:
+                self._logger.error("Error killing the process with PID %s: %s", stop.pid, ex)
+            stop.outcome = StopOutcome.KILLED
+            stop.source_id = GLib.timeout_add(int(kill_timeout * 1000), self._on_stop_timeout, stop, kill_timeout)
             return False
 
+        self._pending_stop = None
+        self._finish_stop(stop, StopOutcome.TIMED_OUT)
+        return False
+
+
+    def _finish_stop(self, stop: _PendingStop, outcome: StopOutcome) -> None:
+        result = StopResult(stop.pid, outcome, time.monotonic() - stop.started)
+        self._logger.debug("Process with PID %s stopped: %s in %.3f seconds.", stop.pid, outcome.value, result.elapsed)
+        try:
+            stop.on_stopped(result)
+        except Exception as ex:
+            self._logger.exception("Error notifying the stop of the process with PID %s: %s", stop.pid, ex)
+
+
+    def _cancel_pending_stop(self) -> None:
+        if self._pending_stop:
+            GLib.source_remove(self._pending_stop.source_id)
+            self._pending_stop = None
+
 
     def start(self, command: List[str], ignore_running: bool=False) -> None:
 
         if self.is_running() and not ignore_running:
             raise RuntimeError()
 
-        self._run_thread = threading.Thread(target=self._start_blocking, kwargs={"command": command})
-        self._run_thread.start()
+        self._starting = True
+        try:
 
+            self._logger.debug("Notifying before starting...")
+            for listener in self._listeners:
+                listener.on_process_starting()
 
-    def _start_blocking(self, command: List[str]) -> None:
+            captures = (
+                OutputCapture(self.matchers, self._notify_match, self.max_output_lines),
+                OutputCapture(self.matchers, self._notify_match, self.max_output_lines),
+            )
 
-        self._logger.debug("Notifying before starting...")
-        for listener in self._listeners:
-            listener.on_process_starting()
+            def on_output(index: int, data: bytes) -> None:
+                captures[index].feed(data)
 
-        try:
+            def on_exit(pid: int, exit_code: int) -> None:
+                for capture in captures:
+                    capture.close()
+                self._notify_finished(command, pid, exit_code, captures[0].text, captures[1].text)
+                stop = self._pending_stop
+                if stop and stop.pid == pid:
+                    self._cancel_pending_stop()
+                    self._finish_stop(stop, stop.outcome)
 
             self._logger.debug("Starting process: %s...", command)
-            pipes = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-            self.pid = pipes.pid
+            try:
+                self._child = self.supervisor.spawn(command, on_output, on_exit)
+            except Exception as ex:
+                self._logger.exception("Error running command %s: %s.", command, ex)
+                self.pid = 0
+                for listener in self._listeners:
+                    listener.on_process_error(str(ex))
+                return
+
+            self.pid = self._child.pid
 
             self._logger.debug("Notifying process started with PID %s...", self.pid)
             for listener in self._listeners:
                 listener.on_process_started(self.pid)
 
-            std_out, std_err = pipes.communicate()
-            exit_code = pipes.returncode
+        finally:
+            self._starting = False
+
 
-            self._logger.debug("Notifying process finished; PID: %s, exit code: %s...", self.pid, exit_code)
-            pid = self.pid
+    def _notify_finished(self, command: List[str], pid: int, exit_code: int, std_out: Optional[str],
+                         std_err: Optional[str]) -> None:
+        self._logger.debug("Notifying process finished; PID: %s, exit code: %s...", pid, exit_code)
+        if self.pid == pid:
             self.pid = 0
-            for listener in self._listeners:
-                listener.on_process_finished(command, pid, exit_code, std_out, std_err)
+        for listener in self._listeners:
+            listener.on_process_finished(command, pid, exit_code, std_out, std_err)
 
-        except Exception as ex:
-            self._logger.exception("Error running command %s: %s.", command, ex)
-            for listener in self._listeners:
-                listener.on_process_error(str(ex))
+
+    def _notify_match(self, matcher: str, line: str) -> None:
+        self._logger.debug("Output line matched by %s: %s", matcher, line)
+        for listener in self._listeners:
+            listener.on_process_output_matched(matcher, line)
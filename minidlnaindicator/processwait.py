@@ -0,0 +1,200 @@
+from typing import Dict, List, Optional, Tuple
+
+import collections
+import enum
+import logging
+import os
+import select
+import signal
+import time
+
+
+class StopOutcome(enum.Enum):
+    NOT_RUNNING = "not_running"
+    EXITED = "exited"
+    KILLED = "killed"
+    TIMED_OUT = "timed_out"
+
+
+StopResult = collections.namedtuple("StopResult", ["pid", "outcome", "elapsed"])
+StopResult.__doc__ = """
+Result of stopping a process: how it finished (exited after SIGTERM, killed with SIGKILL, still alive, or not running
+at all) and the seconds it took.
+"""
+
+_logger = logging.getLogger(__name__)
+
+
+def open_pidfd(pid: int) -> Optional[int]:
+    """
+    Returns a pidfd for the process, or None if pidfds are not supported. Raises ProcessLookupError if the process
+    doesn't exist. Once opened, the pidfd always refers to the same process, even if the PID is reused.
+    """
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except ProcessLookupError:
+        raise
+    except OSError as ex:
+        # ENOSYS on kernels older than 5.3
+        _logger.debug("pidfd_open not available: %s", ex)
+        return None
+
+
+def is_zombie(pid: int) -> bool:
+    try:
+        with open("/proc/{pid}/stat".format(pid=pid), "rb") as fp:
+            stat = fp.read()
+    except OSError:
+        return False
+    # The command name may contain spaces and parentheses; the state comes after the last parenthesis
+    return stat[stat.rfind(b")") + 2:][:1] == b"Z"
+
+
+def is_alive(pid: int) -> bool:
+    """
+    Returns if the process is running; zombies (exited but not reaped by their parent yet) are not.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return not is_zombie(pid)
+
+
+def wait_for_exit(pid: int, timeout: float, pidfd: Optional[int]=None) -> bool:
+    """
+    Waits until the process exits or the timeout expires, and returns if it has exited. With a pidfd the wait is a
+    single poll call; otherwise the process is checked with increasing intervals.
+    """
+
+    if pidfd is not None:
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        return bool(poller.poll(max(0, timeout) * 1000))
+
+    deadline = time.monotonic() + timeout
+    interval = 0.001
+    while is_alive(pid):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, 0.1)
+    return True
+
+
+def send_signal(pid: int, signum: int, pidfd: Optional[int]=None) -> None:
+    if pidfd is not None and hasattr(signal, "pidfd_send_signal"):
+        signal.pidfd_send_signal(pidfd, signum)
+    else:
+        os.kill(pid, signum)
+
+
+def terminate_process(pid: int, grace_period: float=10.0, kill_timeout: float=2.0) -> StopResult:
+    """
+    Sends SIGTERM to the process and waits up to grace_period seconds; if it is still alive, sends SIGKILL and waits
+    up to kill_timeout seconds more. It is safe to call from any thread, and doesn't need to be the parent process.
+    Raises PermissionError if the process can't be signalled.
+    """
+    results, errors = _terminate_all([pid], grace_period, kill_timeout)
+    if pid in errors:
+        raise errors[pid]
+    return results[0]
+
+
+def terminate_processes(pids: List[int], grace_period: float=10.0, kill_timeout: float=2.0) -> List[StopResult]:
+    """
+    Like terminate_process, but signals all the processes at once and waits for all of them together, so the total
+    time is that of the slowest one. Returns the results in the same order as the PIDs; the processes that can't be
+    signalled are reported as TIMED_OUT, and the others are stopped anyway.
+    """
+    return _terminate_all(pids, grace_period, kill_timeout)[0]
+
+
+def _terminate_all(pids: List[int], grace_period: float,
+                   kill_timeout: float) -> Tuple[List[StopResult], Dict[int, PermissionError]]:
+
+    start = time.monotonic()
+    results = {}  # type: Dict[int, StopResult]
+    errors = {}  # type: Dict[int, PermissionError]
+    pidfds = {}  # type: Dict[int, Optional[int]]
+
+    try:
+
+        for pid in pids:
+            try:
+                pidfds[pid] = open_pidfd(pid)
+                send_signal(pid, signal.SIGTERM, pidfds[pid])
+            except ProcessLookupError:
+                results[pid] = StopResult(pid, StopOutcome.NOT_RUNNING, time.monotonic() - start)
+            except PermissionError as ex:
+                _logger.error("Error stopping the process %s: %s", pid, ex)
+                errors[pid] = ex
+                results[pid] = StopResult(pid, StopOutcome.TIMED_OUT, time.monotonic() - start)
+
+        pending = [x for x in pids if x not in results]
+        for pid in _wait_for_all(pending, pidfds, start + grace_period):
+            results[pid] = StopResult(pid, StopOutcome.EXITED, time.monotonic() - start)
+
+        pending = [x for x in pending if x not in results]
+        if pending:
+            _logger.warning("Processes %s still alive after %s seconds; sending SIGKILL...", pending, grace_period)
+            for pid in pending:
+                try:
+                    send_signal(pid, signal.SIGKILL, pidfds[pid])
+                except ProcessLookupError:
+                    results[pid] = StopResult(pid, StopOutcome.EXITED, time.monotonic() - start)
+                except PermissionError as ex:
+                    _logger.error("Error killing the process %s: %s", pid, ex)
+                    errors[pid] = ex
+                    results[pid] = StopResult(pid, StopOutcome.TIMED_OUT, time.monotonic() - start)
+
+        pending = [x for x in pending if x not in results]
+        for pid in _wait_for_all(pending, pidfds, time.monotonic() + kill_timeout):
+            results[pid] = StopResult(pid, StopOutcome.KILLED, time.monotonic() - start)
+
+        for pid in pending:
+            if pid not in results:
+                results[pid] = StopResult(pid, StopOutcome.TIMED_OUT, time.monotonic() - start)
+
+    finally:
+        for pidfd in pidfds.values():
+            if pidfd is not None:
+                os.close(pidfd)
+
+    return [results[x] for x in pids], errors
+
+
+def _wait_for_all(pids: List[int], pidfds: Dict[int, Optional[int]], deadline: float) -> List[int]:
+    """
+    Waits until all the processes exit or the deadline passes, and returns the PIDs of those that have exited.
+    """
+
+    exited = []  # type: List[int]
+    pending = list(pids)
+
+    with_pidfd = [x for x in pending if pidfds.get(x) is not None]
+    if with_pidfd:
+        poller = select.poll()
+        pid_by_fd = {}  # type: Dict[int, int]
+        for pid in with_pidfd:
+            poller.register(pidfds[pid], select.POLLIN)
+            pid_by_fd[pidfds[pid]] = pid
+        while pid_by_fd:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for fd, _event in poller.poll(remaining * 1000):
+                poller.unregister(fd)
+                exited.append(pid_by_fd.pop(fd))
+        pending = [x for x in pending if x not in with_pidfd]
+
+    for pid in pending:
+        if wait_for_exit(pid, deadline - time.monotonic()):
+            exited.append(pid)
+
+    return exited
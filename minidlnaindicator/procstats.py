@@ -0,0 +1,66 @@
+from typing import Optional
+
+import collections
+import os
+
+
+ProcessStats = collections.namedtuple(
+    "ProcessStats", ["pid", "rss_bytes", "cpu_seconds", "threads", "open_fds", "read_bytes", "write_bytes"]
+)
+ProcessStats.__doc__ = """
+Resources used by a process, read from /proc: resident memory, CPU time (user plus system), threads, open file
+descriptors, and bytes read from and written to storage (the last three None if they can't be read).
+"""
+
+ResourceSample = collections.namedtuple(
+    "ResourceSample", ["timestamp", "cpu_percent", "rss_bytes", "read_bytes", "write_bytes", "open_fds", "threads"]
+)
+ResourceSample.__doc__ = """
+Resources used by a process at a moment (monotonic timestamp): CPU percentage since the previous sample (of one CPU;
+None for the first sample), resident memory, total bytes read and written, open file descriptors and threads (None
+when they can't be read).
+"""
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def read_process_stats(pid: int) -> Optional[ProcessStats]:
+    """
+    Returns the resources used by the process, or None if it doesn't exist (or has exited).
+    """
+
+    proc_dir = "/proc/{pid}".format(pid=pid)
+    try:
+        with open(os.path.join(proc_dir, "stat"), "rb") as fp:
+            stat = fp.read()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+
+    # The command name may contain spaces and parentheses; the fields after it start with the state (field 3)
+    fields = stat[stat.rfind(b")") + 2:].split()
+    if fields[0] == b"Z":
+        return None
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    threads = int(fields[17])
+    rss_bytes = int(fields[21]) * PAGE_SIZE
+
+    # Only readable for the processes of the same user
+    try:
+        open_fds = len(os.listdir(os.path.join(proc_dir, "fd")))
+    except OSError:
+        open_fds = None
+
+    read_bytes = write_bytes = None
+    try:
+        with open(os.path.join(proc_dir, "io"), "r") as fp:
+            for line in fp:
+                name, _sep, value = line.partition(":")
+                if name == "read_bytes":
+                    read_bytes = int(value)
+                elif name == "write_bytes":
+                    write_bytes = int(value)
+    except OSError:
+        pass
+
+    return ProcessStats(pid, rss_bytes, cpu_seconds, threads, open_fds, read_bytes, write_bytes)
@@ -0,0 +1,119 @@
+from typing import Callable, Iterable, List, Optional
+
+import collections
+import logging
+import os
+
+from .constants import MINIDLNA_PROFILES_DIR, PROFILE_NAME_RE
+from .indicatorstate import RunnerPhase
+from .minidlnaconfig import MiniDLNAConfig
+from .processlistener import ProcessListener
+from .processrunner import ProcessRunner
+from .processwait import StopOutcome, StopResult
+from .supervisor import ProcessSupervisor
+
+
+ProfileStatus = collections.namedtuple("ProfileStatus", ["name", "phase", "pid", "port", "config_file", "log"])
+
+
+def is_valid_profile_name(name: str) -> bool:
+    return bool(PROFILE_NAME_RE.match(name))
+
+
+class MiniDLNAProfile(ProcessListener):
+    """
+    An additional minidlnad instance, with its own configuration, database and log under
+    ~/.minidlna/profiles/<name>. All the profiles share the same ProcessSupervisor, so they don't need a thread each.
+    """
+
+    def __init__(self, name: str, supervisor: ProcessSupervisor, on_change: Callable[["MiniDLNAProfile"], None],
+                 grace_period: float=10.0, reserved_ports: Iterable[int]=()) -> None:
+
+        self.logger = logging.getLogger(__name__)
+
+        self.name = name
+        self.on_change = on_change
+        self.profile_dir = os.path.join(MINIDLNA_PROFILES_DIR, name)
+
+        self.config = MiniDLNAConfig(
+            None, os.path.join(self.profile_dir, "minidlna.conf"),
+            config_dir=self.profile_dir, cache_dir=os.path.join(self.profile_dir, "cache"),
+            profile_name=name, reserved_ports=reserved_ports
+        )
+
+        self.phase = RunnerPhase.STOPPED
+        self.pid = 0
+        self.runner = ProcessRunner(grace_period=grace_period, supervisor=supervisor)
+        self.runner.add_listener(self)
+
+
+    @property
+    def status(self) -> ProfileStatus:
+        return ProfileStatus(self.name, self.phase, self.pid, self.config.port, self.config.config_file, self.config.log)
+
+
+    def get_command(self, minidlna_path: str) -> List[str]:
+        return [minidlna_path, "-f", self.config.config_file, "-P", "/dev/null", "-S"]
+
+
+    def start(self, minidlna_path: str) -> None:
+        if self.runner.is_running():
+            raise RuntimeError()
+        # Pick up the changes done to the configuration since the last start
+        self.config.reload_config()
+        self.runner.start(self.get_command(minidlna_path))
+
+
+    def stop(self, wait: bool=False) -> None:
+        """
+        Stops the profile; unless waiting (like when quitting), the main loop goes on while it stops.
+        """
+        if not self.runner.is_running():
+            raise RuntimeError()
+        self._set_phase(RunnerPhase.STOPPING)
+        try:
+            if wait:
+                self._on_stopped(self.runner.stop())
+            else:
+                self.runner.stop_async(self._on_stopped)
+        except Exception:
+            self._set_phase(RunnerPhase.RUNNING if self.runner.is_running() else RunnerPhase.STOPPED)
+            raise
+
+
+    def _on_stopped(self, result: StopResult) -> None:
+        if result.outcome == StopOutcome.TIMED_OUT:
+            self.logger.warning("MiniDLNA profile %s has not finished after the kill signal in the allowed time.", self.name)
+
+
+    def _set_phase(self, phase: RunnerPhase, pid: Optional[int]=None) -> None:
+        self.phase = phase
+        if pid is not None:
+            self.pid = pid
+        self.on_change(self)
+
+
+    def on_process_starting(self) -> None:
+        self._set_phase(RunnerPhase.STARTING, 0)
+
+
+    def on_process_started(self, pid: int) -> None:
+        self._set_phase(RunnerPhase.RUNNING, pid)
+
+
+    def on_process_output_matched(self, matcher: str, line: str) -> None:
+        self.logger.debug("MiniDLNA profile %s printed a known message (%s): %s", self.name, matcher, line)
+
+
+    def on_process_finished(self, command: str, pid: int, exit_code: int, std_out: Optional[str], std_err: Optional[str]) -> None:
+        if exit_code != 0 and self.phase != RunnerPhase.STOPPING:
+            self.logger.error(
+                "MiniDLNA profile %s has exited without success; PID: %s, return code: %s, std out: %s, std err: %s",
+                self.name, pid, exit_code, std_out, std_err
+            )
+        self._set_phase(RunnerPhase.STOPPED, 0)
+
+
+    def on_process_error(self, reason: str) -> None:
+        self.logger.error("Error running MiniDLNA profile %s: %s", self.name, reason)
+        self._set_phase(RunnerPhase.STOPPED, 0)
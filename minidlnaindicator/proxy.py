@@ -1,49 +1,77 @@
-
-from typing import  Optional, List
+from typing import Dict, Iterable, Optional, List, Pattern
 
 import fnmatch
 import logging
-import urllib
+import re
+import urllib.parse
+
+
+def compile_exceptions(patterns: Iterable[str]) -> Optional[Pattern]:
+    """
+    Compiles the host patterns (shell wildcards, like in no_proxy or the GNOME ignore-hosts) into a single regular
+    expression, or returns None if there are no patterns.
+    """
+    patterns = [x for x in patterns if x]
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(x) for x in patterns), re.IGNORECASE)
 
 
 class Proxy(object):
 
-    def __init__(self, host: str=None, port: int=0, username: Optional[str]=None, password: Optional[str]=None, exceptions: Optional[List[str]]=[]) -> None:
+    # Hosts whose result is remembered; the update checks only ask for one or two
+    MAX_CACHED_HOSTS = 64
+
+    def __init__(self, host: str=None, port: int=0, username: Optional[str]=None, password: Optional[str]=None, exceptions: Optional[List[str]]=None) -> None:
         self.logger = logging.getLogger(__name__)
         self.host = host
         self.port = port
         self.username = username
         self.password = password
-        self.exceptions = exceptions
+        self.exceptions = exceptions or []
+
+
+    @property
+    def exceptions(self) -> List[str]:
+        return self._exceptions
+
+
+    @exceptions.setter
+    def exceptions(self, exceptions: List[str]) -> None:
+        self._exceptions = list(exceptions)
+        self._exceptions_re = compile_exceptions(self._exceptions)
+        self._allowed_hosts = {}  # type: Dict[Optional[str], bool]
 
 
     def to_url(self, include_password: bool=False) -> str:
         proxy = "http://"
         if self.username and self.password:
-            proxy += urllib.quote(self.username) + ":" + (urllib.quote(self.password) if include_password else "*******") + "@"
+            proxy += urllib.parse.quote(self.username) + ":" + (urllib.parse.quote(self.password) if include_password else "*******") + "@"
         elif self.username:
-            proxy += urllib.quote(self.username) + "@"
+            proxy += urllib.parse.quote(self.username) + "@"
         elif self.password:
-            proxy += (urllib.quote(self.password) if include_password else "*******") + "@"
+            proxy += (urllib.parse.quote(self.password) if include_password else "*******") + "@"
         proxy += self.host + ":" + str(self.port)
         return proxy
 
 
     def allows_url(self, url: str) -> bool:
-        self.logger.debug("Checking if proxy %s is valid for URL %s...", self.to_url(), url)
         return self.allows_host(urllib.parse.urlparse(url).hostname)
 
 
-    def allows_host(self, host: str) -> bool:
-
-        self.logger.debug("Checking if proxy %s is valid for host %s...", self.to_url(), host)
-        for exception in self.exceptions:
-            if fnmatch.fnmatch(host, exception):
-                self.logger.debug("Host %s found in exception %s, ignoring proxy...", host, exception)
-                return False
+    def allows_host(self, host: Optional[str]) -> bool:
 
-        self.logger.debug("Host not in exceptions; returning proxy %s...", self.to_url())
-        return True
+        allowed = self._allowed_hosts.get(host)
+        if allowed is None:
+            allowed = not (host and self._exceptions_re and self._exceptions_re.match(host))
+            if len(self._allowed_hosts) >= self.MAX_CACHED_HOSTS:
+                self._allowed_hosts.clear()
+            self._allowed_hosts[host] = allowed
+            if allowed:
+                self.logger.debug("Host %s not in exceptions; using proxy %s.", host, self.to_url())
+            else:
+                self.logger.debug("Host %s found in exceptions, ignoring proxy %s.", host, self.to_url())
+        return allowed
 
 
     def __repr__(self) -> str:
@@ -0,0 +1,151 @@
+from typing import Callable, List, Optional
+
+import collections
+import enum
+import logging
+import time
+
+from gi.repository import GLib
+
+from .procstats import ProcessStats, ResourceSample, read_process_stats
+
+
+ResourceThresholds = collections.namedtuple("ResourceThresholds", ["max_rss_bytes", "max_cpu_percent", "cpu_seconds"])
+ResourceThresholds.__doc__ = """
+Limits that raise alerts: resident memory (a leak), and CPU percentage sustained for cpu_seconds (a runaway
+process); 0 disables the limit.
+"""
+
+
+class ResourceAlert(enum.Enum):
+    HIGH_MEMORY = "high_memory"
+    HIGH_CPU = "high_cpu"
+
+
+class ResourceMonitor(object):
+    """
+    Samples the resources used by a process from the GLib main loop (reading /proc is cheap enough), every
+    scan_interval seconds while minidlnad scans and every idle_interval seconds otherwise, and keeps the last
+    history_size samples. on_sample is called with every sample, and on_alert with the alert and the sample when a
+    threshold is crossed (once, until the value goes back under it).
+    """
+
+    def __init__(self, on_sample: Callable[[ResourceSample], None],
+                 on_alert: Callable[[ResourceAlert, ResourceSample], None], thresholds: ResourceThresholds,
+                 history_size: int=120, idle_interval: int=30, scan_interval: int=2) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.on_sample = on_sample
+        self.on_alert = on_alert
+        self.thresholds = thresholds
+        self.idle_interval = idle_interval
+        self.scan_interval = scan_interval
+
+        self._history = collections.deque(maxlen=history_size)  # type: collections.deque
+        self._pid = 0
+        self._scanning = False
+        self._source_id = None  # type: Optional[int]
+        self._previous = None  # type: Optional[ProcessStats]
+        self._previous_time = 0.0
+        self._cpu_high_since = None  # type: Optional[float]
+        self._active_alerts = set()  # type: set
+
+
+    @property
+    def history(self) -> List[ResourceSample]:
+        return list(self._history)
+
+
+    @property
+    def latest(self) -> Optional[ResourceSample]:
+        return self._history[-1] if self._history else None
+
+
+    def set_pid(self, pid: int) -> None:
+        """
+        Starts sampling the process, or stops with 0. The history is kept until another process is sampled.
+        """
+        if pid == self._pid:
+            return
+        self._pid = pid
+        self._previous = None
+        self._cpu_high_since = None
+        self._active_alerts.clear()
+        if pid:
+            self._history.clear()
+        self._reschedule()
+
+
+    def set_scanning(self, scanning: bool) -> None:
+        if scanning != self._scanning:
+            self._scanning = scanning
+            self._reschedule()
+
+
+    def _reschedule(self) -> None:
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+        if self._pid:
+            self._sample()
+            self._source_id = GLib.timeout_add_seconds(
+                self.scan_interval if self._scanning else self.idle_interval, self._on_timeout
+            )
+
+
+    def _on_timeout(self) -> bool:
+        self._sample()
+        return True
+
+
+    def _sample(self) -> None:
+
+        now = time.monotonic()
+        stats = read_process_stats(self._pid)
+        if stats is None:
+            # Exited; set_pid(0) will follow
+            return
+
+        cpu_percent = None
+        if self._previous is not None and now > self._previous_time:
+            cpu_percent = max(0.0, (stats.cpu_seconds - self._previous.cpu_seconds) / (now - self._previous_time) * 100)
+        self._previous, self._previous_time = stats, now
+
+        sample = ResourceSample(
+            now, cpu_percent, stats.rss_bytes, stats.read_bytes, stats.write_bytes, stats.open_fds, stats.threads
+        )
+        self._history.append(sample)
+        self.on_sample(sample)
+        self._check_thresholds(sample)
+
+
+    def _check_thresholds(self, sample: ResourceSample) -> None:
+
+        max_rss_bytes, max_cpu_percent, cpu_seconds = self.thresholds
+
+        self._set_alert(ResourceAlert.HIGH_MEMORY, bool(max_rss_bytes) and sample.rss_bytes > max_rss_bytes, sample)
+
+        if max_cpu_percent and sample.cpu_percent is not None and sample.cpu_percent > max_cpu_percent:
+            if self._cpu_high_since is None:
+                # The percentage is the average since the previous sample, so count from it
+                self._cpu_high_since = self._history[-2].timestamp if len(self._history) > 1 else sample.timestamp
+            self._set_alert(ResourceAlert.HIGH_CPU, sample.timestamp - self._cpu_high_since >= cpu_seconds, sample)
+        else:
+            self._cpu_high_since = None
+            self._set_alert(ResourceAlert.HIGH_CPU, False, sample)
+
+
+    def _set_alert(self, alert: ResourceAlert, active: bool, sample: ResourceSample) -> None:
+        if active and alert not in self._active_alerts:
+            self._active_alerts.add(alert)
+            self._logger.warning("Resource alert %s for PID %s: %s", alert.value, self._pid, sample)
+            self.on_alert(alert, sample)
+        elif not active:
+            self._active_alerts.discard(alert)
+
+
+    def stop(self) -> None:
+        self._logger.debug("Stopping resource monitor...")
+        self._pid = 0
+        self._reschedule()
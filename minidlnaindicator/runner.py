@@ -1,19 +1,18 @@
 
 import argparse
 import logging
+import logging.config
 import os
 import sys
 
-from minidlnaindicator.constants import LOG_DIR, LOG_LEVELS, LOGGING_CONFIG, APPINDICATOR_ID, LOCALE_DIR
+from minidlnaindicator.constants import LOG_DIR, LOG_LEVELS, LOGGING_CONFIG
 from minidlnaindicator.exceptions.alreadyrunning import AlreadyRunningException
-from minidlnaindicator.indicator import MiniDLNAIndicator
 from minidlnaindicator.indicatorconfig import MiniDLNAIndicatorConfig
 
-import gettext
-_ = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True).gettext
+from minidlnaindicator.i18n import _
 
 
-def indicator() -> None:
+def indicator(headless_mode: bool=False) -> None:
 
     if not os.path.exists(LOG_DIR):
         os.mkdir(LOG_DIR)
@@ -22,10 +21,13 @@ def indicator() -> None:
     parser.add_argument('-c', '--config')
     parser.add_argument('--stderr', action='store_true')
     parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--headless', action='store_true', help=_("run MiniDLNA without the indicator"))
     parser.add_argument('-l', '--log-level', choices=LOG_LEVELS.keys())
     args = parser.parse_args()
+    headless_mode = headless_mode or args.headless
 
-    if args.stderr:
+    # Without a desktop, the log goes to the console too (like the journal of a service)
+    if args.stderr or headless_mode:
         LOGGING_CONFIG["loggers"]["minidlnaindicator"]["handlers"].append("console_handler")
 
     if args.log_level:
@@ -41,6 +43,14 @@ def indicator() -> None:
         print(_("Error loading the configuration: {error}.").format(error=str(ex)), file=sys.stderr)
         sys.exit(1)
 
+    if headless_mode:
+        # Doesn't load Gtk at all
+        from minidlnaindicator.headless import HeadlessSupervisor
+        sys.exit(HeadlessSupervisor(config).run())
+
+    # Gtk and the rest of the indicator are only loaded once the arguments and the configuration are valid
+    from minidlnaindicator.indicator import MiniDLNAIndicator
+
     try:
         app = MiniDLNAIndicator(config, args.test_mode)
         app.run()
@@ -50,5 +60,9 @@ def indicator() -> None:
         sys.exit(0)
 
 
+def headless() -> None:
+    indicator(headless_mode=True)
+
+
 if __name__ == "__main__":
     indicator()
@@ -0,0 +1,180 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import time
+
+import dbus
+import dbus.service
+
+from .constants import APP_DBUS_INTERFACE
+from .dirprobe import ProbeStatus
+from .healthcheck import LatencyHistogram
+from .indicatorstate import IndicatorState, RunnerPhase
+from .procstats import read_process_stats, ResourceSample
+from .watchdogstatus import FailureRecord
+
+
+def get_status(state: IndicatorState, now: Optional[float]=None) -> Dict[str, Any]:
+    """
+    Returns the status of minidlnad as D-Bus values; the keys without value (like the exit code before the first exit)
+    are left out. uptime is only included while running.
+    """
+
+    status = {
+        "phase": dbus.String(state.phase.value),
+        "pid": dbus.UInt32(state.pid or 0),
+        "port": dbus.Int32(state.config.port or 0),
+        "restart_count": dbus.UInt32(max(0, state.start_count - 1)),
+        "scanning": dbus.Boolean(bool(state.scanning)),
+        "file_errors": dbus.UInt32(state.file_errors),
+        "clients": dbus.Array(sorted(state.clients), signature="s"),
+        "library_total": dbus.UInt64(state.library.total),
+        "restart_circuit": dbus.String(state.watchdog.circuit.value),
+        "auto_restarts": dbus.UInt32(state.watchdog.restarts),
+        "restart_pending": dbus.Boolean(state.watchdog.restart_pending),
+        "health": dbus.String(state.health.status.value),
+    }  # type: Dict[str, Any]
+    if state.minidlna_path:
+        status["minidlna_path"] = dbus.String(state.minidlna_path)
+    if state.last_exit_code is not None:
+        status["last_exit_code"] = dbus.Int32(state.last_exit_code)
+    if state.update_available:
+        status["update_available"] = dbus.String(state.update_available)
+    for name in ("time_to_ready", "p50", "p95"):
+        if getattr(state.health, name) is not None:
+            status[name if name == "time_to_ready" else "latency_" + name] = dbus.Double(getattr(state.health, name))
+    if state.phase == RunnerPhase.RUNNING and state.started_at is not None:
+        status["uptime"] = dbus.Double((time.monotonic() if now is None else now) - state.started_at)
+    return status
+
+
+def get_directories(state: IndicatorState) -> List[Tuple[str, str, str]]:
+    """
+    Returns the media directories as (path, media type, status) tuples; the status is "checking", "accessible",
+    "inaccessible" or "timeout".
+    """
+    return [
+        (x.path, x.media_type.value, state.dir_status.get(x.path, ProbeStatus.CHECKING).value)
+        for x in state.config.dirs
+    ]
+
+
+def get_resources(pid: int) -> Dict[str, Any]:
+    """
+    Returns the resources used by the process as D-Bus values; empty if it isn't running. The figures that can't be
+    read are left out.
+    """
+    stats = read_process_stats(pid) if pid else None
+    if not stats:
+        return {}
+    resources = {
+        "pid": dbus.UInt32(stats.pid),
+        "rss_bytes": dbus.UInt64(stats.rss_bytes),
+        "cpu_seconds": dbus.Double(stats.cpu_seconds),
+        "threads": dbus.UInt32(stats.threads),
+    }  # type: Dict[str, Any]
+    for name in ("open_fds", "read_bytes", "write_bytes"):
+        if getattr(stats, name) is not None:
+            resources[name] = dbus.UInt64(getattr(stats, name))
+    return resources
+
+
+def get_sample_values(sample: ResourceSample) -> Dict[str, Any]:
+    """
+    Returns a resource sample as D-Bus values; the timestamp is the seconds since it was taken, and the figures that
+    couldn't be read are left out.
+    """
+    values = {
+        "age": dbus.Double(max(0.0, time.monotonic() - sample.timestamp)),
+        "rss_bytes": dbus.UInt64(sample.rss_bytes),
+    }  # type: Dict[str, Any]
+    if sample.cpu_percent is not None:
+        values["cpu_percent"] = dbus.Double(sample.cpu_percent)
+    for name in ("read_bytes", "write_bytes", "open_fds", "threads"):
+        if getattr(sample, name) is not None:
+            values[name] = dbus.UInt64(getattr(sample, name))
+    return values
+
+
+def get_histogram_values(histograms: Dict[str, LatencyHistogram]) -> Dict[str, List[Tuple[float, int]]]:
+    """
+    Returns the latency histograms of the paths as (upper bound in seconds, count) buckets, leaving out the empty ones;
+    the bound of the last bucket is infinite.
+    """
+    return {
+        path: dbus.Array([(dbus.Double(x), dbus.UInt64(y)) for x, y in histogram.get_buckets()], signature="(dt)")
+        for path, histogram in histograms.items()
+    }
+
+
+def get_failure_values(failure: FailureRecord) -> Dict[str, Any]:
+    """
+    Returns a failure as D-Bus values; the exit code is left out if the process was restarted because it didn't
+    respond.
+    """
+    values = {
+        "timestamp": dbus.Double(failure.timestamp),
+        "reason": dbus.String(failure.reason),
+        "action": dbus.String(failure.action.value),
+    }  # type: Dict[str, Any]
+    if failure.exit_code is not None:
+        values["exit_code"] = dbus.Int32(failure.exit_code)
+    return values
+
+
+class StatusInterface(dbus.service.Object):
+    """
+    The D-Bus interface of the indicator (documented in the README), for monitoring scripts. Subclasses provide the
+    StateStore as "store" and the HealthProbe as "health_probe", and call notify_state_changed from the main loop after every render.
+    """
+
+    _last_status = None  # type: Optional[Dict[str, Any]]
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="a{sv}")
+    def GetStatus(self) -> Dict[str, Any]:
+        return get_status(self.store.state)
+
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="a(sss)")
+    def GetDirectories(self) -> List[Tuple[str, str, str]]:
+        return get_directories(self.store.state)
+
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="a{sv}")
+    def GetResources(self) -> Dict[str, Any]:
+        return get_resources(self.store.state.pid)
+
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="aa{sv}")
+    def GetResourceHistory(self) -> List[Dict[str, Any]]:
+        return [get_sample_values(x) for x in self.store.state.resources]
+
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="a{sa(dt)}")
+    def GetLatencyHistograms(self) -> Dict[str, List[Tuple[float, int]]]:
+        return get_histogram_values(self.health_probe.histograms)
+
+
+    @dbus.service.method(APP_DBUS_INTERFACE, out_signature="aa{sv}")
+    def GetFailures(self) -> List[Dict[str, Any]]:
+        return [get_failure_values(x) for x in self.store.state.watchdog.failures]
+
+
+    @dbus.service.signal(APP_DBUS_INTERFACE, signature="a{sv}")
+    def StateChanged(self, status: Dict[str, Any]) -> None:
+        pass
+
+
+    @dbus.service.signal(APP_DBUS_INTERFACE, signature="sa{sv}")
+    def ResourceAlert(self, alert: str, sample: Dict[str, Any]) -> None:
+        pass
+
+
+    def notify_state_changed(self, state: IndicatorState) -> None:
+        """
+        Emits StateChanged with the new status, unless nothing but the uptime has changed.
+        """
+        status = get_status(state)
+        comparable = {x: y for x, y in status.items() if x != "uptime"}
+        if comparable != self._last_status:
+            self._last_status = comparable
+            self.StateChanged(status)
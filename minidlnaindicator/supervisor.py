@@ -0,0 +1,179 @@
+from typing import Callable, List, Optional, Set
+
+import logging
+import os
+import subprocess
+
+from gi.repository import GLib
+
+from .processwait import open_pidfd
+
+
+def get_exit_code(status: int) -> int:
+    """
+    Converts a wait status into an exit code like subprocess does (negative for the signal that killed the process).
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class SupervisedProcess(object):
+    """
+    A child process watched by a ProcessSupervisor; on_output is called with the stream index (0 for stdout, 1 for
+    stderr) and the data read, and on_exit with the PID and the exit code, both from the GLib main loop.
+    """
+
+    __slots__ = ("command", "popen", "pidfd", "on_output", "on_exit", "finished", "_streams", "_sources")
+
+    def __init__(self, command: List[str], popen: subprocess.Popen, pidfd: Optional[int],
+                 on_output: Callable[[int, bytes], None], on_exit: Callable[[int, int], None]) -> None:
+        self.command = command
+        self.popen = popen
+        self.pidfd = pidfd
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.finished = False
+        self._streams = [popen.stdout, popen.stderr]
+        self._sources = []  # type: List[int]
+
+
+    @property
+    def pid(self) -> int:
+        return self.popen.pid
+
+
+class ProcessSupervisor(object):
+    """
+    Watches any number of child processes from the GLib main loop, without threads: the output pipes of every child
+    and, when available, its pidfd (which becomes readable when it exits) are main loop sources; without pidfds, the
+    exit is detected with a child watch. Must be used from the main loop thread.
+    """
+
+    def __init__(self) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self._children = set()  # type: Set[SupervisedProcess]
+
+
+    @property
+    def children(self) -> List[SupervisedProcess]:
+        return list(self._children)
+
+
+    def spawn(self, command: List[str], on_output: Callable[[int, bytes], None],
+              on_exit: Callable[[int, int], None]) -> SupervisedProcess:
+        """
+        Starts the process and watches it; raises the errors of subprocess.Popen.
+        """
+
+        popen = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # Not reaped yet, so the PID can't have been reused even if it has already exited
+        pidfd = open_pidfd(popen.pid)
+
+        child = SupervisedProcess(command, popen, pidfd, on_output, on_exit)
+        self._children.add(child)
+
+        for index, stream in enumerate(child._streams):
+            os.set_blocking(stream.fileno(), False)
+            child._sources.append(GLib.unix_fd_add_full(
+                GLib.PRIORITY_DEFAULT, stream.fileno(),
+                GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+                self._on_stream_ready, child, index
+            ))
+
+        # Lower priority than the pipes, so the output is read before the exit is notified
+        if pidfd is not None:
+            child._sources.append(GLib.unix_fd_add_full(
+                GLib.PRIORITY_LOW, pidfd, GLib.IOCondition.IN, self._on_pidfd_ready, child
+            ))
+        else:
+            child._sources.append(GLib.child_watch_add(GLib.PRIORITY_LOW, popen.pid, self._on_child_exited, child))
+
+        return child
+
+
+    def _on_stream_ready(self, _fd: int, _condition: GLib.IOCondition, child: SupervisedProcess, index: int) -> bool:
+        return self._read(child, index)
+
+
+    def _on_pidfd_ready(self, _fd: int, _condition: GLib.IOCondition, child: SupervisedProcess) -> bool:
+        self.reap(child)
+        return False
+
+
+    def _on_child_exited(self, _pid: int, status: int, child: SupervisedProcess) -> None:
+        # GLib has already reaped the process, so Popen can't get the exit code itself
+        child.popen.returncode = get_exit_code(status)
+        self.reap(child)
+
+
+    def _read(self, child: SupervisedProcess, index: int) -> bool:
+        """
+        Reads the available data of a stream, and closes it at the end; returns if there may be more data.
+        """
+        stream = child._streams[index]
+        if stream is None:
+            return False
+        try:
+            data = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return True
+        if data:
+            self._notify(child.on_output, index, data)
+            return True
+        stream.close()
+        child._streams[index] = None
+        # Returning False removes the source
+        child._sources[index] = 0
+        return False
+
+
+    def reap(self, child: SupervisedProcess) -> None:
+        """
+        Finishes watching a process that has exited: reads what is left in its pipes, collects the exit code and
+        notifies it. Can be called before the main loop detects the exit (ProcessRunner.stop does it), and does
+        nothing if the process has already been reaped.
+        """
+
+        if child.finished:
+            return
+        child.finished = True
+
+        for source_id in child._sources:
+            if source_id:
+                GLib.source_remove(source_id)
+        child._sources = []
+
+        # Whatever was written before exiting is still in the pipes; if a process that inherited them keeps them
+        # open, only what is already there is read
+        for index, stream in enumerate(child._streams):
+            if stream is None:
+                continue
+            try:
+                while True:
+                    data = os.read(stream.fileno(), 65536)
+                    if not data:
+                        break
+                    self._notify(child.on_output, index, data)
+            except BlockingIOError:
+                pass
+            stream.close()
+            child._streams[index] = None
+
+        if child.pidfd is not None:
+            os.close(child.pidfd)
+            child.pidfd = None
+
+        exit_code = child.popen.wait()
+        self._children.discard(child)
+        self._logger.debug("Process %s finished with exit code %s.", child.pid, exit_code)
+        self._notify(child.on_exit, child.pid, exit_code)
+
+
+    def _notify(self, callback: Callable, *args) -> None:
+        try:
+            callback(*args)
+        except Exception as ex:
+            self._logger.exception("Error in process supervisor callback: %s", ex)
@@ -0,0 +1,73 @@
+from typing import Callable, Dict, Hashable
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+from ..menumodel import MenuBackend, MenuRow, MENU_CHECK_ITEM, MENU_SEPARATOR
+
+
+class GtkMenuBackend(MenuBackend):
+    """
+    Applies the changes computed by MenuModel to a Gtk.Menu. Each widget gets a single activate handler, bound to its
+    row key, for its whole life; the handler is gone when the widget is destroyed.
+    """
+
+    def __init__(self, menu: Gtk.Menu, on_activate: Callable[[Hashable], None]) -> None:
+        self.menu = menu
+        self.on_activate = on_activate
+        self._handlers = {}  # type: Dict[Gtk.MenuItem, int]
+
+
+    def create(self, row: MenuRow) -> Gtk.MenuItem:
+
+        if row.kind == MENU_SEPARATOR:
+            return Gtk.SeparatorMenuItem()
+
+        if row.kind == MENU_CHECK_ITEM:
+            widget = Gtk.CheckMenuItem(row.label)
+            widget.set_active(row.active)
+        else:
+            widget = Gtk.MenuItem(row.label)
+        widget.set_sensitive(row.sensitive)
+        if row.tooltip:
+            widget.set_tooltip_text(row.tooltip)
+        self._handlers[widget] = widget.connect('activate', self._on_widget_activated, row.key)
+        return widget
+
+
+    def update(self, widget: Gtk.MenuItem, old_row: MenuRow, new_row: MenuRow) -> None:
+
+        if old_row.label != new_row.label:
+            widget.set_label(new_row.label)
+        if old_row.sensitive != new_row.sensitive:
+            widget.set_sensitive(new_row.sensitive)
+        if old_row.tooltip != new_row.tooltip:
+            widget.set_tooltip_text(new_row.tooltip)
+        if old_row.active != new_row.active:
+            # Changing the state of a check item emits activate; it must not be seen as a user action
+            handler_id = self._handlers.get(widget)
+            if handler_id:
+                widget.handler_block(handler_id)
+            widget.set_active(new_row.active)
+            if handler_id:
+                widget.handler_unblock(handler_id)
+
+
+    def insert(self, widget: Gtk.MenuItem, position: int) -> None:
+        self.menu.insert(widget, position)
+        widget.show()
+
+
+    def move(self, widget: Gtk.MenuItem, position: int) -> None:
+        self.menu.reorder_child(widget, position)
+
+
+    def remove(self, widget: Gtk.MenuItem) -> None:
+        self._handlers.pop(widget, None)
+        self.menu.remove(widget)
+        widget.destroy()
+
+
+    def _on_widget_activated(self, _widget: Gtk.MenuItem, key: Hashable) -> None:
+        self.on_activate(key)
@@ -7,10 +7,7 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 
-from ..constants import LOCALE_DIR, APPINDICATOR_ID
-
-import gettext
-_ = gettext.translation(APPINDICATOR_ID, LOCALE_DIR, fallback=True).gettext
+from ..i18n import _
 
 
 ERROR_MESSAGE_OPTIONS = (Gtk.MessageType.ERROR, _("Error"))
@@ -2,23 +2,35 @@
 from typing import List, Optional
 
 import logging
-import requests
+import random
 import threading
 
+from gi.repository import GLib
+
+from .constants import PYPI_URL, TEST_PYPI_URL, UPDATE_CHECK_CACHE_FILE
+from .exceptions.updatecheck import UpdateCheckException
+from .packageindex import PackageIndexClient
 from .update_check_listener import UpdateCheckListener
+from .versions import is_newer_version
 
 
 class UpdateCheckConfig(object):
 
     def __init__(self) -> None:
         self.time_between_update_checks = 1800
+        # PyPI compatible index to check, instead of PyPI (or TestPyPI in test mode)
+        self.update_index_url = None  # type: Optional[str]
 
 
-class UpdateCheckThread(threading.Thread):
-
-    def __init__(self, config: UpdateCheckConfig, package_name: str, current_version: str, test_mode: str) -> None:
+class UpdateChecker(object):
+    """
+    Checks for new versions periodically with GLib timeouts; each check runs in a short-lived worker thread (so the
+    HTTP request doesn't block the main loop), and the listeners are called from the main loop. After a failed check,
+    the next one is done sooner, with a jittered exponential backoff capped at the normal interval.
+    """
 
-        threading.Thread.__init__(self)
+    def __init__(self, config: UpdateCheckConfig, package_name: str, current_version: str, test_mode: str,
+                 cache_file: Optional[str]=UPDATE_CHECK_CACHE_FILE, retry_interval: int=60) -> None:
 
         self._logger = logging.getLogger(__name__)
 
@@ -26,8 +38,20 @@ class UpdateCheckThread(threading.Thread):
         self.package_name = package_name
         self.current_version = current_version
         self.test_mode = test_mode
+        self.retry_interval = retry_interval
+
+        if config.update_index_url:
+            index_url = config.update_index_url
+        elif test_mode:
+            index_url = TEST_PYPI_URL
+        else:
+            index_url = PYPI_URL
+        self.client = PackageIndexClient(index_url, cache_file)
 
-        self._stop_signal = threading.Event()
+        self._source_id = None  # type: Optional[int]
+        self._checking = False
+        self._failures = 0
+        self._previous_fetched_version = None  # type: Optional[str]
         self._listeners = []  # type: List[UpdateCheckListener]
 
 
@@ -45,78 +69,111 @@ class UpdateCheckThread(threading.Thread):
         return False
 
 
-    def run(self) -> None:
+    def is_running(self) -> bool:
+        return self._source_id is not None
+
 
-        self._logger.debug("Starting update check thread...")
+    def start(self) -> None:
 
-        self._stop_signal.clear()
+        self._logger.debug("Starting update checker...")
 
         # Wait 120 seconds before the first update check
+        self._schedule(10 if self.test_mode else 120)
+
+
+    def _schedule(self, seconds: int) -> None:
+        self._source_id = GLib.timeout_add_seconds(seconds, self._on_timeout)
+
+
+    def get_next_check_delay(self) -> int:
+
         if self.test_mode:
-            self._stop_signal.wait(10)
+            # In test mode, we wait only 30 seconds
+            interval = 30
         else:
-            self._stop_signal.wait(120)
-
-        previous_fetched_version = None
-        while not self._stop_signal.is_set():
-
-            self._logger.debug("Checking for new version...")
-            try:
-
-                if self.test_mode:
-                    pypi_url = "https://testpypi.python.org/pypi"
-                else:
-                    pypi_url = "https://pypi.python.org/pypi"
-                proxy = self.config.detect_proxy()
-
-                self._logger.debug("Getting package info from %s...", pypi_url)
-                package_url = "{pypi_url}/{package_name}/json".format(pypi_url=pypi_url, package_name=self.package_name)
-                response = requests.get(
-                    package_url,
-                    timeout=5,
-                    proxies={
-                        "http": proxy.to_url(include_password=True) if proxy and proxy.allows_url(pypi_url) else None,
-                        "https": proxy.to_url(include_password=True) if proxy and proxy.allows_url(pypi_url) else None,
-                    }
-                )
-                if response.status_code == requests.codes.not_found:
-                    self._logger.error("Package %s not found.", self.package_name)
-                elif response.status_code != requests.codes.ok:
-                    self._logger.error("Invalid response: %s.", response.status_code)
-                else:
-                    try:
-                        latest_version = response.json().get("info", {}).get("version")
-                        if not latest_version:
-                            self._logger.error("No version available in response.")
-                        else:
-                            self._logger.debug("Latest version: %s", latest_version)
-                            if latest_version == self.current_version:
-                                self._logger.debug("Package up to date.")
-                            elif latest_version < self.current_version:
-                                self._logger.error("Current version (%s) is newer than Pypi version (%s).", self.current_version, latest_version)
-                            else:
-                                if not previous_fetched_version or previous_fetched_version < latest_version:
-                                    previous_fetched_version = latest_version
-                                    self._logger.info("New version detected; current: %s, new: %s", self.current_version, latest_version)
-                                    for listener in self._listeners:
-                                        listener.on_update_detected(latest_version)
-                    except ValueError as ve:
-                        self._logger.exception("Error getting the JSON response: %s", ve)
-
-            except Exception as ex:
-                self._logger.exception("Exception when checking for updates: %s", ex)
-
-            if self.test_mode:
-                # In test mode, we wait only 30 seconds
-                self._stop_signal.wait(30)
-            else:
-                # In normal mode, we weit the time configured, normally, 1800 seconds
-                self._stop_signal.wait(self.config.time_between_update_checks)
+            # In normal mode, we weit the time configured, normally, 1800 seconds
+            interval = self.config.time_between_update_checks
+
+        if not self._failures:
+            return interval
+        # Between the half and the whole of the backoff, so many clients failing at once don't retry at once
+        backoff = min(interval, self.retry_interval * 2 ** (self._failures - 1))
+        return max(1, int(random.uniform(backoff / 2, backoff)))
 
-        self._logger.debug("Update check thread finished.")
+
+    def _on_timeout(self) -> bool:
+        # The next check is scheduled when this one finishes
+        self._source_id = 0
+        self._checking = True
+        threading.Thread(target=self._check_worker, daemon=True).start()
+        return False
+
+
+    def _check_worker(self) -> None:
+        try:
+            latest_version = self.check()
+            failed = False
+        except UpdateCheckException as ex:
+            self._logger.error("Error checking for updates: %s", ex)
+            latest_version, failed = None, True
+        except Exception as ex:
+            self._logger.exception("Exception when checking for updates: %s", ex)
+            latest_version, failed = None, True
+        GLib.idle_add(self._on_checked, latest_version, failed)
+
+
+    def _on_checked(self, latest_version: Optional[str], failed: bool) -> bool:
+
+        self._checking = False
+        if self._source_id is None:
+            # Stopped meanwhile
+            self.client.close()
+            return False
+
+        self._failures = self._failures + 1 if failed else 0
+        self._schedule(self.get_next_check_delay())
+
+        if latest_version:
+            if not self._previous_fetched_version or is_newer_version(latest_version, self._previous_fetched_version):
+                self._previous_fetched_version = latest_version
+                self._logger.info("New version detected; current: %s, new: %s", self.current_version, latest_version)
+                for listener in self._listeners:
+                    listener.on_update_detected(latest_version)
+        return False
+
+
+    def check(self) -> Optional[str]:
+        """
+        Returns the latest version if it is newer than the current one; raises UpdateCheckException if it can't be
+        checked.
+        """
+
+        self._logger.debug("Checking for new version...")
+
+        proxy = self.config.detect_proxy()
+        index_url = self.client.index_url
+        proxy_url = proxy.to_url(include_password=True) if proxy and proxy.allows_url(index_url) else None
+        latest_version = self.client.get_latest_version(self.package_name, {"http": proxy_url, "https": proxy_url})
+        self._logger.debug("Latest version: %s", latest_version)
+
+        try:
+            if is_newer_version(latest_version, self.current_version):
+                return latest_version
+            elif is_newer_version(self.current_version, latest_version):
+                self._logger.error("Current version (%s) is newer than Pypi version (%s).", self.current_version, latest_version)
+            else:
+                self._logger.debug("Package up to date.")
+        except ValueError as ex:
+            raise UpdateCheckException(str(ex))
+        return None
 
 
     def stop(self) -> None:
 
-        self._logger.debug("Stopping update check thread...")
-        self._stop_signal.set()
+        self._logger.debug("Stopping update checker...")
+        if self._source_id:
+            GLib.source_remove(self._source_id)
+        self._source_id = None
+        # Otherwise, closed once the running check finishes
+        if not self._checking:
+            self.client.close()
@@ -0,0 +1,65 @@
+from typing import Tuple
+
+import re
+
+
+# From the appendix of PEP 440, accepting the alternative spellings it allows
+VERSION_RE = re.compile(r"""
+    ^\s*v?
+    (?:(?P<epoch>[0-9]+)!)?
+    (?P<release>[0-9]+(?:\.[0-9]+)*)
+    (?P<pre>[-_.]?(?P<pre_l>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_n>[0-9]+)?)?
+    (?P<post>(?:-(?P<post_n1>[0-9]+))|(?:[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>[0-9]+)?))?
+    (?P<dev>[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>[0-9]+)?)?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    \s*$
+""", re.VERBOSE | re.IGNORECASE)
+
+PRE_RELEASE_ORDER = {"a": 0, "alpha": 0, "b": 1, "beta": 1, "c": 2, "rc": 2, "pre": 2, "preview": 2}
+
+
+def parse_version(version: str) -> Tuple:
+    """
+    Returns a key that sorts the versions like PEP 440 does: 1.0.dev1 < 1.0a1 < 1.0rc1 < 1.0 == 1.0.0 < 1.0.post1 <
+    1.0+local < 1.1. Raises ValueError if the version is not valid.
+    """
+
+    match = VERSION_RE.match(version)
+    if not match:
+        raise ValueError("Invalid version: {version}".format(version=version))
+
+    release = [int(x) for x in match.group("release").split(".")]
+    while len(release) > 1 and release[-1] == 0:
+        release.pop()
+
+    # Development releases of a final version go before its pre-releases
+    if match.group("pre"):
+        pre = (0, PRE_RELEASE_ORDER[match.group("pre_l").lower()], int(match.group("pre_n") or 0))
+    elif match.group("dev") and not match.group("post"):
+        pre = (-1,)
+    else:
+        pre = (1,)
+
+    if match.group("post"):
+        post = (0, int(match.group("post_n1") or match.group("post_n2") or 0))
+    else:
+        post = (-1,)
+
+    dev = (0, int(match.group("dev_n") or 0)) if match.group("dev") else (1,)
+
+    # Numeric segments of local versions sort after alphanumeric ones
+    local = ()  # type: Tuple
+    if match.group("local"):
+        local = tuple(
+            (1, int(x), "") if x.isdigit() else (0, 0, x.lower())
+            for x in re.split(r"[-_.]", match.group("local"))
+        )
+
+    return int(match.group("epoch") or 0), tuple(release), pre, post, dev, local
+
+
+def is_newer_version(version: str, other: str) -> bool:
+    """
+    Returns if version is newer than other; raises ValueError if any of them is not valid.
+    """
+    return parse_version(version) > parse_version(other)
@@ -0,0 +1,195 @@
+from typing import Callable, Dict, Optional
+
+import collections
+import logging
+import random
+import time
+
+from gi.repository import GLib
+
+from .watchdogstatus import RestartAction, CircuitState, FailureRecord, WatchdogStatus, DEFAULT_RESTART_RULES
+
+
+class RestartWatchdog(object):
+    """
+    Decides, from the GLib main loop, how to react when the process exits without being asked: each exit code can be
+    restarted or not (rules), restarts wait an exponential backoff with jitter after consecutive failures (the count
+    is reset once the process has run for stable_seconds), and after max_failures within window seconds the circuit
+    breaker opens and restarts are paused for cooldown seconds. While running, the results of the liveness checks are
+    given with report_liveness; after liveness_failures failed checks in a row the process is considered hung, and
+    on_hung is called to restart it, under the same limits.
+    """
+
+    def __init__(self, restart: Callable[[], None], on_hung: Callable[[], None],
+                 on_change: Callable[[WatchdogStatus], None], rules: Optional[Dict[int, RestartAction]]=None,
+                 enabled: bool=True, max_failures: int=5, window: float=300.0, base_delay: float=1.0,
+                 max_delay: float=60.0, cooldown: float=600.0, stable_seconds: float=30.0, liveness_failures: int=3,
+                 history_size: int=20) -> None:
+
+        self._logger = logging.getLogger(__name__)
+
+        self.restart = restart
+        self.on_hung = on_hung
+        self.on_change = on_change
+        self.rules = dict(DEFAULT_RESTART_RULES)
+        self.rules.update(rules or {})
+        self.enabled = enabled
+        self.max_failures = max_failures
+        self.window = window
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cooldown = cooldown
+        self.stable_seconds = stable_seconds
+        self.liveness_failures = liveness_failures
+
+        self._circuit = CircuitState.CLOSED
+        self._restarts = 0
+        self._consecutive_failures = 0
+        self._failure_times = collections.deque()  # type: collections.deque
+        self._history = collections.deque(maxlen=history_size)  # type: collections.deque
+        self._restart_source_id = None  # type: Optional[int]
+        self._stable_source_id = None  # type: Optional[int]
+        self._running = False
+        self._failed_checks = 0
+
+
+    @property
+    def status(self) -> WatchdogStatus:
+        return WatchdogStatus(self._circuit, self._restarts, tuple(self._history), self._restart_source_id is not None)
+
+
+    def get_action(self, exit_code: int) -> RestartAction:
+        if not self.enabled:
+            return RestartAction.STOP
+        return self.rules.get(exit_code, RestartAction.RESTART)
+
+
+    def process_started(self) -> None:
+        self._cancel_sources()
+        self._running = True
+        self._failed_checks = 0
+        self._stable_source_id = GLib.timeout_add(int(self.stable_seconds * 1000), self._on_stable)
+
+
+    def process_stopped(self) -> None:
+        """
+        The process has been stopped on request.
+        """
+        self._cancel_sources()
+        self._notify()
+
+
+    def process_exited(self, exit_code: int, reason: str, action: Optional[RestartAction]=None) -> Optional[float]:
+        """
+        Records an unexpected exit and schedules the restart if the rules and the limits allow it; returns the seconds
+        until the restart, or None if it won't be restarted. action overrides the rules.
+        """
+        self._cancel_sources()
+        delay = self._handle_failure(exit_code, reason, action or self.get_action(exit_code))
+        if delay is not None:
+            self._restart_source_id = GLib.timeout_add(int(delay * 1000), self._on_restart_timeout)
+        self._notify()
+        return delay
+
+
+    def reset(self) -> None:
+        """
+        Closes the circuit breaker and cancels any pending restart (when the user starts the process).
+        """
+        self._cancel_sources()
+        if self._restart_source_id is not None:
+            GLib.source_remove(self._restart_source_id)
+            self._restart_source_id = None
+        self._circuit = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._failure_times.clear()
+        self._notify()
+
+
+    def _handle_failure(self, exit_code: Optional[int], reason: str, action: RestartAction) -> Optional[float]:
+
+        now = time.monotonic()
+        self._failure_times.append(now)
+        while self._failure_times and self._failure_times[0] < now - self.window:
+            self._failure_times.popleft()
+
+        delay = None  # type: Optional[float]
+        if action == RestartAction.RESTART:
+            self._consecutive_failures += 1
+            if self._circuit == CircuitState.HALF_OPEN or len(self._failure_times) >= self.max_failures:
+                self._circuit = CircuitState.OPEN
+                delay = self.cooldown
+                self._logger.error(
+                    "%s failures in %s seconds; pausing the automatic restarts for %s seconds.",
+                    len(self._failure_times), self.window, self.cooldown
+                )
+            elif self._circuit == CircuitState.CLOSED:
+                backoff = min(self.max_delay, self.base_delay * 2 ** (self._consecutive_failures - 1))
+                # Between the half and the whole of the backoff, so restarts of several processes don't align
+                delay = random.uniform(backoff / 2, backoff)
+
+        self._history.append(FailureRecord(time.time(), exit_code, reason, action))
+        return delay
+
+
+    def _on_restart_timeout(self) -> bool:
+        self._restart_source_id = None
+        if self._circuit == CircuitState.OPEN:
+            self._circuit = CircuitState.HALF_OPEN
+        self._restarts += 1
+        self._notify()
+        self.restart()
+        return False
+
+
+    def _on_stable(self) -> bool:
+        self._stable_source_id = None
+        self._consecutive_failures = 0
+        if self._circuit == CircuitState.HALF_OPEN:
+            self._logger.info("The process is stable again; resuming the automatic restarts.")
+            self._circuit = CircuitState.CLOSED
+            self._notify()
+        return False
+
+
+    def report_liveness(self, alive: bool) -> None:
+        """
+        Gives the result of a liveness check of the running process.
+        """
+
+        if not self._running or not self.enabled:
+            return
+
+        self._failed_checks = 0 if alive else self._failed_checks + 1
+        if self._failed_checks < self.liveness_failures:
+            return
+
+        self._logger.error("The process hasn't responded to %s liveness checks.", self._failed_checks)
+        self._cancel_sources()
+        self._handle_failure(None, "not responding", RestartAction.RESTART)
+        if self._circuit == CircuitState.OPEN:
+            # Left running; there is nothing better to do until the user restarts it
+            self._notify()
+            return
+        self._restarts += 1
+        self._notify()
+        self.on_hung()
+
+
+    def _cancel_sources(self) -> None:
+        self._running = False
+        if self._stable_source_id is not None:
+            GLib.source_remove(self._stable_source_id)
+            self._stable_source_id = None
+
+
+    def _notify(self) -> None:
+        self.on_change(self.status)
+
+
+    def stop(self) -> None:
+        self._logger.debug("Stopping restart watchdog...")
+        self._cancel_sources()
+        if self._restart_source_id is not None:
+            GLib.source_remove(self._restart_source_id)
+            self._restart_source_id = None
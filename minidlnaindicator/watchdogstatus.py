@@ -0,0 +1,32 @@
+import collections
+import enum
+
+
+class RestartAction(enum.Enum):
+    RESTART = "restart"
+    STOP = "stop"
+
+
+class CircuitState(enum.Enum):
+    # Failures are restarted
+    CLOSED = "closed"
+    # Too many failures; restarts paused until the cool-down passes or the user starts it
+    OPEN = "open"
+    # Trying a single restart after the cool-down
+    HALF_OPEN = "half_open"
+
+
+FailureRecord = collections.namedtuple("FailureRecord", ["timestamp", "exit_code", "reason", "action"])
+FailureRecord.__doc__ = """
+A failure of the process: when it happened (seconds since the epoch), its exit code (None if it was restarted because
+it didn't respond), a description and what the watchdog did.
+"""
+
+WatchdogStatus = collections.namedtuple("WatchdogStatus", ["circuit", "restarts", "failures", "restart_pending"])
+WatchdogStatus.__doc__ = """
+State of the watchdog: the circuit breaker, the automatic restarts done, the last failures (oldest first) and if a
+restart is waiting for its backoff.
+"""
+
+# A clean exit (like minidlnad on SIGTERM) was requested by someone else
+DEFAULT_RESTART_RULES = {0: RestartAction.STOP}
@@ -55,6 +55,9 @@ setup(
         'gui_scripts': [
             'minidlnaindicator = minidlnaindicator.runner:indicator'
         ],
+        'console_scripts': [
+            'minidlnaindicator-headless = minidlnaindicator.runner:headless'
+        ],
     },
     data_files = [
         ("share/icons", ["minidlnaindicator.png"]),